@@ -0,0 +1,76 @@
+"""
+Measure memory allocated per step and the size of the command and event objects.
+
+Every agent issues a few trade commands per step, which creates commands, receipts
+and membership checks against the known items.
+
+Run from the repository root with `python -m benchmarks.bench_allocations`.
+"""
+
+import sys
+import time
+import timeit
+import tracemalloc
+
+import smithg
+from smithg.engine import engine
+
+ITEMS = 1000
+AGENTS = 100
+STEPS = 50
+
+
+def trader(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    commands: smithg.CommandList = []
+    for sell in sorted(env.sell_offers)[:3]:
+        commands.append(smithg.commands.BuyItem(sell.item, 1, sell.price))
+    for buy in sorted(env.buy_offers)[:3]:
+        if env.inventory[buy.item] > 0:
+            commands.append(smithg.commands.SellItem(buy.item, 1, buy.price))
+    commands.append(smithg.commands.Work(1))
+    return commands
+
+
+def deep_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main() -> None:
+    items = [f"item_{i}" for i in range(ITEMS)]
+    world = engine.make_world(items, agent_registry=smithg.agents.Registry(), seed=0)
+    world.command_fuel_increase = 1000
+    for i in range(AGENTS):
+        world.add_agent(trader, f"trader_{i}")
+
+    world.step(0)
+    tracemalloc.start()
+    peaks = []
+    start = time.perf_counter()
+    for s in range(1, STEPS + 1):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        world.step(s)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    print(f"{ITEMS} items, {AGENTS} agents, {STEPS} steps")
+    print(f"step time (traced)      {elapsed / STEPS * 1e3:10.2f} ms")
+    print(f"peak allocated per step {sum(peaks) / len(peaks) / 1024:10.1f} KiB")
+    for obj in (
+        smithg.commands.BuyItem("a", 1, 1),
+        smithg.commands.Work(1),
+        smithg.events.BuyReceipt("a", 1, 1),
+    ):
+        print(f"{type(obj).__name__ + ' instance':23} {deep_size(obj):7d} B")
+
+    known = world.known_items
+    lookup = timeit.timeit(lambda: items[-1] in known, number=10000) / 10000
+    print(f"known item check        {lookup * 1e6:10.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare World and CompactWorld for large agent populations.
+
+Measures the time per step with idle agents, the time spent replenishing fuel and
+balances, and the memory held by the agent states.
+
+Run from the repository root with `python -m benchmarks.bench_compact`.
+"""
+
+import timeit
+import tracemalloc
+
+import smithg
+from smithg.engine import engine
+from smithg.engine.compact import CompactWorld
+
+ITEMS = 100
+AGENT_COUNTS = (1000, 10000)
+# Fraction of the known items every agent holds
+FILL = 0.5
+
+
+def idle_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    return []
+
+
+def make_world(world_cls: type[engine.World], agents: int) -> engine.World:
+    world = world_cls(known_items=[f"item_{i}" for i in range(ITEMS)])
+    for i in range(agents):
+        world.add_agent(idle_agent, f"agent_{i}")
+        items = world.player_agent_containers[-1].state.items
+        for j in range(int(ITEMS * FILL)):
+            items[f"item_{j}"] = j + 1000
+    return world
+
+
+def main() -> None:
+    print(f"{ITEMS} items, {FILL:.0%} of them held by every agent")
+    print(
+        f"{'agents':>8} {'world':>8} {'step ms':>10} {'replenish ms':>13}"
+        f" {'state MiB':>10}"
+    )
+    for agents in AGENT_COUNTS:
+        for world_cls in (engine.World, CompactWorld):
+            tracemalloc.start()
+            world = make_world(world_cls, agents)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            step = min(timeit.repeat(lambda: world.step(0), number=3, repeat=3)) / 3
+            replenish = min(
+                timeit.repeat(world.replenish_agents, number=10, repeat=3)
+            ) / 10
+            print(
+                f"{agents:8d} {world_cls.__name__:>8.8} {step * 1e3:10.2f}"
+                f" {replenish * 1e3:13.3f} {memory / 2**20:10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure how the cost of a world step scales with the number of agents.
+
+The agents in this benchmark do nothing, so the measured time is the engine overhead
+of calling agents, which is dominated by building their Environment. The `rebuild`
+column shows the cost of building every Environment from scratch like the engine did
+before the market view was shared between agents.
+
+Run from the repository root with `python -m benchmarks.bench_environment`.
+"""
+
+import collections
+import timeit
+
+import smithg
+from smithg.engine import engine
+
+ITEMS = 1000
+AGENT_COUNTS = (1, 10, 100, 1000)
+
+
+def idle_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    return []
+
+
+def make_world(agents: int) -> engine.World:
+    world = engine.make_world(
+        (f"item_{i}" for i in range(ITEMS)),
+        agent_registry=smithg.agents.Registry(),
+    )
+    for i in range(agents):
+        world.add_agent(idle_agent, f"agent_{i}")
+        world.player_agent_containers[-1].state.items.update(
+            {f"item_{j}": 1 for j in range(0, ITEMS, 10)}
+        )
+    world.market.tick()
+    return world
+
+
+def rebuild_environments(world: engine.World) -> None:
+    for cont in world.player_agent_containers:
+        smithg.Environment(
+            known_items=frozenset(world.known_items),
+            buy_offers=world.market.trades.buy_offer_set(),
+            sell_offers=world.market.trades.sell_offer_set(),
+            balance=cont.state.balance,
+            command_fuel=cont.state.command_fuel,
+            inventory=collections.defaultdict(int, cont.state.items),  # type: ignore
+        )
+
+
+def shared_environments(world: engine.World) -> None:
+    market_view = world.market_view()
+    for cont in world.player_agent_containers:
+        engine.execute_agent(cont, world, market_view)
+
+
+def _best_of(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main() -> None:
+    print(f"{ITEMS} items, time per step in ms")
+    print(f"{'agents':>8} {'rebuild':>10} {'shared':>10} {'per agent':>10}")
+    for agents in AGENT_COUNTS:
+        world = make_world(agents)
+        number = max(1, 1000 // agents)
+        rebuild = _best_of(lambda: rebuild_environments(world), number)
+        shared = _best_of(lambda: shared_environments(world), number)
+        print(
+            f"{agents:8d} {rebuild * 1e3:10.3f} {shared * 1e3:10.3f}"
+            f" {shared / agents * 1e6:8.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
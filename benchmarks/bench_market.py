@@ -0,0 +1,43 @@
+"""
+Compare the tick cost of RandomMarket and VectorizedRandomMarket.
+
+A tick is measured together with building the offer sets, because that is what the
+engine does once per step to build the shared market view.
+
+Run from the repository root with `python -m benchmarks.bench_market`.
+"""
+
+import random
+import timeit
+
+from smithg.engine.market import RandomMarket
+from smithg.engine.numpy_market import VectorizedRandomMarket
+
+ITEM_COUNTS = (100, 1000, 10000)
+TICKS = 200
+
+
+def run(market) -> None:
+    for _ in range(TICKS):
+        market.tick()
+        market.trades.buy_offer_set()
+        market.trades.sell_offer_set()
+
+
+def main() -> None:
+    print(f"time per tick in ms, best of 3 x {TICKS} ticks")
+    print(f"{'items':>8} {'random':>10} {'numpy':>10} {'speedup':>8}")
+    for n in ITEM_COUNTS:
+        items = [f"item_{i}" for i in range(n)]
+        python = RandomMarket(rand=random.Random(0), known_items=items)
+        vectorized = VectorizedRandomMarket(known_items=items, seed=0)
+        python_time = min(timeit.repeat(lambda: run(python), number=1, repeat=3))
+        numpy_time = min(timeit.repeat(lambda: run(vectorized), number=1, repeat=3))
+        print(
+            f"{n:8d} {python_time / TICKS * 1e3:10.3f}"
+            f" {numpy_time / TICKS * 1e3:10.3f} {python_time / numpy_time:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
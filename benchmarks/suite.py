@@ -0,0 +1,282 @@
+"""
+Benchmark suite for the hot paths of the engine, with a history of results.
+
+Every benchmark measures the time of one operation and sweeps one scaling axis:
+
+* world_step: World.step for 1 to 10k agents and 5 to 5k items
+* execute_agent: calling one agent and executing 1 to 1000 commands
+* execute_command: one BuyItem, SellItem or Work command
+* market_tick: RandomMarket.tick for 5 to 5k items
+* safe_queue_command: Agent.safe_queue_command with 1 to 1000 queued commands
+
+`run` appends the results to a JSON lines history file, `compare` compares the last
+two entries of that file and exits with status 1 if any benchmark got slower by more
+than the threshold. Both work offline, which makes them usable as a release check:
+
+    python -m benchmarks.suite run
+    python -m benchmarks.suite compare --threshold 0.15
+
+`run --check` does both in one go. Use `--quick` to skip the largest sweeps and `-k`
+to select benchmarks by name.
+
+Run from the repository root with `python -m benchmarks.suite`.
+"""
+
+from typing import Callable, Iterator, Optional
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+
+import smithg
+from smithg.datatypes import BuyOffer, SellOffer
+from smithg.engine import engine
+from smithg.engine.market import Market, RandomMarket
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "history.jsonl")
+
+AGENT_COUNTS = (1, 10, 100, 1000, 10000)
+ITEM_COUNTS = (5, 50, 500, 5000)
+COMMAND_COUNTS = (1, 10, 100, 1000)
+# Defaults for the axes which are not swept
+AGENTS = 10
+ITEMS = 50
+COMMANDS = 10
+# Largest sweep values run with --quick
+QUICK_LIMIT = 1000
+
+# A benchmark is a name and a factory, which sets everything up and returns the
+# operation to time
+Benchmark = tuple[str, Callable[[], Callable[[], None]]]
+
+
+def _items(n: int) -> list[str]:
+    return [f"item_{i}" for i in range(n)]
+
+
+def _work_agent(commands: int) -> smithg.agents.AgentFunc:
+    def agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+        return [smithg.commands.Work(amount=1) for _ in range(commands)]
+
+    return agent
+
+
+def _world(agents: int, items: int, commands: int) -> engine.World:
+    world = engine.World(
+        known_items=_items(items),
+        market=RandomMarket(rand=random.Random(0), known_items=_items(items)),
+        # Agents must never run out of fuel, however long the benchmark runs
+        command_fuel_init=1 << 62,
+    )
+    for i in range(agents):
+        world.add_agent(_work_agent(commands), f"agent_{i}")
+    return world
+
+
+def world_step(agents: int, items: int) -> Callable[[], None]:
+    world = _world(agents, items, COMMANDS)
+    return lambda: world.step(0)
+
+
+def execute_agent(commands: int) -> Callable[[], None]:
+    world = _world(1, ITEMS, commands)
+    cont = world.player_agent_containers[0]
+    market_view = world.market_view()
+    return lambda: engine.execute_agent(cont, world, market_view)
+
+
+def execute_command(cmd: smithg.commands.Command) -> Callable[[], None]:
+    # Offers never run out, so every execution trades the same amount
+    market = Market()
+    market.trades.buys["item_0"] = BuyOffer("item_0", 1 << 62, 2)
+    market.trades.sells["item_0"] = SellOffer("item_0", 1 << 62, 1)
+    world = engine.World(
+        known_items=_items(ITEMS), market=market, command_fuel_init=1 << 62
+    )
+    world.add_agent(_work_agent(0), "agent")
+    cont = world.player_agent_containers[0]
+    cont.state.balance = cont.state.items["item_0"] = 1 << 62
+    return lambda: engine.execute_command(cont, world, cmd)
+
+
+def market_tick(items: int) -> Callable[[], None]:
+    market = RandomMarket(rand=random.Random(0), known_items=_items(items))
+    return market.tick
+
+
+class _QueueingAgent(smithg.agents.Agent):
+    def __init__(self, commands: int):
+        super().__init__()
+        self.commands = commands
+
+    def process(self, env: smithg.Environment) -> None:
+        for _ in range(self.commands):
+            self.safe_queue_command(env, smithg.commands.Work(amount=1))
+
+
+def safe_queue_command(commands: int) -> Callable[[], None]:
+    agent = _QueueingAgent(commands)
+    world = _world(1, ITEMS, 0)
+    env = engine.build_environment(world.player_agent_containers[0], world)
+    return lambda: agent.run(env, [])
+
+
+def benchmarks(quick: bool = False) -> Iterator[Benchmark]:
+    def sweep(counts: tuple[int, ...]) -> tuple[int, ...]:
+        return tuple(n for n in counts if not quick or n <= QUICK_LIMIT)
+
+    for n in sweep(AGENT_COUNTS):
+        yield f"world_step[agents={n},items={ITEMS}]", lambda n=n: world_step(n, ITEMS)
+    for n in sweep(ITEM_COUNTS):
+        yield f"world_step[agents={AGENTS},items={n}]", lambda n=n: world_step(
+            AGENTS, n
+        )
+    for n in sweep(COMMAND_COUNTS):
+        yield f"execute_agent[commands={n}]", lambda n=n: execute_agent(n)
+    for cmd in (
+        smithg.commands.BuyItem("item_0", max_amount=1, max_price=1),
+        smithg.commands.SellItem("item_0", max_amount=1, min_price=2),
+        smithg.commands.Work(amount=1),
+    ):
+        yield f"execute_command[{type(cmd).__name__}]", lambda cmd=cmd: execute_command(
+            cmd
+        )
+    for n in sweep(ITEM_COUNTS):
+        yield f"market_tick[items={n}]", lambda n=n: market_tick(n)
+    for n in sweep(COMMAND_COUNTS):
+        yield f"safe_queue_command[commands={n}]", lambda n=n: safe_queue_command(n)
+
+
+def measure(operation: Callable[[], None], repeat: int = 3) -> float:
+    """Return the best time of one call to operation in seconds."""
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(quick: bool = False, pattern: Optional[str] = None) -> dict[str, float]:
+    results = {}
+    for name, setup in benchmarks(quick):
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(setup())
+        print(f"{name:48} {results[name] * 1e6:14.2f} us", flush=True)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(results: dict[str, float], history: str, label: Optional[str]) -> dict:
+    entry = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "label": label,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(history, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def load_history(history: str) -> list[dict]:
+    with open(history) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(
+    base: dict[str, float], new: dict[str, float], threshold: float
+) -> list[str]:
+    """Print a comparison of two results and return the names of regressions."""
+    regressions = []
+    print(f"{'benchmark':48} {'base us':>12} {'new us':>12} {'change':>8}")
+    for name in sorted(base.keys() & new.keys()):
+        change = new[name] / base[name] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:48} {base[name] * 1e6:12.2f} {new[name] * 1e6:12.2f}"
+            f" {change:+8.1%}{flag}"
+        )
+    return regressions
+
+
+def _compare_history(history: str, threshold: float, base: Optional[str]) -> int:
+    entries = load_history(history)
+    if len(entries) < 2:
+        print(f"Need at least two entries in {history} to compare", file=sys.stderr)
+        return 2
+
+    new = entries[-1]
+    if base is None:
+        old = entries[-2]
+    else:
+        matches = [e for e in entries[:-1] if base in (e["label"], e["commit"])]
+        if not matches:
+            print(f"No entry with label or commit {base} in {history}", file=sys.stderr)
+            return 2
+        old = matches[-1]
+
+    regressions = compare(old["results"], new["results"], threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed by more than {threshold:.0%}")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run benchmarks and record them")
+    run_parser.add_argument("--quick", action="store_true", help="Skip large sweeps")
+    run_parser.add_argument("-k", dest="pattern", help="Only run matching benchmarks")
+    run_parser.add_argument("--label", help="Label of the history entry")
+    run_parser.add_argument(
+        "--check", action="store_true", help="Compare with the previous entry"
+    )
+
+    compare_parser = subparsers.add_parser("compare", help="Compare history entries")
+    compare_parser.add_argument(
+        "--base", help="Label or commit to compare with (default: previous entry)"
+    )
+
+    for p in (run_parser, compare_parser):
+        p.add_argument("--history", default=DEFAULT_HISTORY, help="History file")
+        p.add_argument(
+            "--threshold",
+            type=float,
+            default=0.15,
+            help="Relative slowdown reported as regression (default: 0.15)",
+        )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        record(run(args.quick, args.pattern), args.history, args.label)
+        if args.check:
+            sys.exit(_compare_history(args.history, args.threshold, None))
+    else:
+        sys.exit(_compare_history(args.history, args.threshold, args.base))
+
+
+if __name__ == "__main__":
+    main()
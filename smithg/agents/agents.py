@@ -4,17 +4,149 @@ Agents are actors within the world which consume events and produce commands.
 Agents are scored according to their
 """
 
-from typing import Callable
+from typing import Awaitable, Callable, ClassVar, Iterator, Mapping, Optional, Union
 import random
 from dataclasses import dataclass, field
 import collections
+import collections.abc
 import logging
 
-from smithg.datatypes import Item, Amount, BuyOffer, SellOffer, commands, events
+from smithg.datatypes import (
+    Item,
+    Amount,
+    CommandCost,
+    Price,
+    BuyOffer,
+    SellOffer,
+    Recipe,
+    commands,
+    events,
+)
 
 _logger = logging.getLogger(__name__)
 
 
+class InventoryView(collections.abc.MutableMapping):
+    """
+    Copy-on-write view of an agent inventory.
+
+    Reads go straight to the inventory owned by the engine, and items which are not
+    posessed read as amount 0, like in a defaultdict. The first write copies the
+    inventory, so changes made by an agent never leak back into the engine state.
+    """
+
+    __slots__ = ("_items", "_owned")
+
+    def __init__(self, items: Mapping[Item, Amount]):
+        self._items = items
+        self._owned = False
+
+    @property
+    def owned(self) -> bool:
+        """True if this view holds its own copy of the inventory."""
+        return self._owned
+
+    def detach(self) -> None:
+        """Take a private copy of the inventory, if not done already."""
+        if not self._owned:
+            self._items = dict(self._items)
+            self._owned = True
+
+    def __getitem__(self, item: Item) -> Amount:
+        return self._items.get(item, 0)
+
+    def __setitem__(self, item: Item, amount: Amount) -> None:
+        self.detach()
+        self._items[item] = amount  # type: ignore
+
+    def __delitem__(self, item: Item) -> None:
+        self.detach()
+        del self._items[item]  # type: ignore
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def get(self, item: Item, default: Optional[Amount] = None) -> Optional[Amount]:  # type: ignore
+        return self._items.get(item, default)
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self._items)!r})"
+
+
+class Inventory(collections.defaultdict):
+    """
+    Engine side inventory of an agent.
+
+    This is a defaultdict(int) which hands out copy-on-write views of itself. Views are
+    shared until either the agent or the engine writes. A write on the engine side
+    detaches the outstanding view before changing anything, so agents keep seeing the
+    inventory as it was when they were called.
+    """
+
+    __slots__ = ("_view",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(int, *args, **kwargs)
+        self._view: Optional[InventoryView] = None
+
+    def view(self) -> InventoryView:
+        view = self._view
+        if view is None or view.owned:
+            view = self._view = InventoryView(self)
+        return view
+
+    def _release_view(self) -> None:
+        if self._view is not None:
+            self._view.detach()
+            self._view = None
+
+    def __setitem__(self, item: Item, amount: Amount) -> None:
+        if self._view is not None:
+            self._release_view()
+        super().__setitem__(item, amount)
+
+    def __delitem__(self, item: Item) -> None:
+        if self._view is not None:
+            self._release_view()
+        super().__delitem__(item)
+
+    def pop(self, *args):
+        self._release_view()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._release_view()
+        return super().popitem()
+
+    def setdefault(self, *args):
+        self._release_view()
+        return super().setdefault(*args)
+
+    def update(self, *args, **kwargs) -> None:
+        self._release_view()
+        super().update(*args, **kwargs)
+
+    def __ior__(self, other):  # type: ignore
+        self._release_view()
+        return super().__ior__(other)
+
+    def clear(self) -> None:
+        self._release_view()
+        super().clear()
+
+    def copy(self) -> "Inventory":
+        return self.__class__(self)
+
+    def __reduce__(self):
+        return (self.__class__, (), None, None, iter(self.items()))
+
+
 @dataclass(slots=True, frozen=True)  # type: ignore
 class Environment:
     """
@@ -33,7 +165,16 @@ class Environment:
     balance: Currently available funds. Can be used in BuyCommands.
     command_fuel: Currently avilable command fuel to execute commands.
     inventory: Dict of the agents inventory. It contains previously bought items.
-      Note this is a defaultdict, so any item which is not posessed returns amount 0.
+      Any item which is not posessed returns amount 0. This is a copy-on-write view on
+      the agents inventory; writing to it does not change the actual inventory.
+    recipes: All recipes that can be forged with the Forge command, by name.
+    production_costs: The cheapest cost to produce one unit of the items which can be
+      forged. See smithg.engine.recipes.RecipeBook for how it is computed.
+    trade_cost: Command fuel of every BuyItem and SellItem command in this world. Use
+      command_cost for the cost of any command.
+
+    Everything but the agent state is built once per step and shared by all agents.
+    Do not try to modify it.
     """
 
     known_items: frozenset[Item]
@@ -41,10 +182,20 @@ class Environment:
     sell_offers: frozenset[SellOffer]
     balance: Amount
     command_fuel: Amount
-    inventory: collections.defaultdict[Item, Amount]
+    inventory: InventoryView
+    recipes: Mapping[str, Recipe] = field(default_factory=dict)
+    production_costs: Mapping[Item, Price] = field(default_factory=dict)
+    trade_cost: CommandCost = commands.TRADE_COST
 
+    def command_cost(self, command: commands.Command) -> CommandCost:
+        """Command fuel which executing command costs in this world."""
+        return commands.fuel_cost(command, self.trade_cost)
 
-AgentFunc = Callable[[Environment, list[events.Event]], list[commands.Command]]
+
+AgentFunc = Callable[
+    [Environment, list[events.Event]],
+    Union[list[commands.Command], Awaitable[list[commands.Command]]],
+]
 
 
 @dataclass
@@ -114,7 +265,8 @@ class Agent:
 
         Returns true if enqueueing is successful, false otherwise.
         """
-        if env.command_fuel < command.cost + sum(c.cost for c in self.queued_commands):
+        queued = sum(env.command_cost(c) for c in self.queued_commands)
+        if env.command_fuel < env.command_cost(command) + queued:
             _logger.debug("Ran out of fuel, cannot queue command %s", command)
             return False
 
@@ -144,14 +296,95 @@ class Agent:
         """
         pass
 
+    def seed(self, seed: int) -> None:
+        """
+        Seed all randomness of the agent.
+
+        Seeded worlds call this before the simulation starts, with a seed derived from
+        the world seed and the agent name. Agents which use random numbers should
+        reseed their generators here, so that seeded simulations are reproducible. Any
+        callable agent can implement this method.
+        """
+        pass
+
     def __call__(
         self, env: Environment, events: list[events.Event]
     ) -> list[commands.Command]:
         return self.run(env, events)
 
 
+class DeltaView:
+    """
+    Local copy of the market and inventory of an agent, kept up to date from deltas.
+
+    Agents with a true `delta_environment` attribute get a MarketSnapshot event on
+    their first call and after every resync, and OffersChanged and InventoryChanged
+    events with what changed since the previous call otherwise. Feeding all events to
+    apply keeps this view in sync with the world in O(changes) per step.
+    """
+
+    __slots__ = ("known_items", "buy_offers", "sell_offers", "inventory")
+
+    def __init__(self) -> None:
+        self.known_items: frozenset[Item] = frozenset()
+        self.buy_offers: set[BuyOffer] = set()
+        self.sell_offers: set[SellOffer] = set()
+        self.inventory: dict[Item, Amount] = {}
+
+    def apply(self, received: list[events.Event]) -> list[events.Event]:
+        """Apply the delta events and return all other events."""
+        rest = []
+        for evt in received:
+            if isinstance(evt, events.OffersChanged):
+                self.buy_offers.difference_update(evt.withdrawn_buy_offers)
+                self.buy_offers.update(evt.added_buy_offers)
+                self.sell_offers.difference_update(evt.withdrawn_sell_offers)
+                self.sell_offers.update(evt.added_sell_offers)
+            elif isinstance(evt, events.InventoryChanged):
+                for item, amount in evt.amounts.items():
+                    if amount:
+                        self.inventory[item] = amount
+                    else:
+                        self.inventory.pop(item, None)
+            elif isinstance(evt, events.MarketSnapshot):
+                self.known_items = evt.known_items
+                self.buy_offers = set(evt.buy_offers)
+                self.sell_offers = set(evt.sell_offers)
+                self.inventory = dict(evt.inventory)
+            else:
+                rest.append(evt)
+        return rest
+
+
+@dataclass
+class DeltaAgent(Agent):
+    """
+    An agent class with a delta environment.
+
+    Before events are processed, the delta events are applied to self.view, which
+    then holds the offers and the inventory as of this call. Delta events are not
+    passed on to process_event.
+    """
+
+    delta_environment: ClassVar[bool] = True
+    view: DeltaView = field(default_factory=DeltaView)
+
+    def run(
+        self, env: Environment, events: list[events.Event]
+    ) -> list[commands.Command]:
+        return super().run(env, self.view.apply(events))
+
+
 @dataclass
 class Registry:
+    """
+    Collects agents to be added to worlds.
+
+    Agents can be plain functions, callable objects, or coroutine functions like
+    `async def agent(env, events)`. Coroutine agents of a step run concurrently on an
+    event loop, see World.step.
+    """
+
     agents: list[tuple[AgentFunc, str]] = field(default_factory=list)
 
     def register_agent(self, func: AgentFunc, name: str = None) -> None:
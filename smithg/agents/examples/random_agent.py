@@ -22,6 +22,9 @@ _logger.debug("Loading %s", __name__)
 class RandomAgent(Agent):
     rand: random.Random = field(default_factory=random.Random)
 
+    def seed(self, seed: int) -> None:
+        self.rand.seed(seed)
+
     def process(self, env: Environment) -> None:
         """
         Implement a random agent.
@@ -33,7 +36,8 @@ class RandomAgent(Agent):
 
         possible_commands: list[commands.Command] = []
 
-        for buy in env.buy_offers:
+        # Offers are sets, sorting them keeps seeded runs reproducible
+        for buy in sorted(env.buy_offers):
             if env.inventory[buy.item] > 0:
                 possible_commands.append(
                     commands.SellItem(
@@ -43,7 +47,7 @@ class RandomAgent(Agent):
                     )
                 )
 
-        for sell in env.sell_offers:
+        for sell in sorted(env.sell_offers):
             max_amount = env.balance // sell.price
             if max_amount > 0:
                 possible_commands.append(
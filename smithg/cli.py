@@ -1,12 +1,26 @@
 import argparse
+import contextlib
+import copy
 import importlib
+import io
+import os
 import pathlib
+import random
 import sys
-from typing import NamedTuple
+from typing import Iterator, NamedTuple, Optional, Sequence, Union
 import logging
 
 import smithg
+import smithg.daemon
 import smithg.engine
+import smithg.engine.cache
+import smithg.engine.metrics
+import smithg.engine.profiler
+import smithg.engine.replay
+import smithg.engine.sharding
+import smithg.engine.stopping
+import smithg.engine.sweep
+import smithg.engine.tournament
 import smithg.agents
 
 
@@ -25,24 +39,50 @@ class Result(NamedTuple):
     name: str
     score: int
 
+    def text(self) -> str:
+        return f"Agent {self.name:20} $ {self.score:8d}"
 
-def output_text(results: list[Result]):
+
+class TournamentResult(NamedTuple):
+    name: str
+    score: float
+    stddev: float
+    win_rate: float
+    runs: int
+    # Half width of the confidence interval of score
+    ci: float = 0.0
+    # Runs of all agents, which win_rate is based on
+    win_runs: int = 0
+
+    def text(self) -> str:
+        return (
+            f"Agent {self.name:20} $ {self.score:10.1f} ± {self.ci:8.1f}"
+            f"  sd {self.stddev:8.1f}  runs {self.runs:5d}"
+            f"  wins {self.win_rate:6.1%} of {self.win_runs}"
+        )
+
+
+Results = Union[list[Result], list[TournamentResult]]
+
+
+def output_text(results: Results):
     print("Simulation finished. Here are the results")
-    for name, score in results:
-        print(f"Agent {name:20} $ {score:8d}")
+    for result in results:
+        print(result.text())
 
 
-def output_json(results: list[Result]):
+def output_json(results: Results):
     import json
 
     print(json.dumps(results))
 
 
-def output_csv(results: list[Result]):
+def output_csv(results: Results):
     import csv
 
+    fields = results[0]._fields if results else Result._fields
     writer = csv.writer(sys.stdout)
-    writer.writerow(["agent_name", "score"])
+    writer.writerow(["agent_name", *fields[1:]])
     writer.writerows(results)
 
 
@@ -54,7 +94,10 @@ _FORMATTERS = {
 
 
 def parse_args(argv=None) -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Run smith-game simulations.")
+    parser = argparse.ArgumentParser(
+        description="Run smith-game simulations.",
+        epilog="Run `smithg sweep --help` to sweep world settings.",
+    )
     debug_level = parser.add_mutually_exclusive_group(required=False)
     debug_level.add_argument("--log-level", default=logging.WARNING)
     debug_level.add_argument("-v", "--verbose", action="count", default=0)
@@ -71,34 +114,412 @@ def parse_args(argv=None) -> argparse.Namespace:
     builtin_agents.add_argument("--no-builtin-agents", dest="builtin_agents", action="store_false", help="Do not load builtin agents")
     builtin_agents.add_argument("--builtin-agents", dest="builtin_agents", action="store_true", help="Load builtin agents")
     builtin_agents.set_defaults(builtin_agents=True)
-    parser.add_argument("-d", "--agents-dir", help="Read agents files from the given directory", default="player_agents")
+    parser.add_argument("-d", "--agents-dir", help="Read agents files from the given directory", default=None)
+
+    parser.add_argument("--runs", type=int, default=1, help="Number of simulation runs. Agents are ranked by their mean score over all runs")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes for multiple runs (default: number of CPUs)")
+    parser.add_argument("--adaptive", action="store_true", help="Only run more games for agents whose ranking is not yet significant, up to --runs per agent")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals of tournament scores (default: 0.95)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible simulations")
+    parser.add_argument("--time-budget", type=float, default=None, help="Run every agent in its own worker process, with this many seconds per step")
+    parser.add_argument("--cache", metavar="DIR", default=None, help="Reuse results of unchanged agents from a result cache in DIR")
+    parser.add_argument("--cache-size", metavar="MB", type=int, default=256, help="Maximal size of the result cache (default: 256)")
+    parser.add_argument("--record", metavar="FILE", default=None, help="Write a replay log of the simulation to FILE")
+    parser.add_argument("--replay", metavar="FILE", default=None, help="Show the results of a replay log instead of running a simulation")
+    parser.add_argument("--checkpoint", metavar="FILE", default="smithg.checkpoint", help="Checkpoint file for --checkpoint-every and --resume (default: smithg.checkpoint)")
+    parser.add_argument("--checkpoint-every", metavar="N", type=int, default=0, help="Checkpoint the simulation every N steps")
+    parser.add_argument("--resume", action="store_true", help="Resume the simulation from the checkpoint file")
+    parser.add_argument("--metrics", metavar="FILE", default=None, help="Stream the state of every agent after every step to FILE, - for stdout")
+    parser.add_argument("--metrics-format", choices=smithg.engine.metrics.FORMATS, default="ndjson", help="Format of --metrics (default: ndjson)")
+    parser.add_argument("--stop-rank-stable", metavar="STEPS", type=int, default=None, help="Stop a run once the ranking of the agents did not change for STEPS steps")
+    parser.add_argument("--stop-converged", metavar="STEPS", type=int, default=None, help="Stop a run once no balance changed by more than --stop-tolerance for STEPS steps")
+    parser.add_argument("--stop-tolerance", type=float, default=0.001, help="Relative balance change considered converged (default: 0.001)")
+    parser.add_argument("--max-wall-time", metavar="SECONDS", type=float, default=None, help="Stop every run after SECONDS seconds")
+    parser.add_argument("--scenario", metavar="FILE", default=None, help="Offer the prices of a binary or CSV scenario file instead of random offers")
+    parser.add_argument("--shards", metavar="N", type=int, default=None, help="Split the agents over N regions with their own markets, simulated in parallel processes")
+    parser.add_argument("--sync-every", metavar="STEPS", type=int, default=100, help="Steps between the price exchanges of --shards regions (default: 100)")
+    parser.add_argument("--transport-cost", type=int, default=10, help="Cost per item exported to another region (default: 10)")
+    parser.add_argument("--profile", nargs="?", const="text", choices=("text", "json"), default=None, help="Print a timing profile of the simulation to stderr")
+    parser.add_argument("--serve", metavar="SOCKET", default=None, help="Keep the agents loaded and run the simulations submitted to the Unix socket SOCKET, reloading changed agent files")
+    parser.add_argument("--connect", metavar="SOCKET", default=None, help="Run the simulation on the server listening on SOCKET")
 
     args = parser.parse_args(args=argv)
+    if args.record and args.runs > 1:
+        parser.error("--record can only be used with a single run")
+    if args.metrics and (args.runs > 1 or args.cache):
+        parser.error("--metrics can only be used with a single uncached run")
+    if (args.checkpoint_every or args.resume) and args.runs > 1:
+        parser.error("Checkpoints can only be used with a single run")
+    if args.cache and (args.record or args.checkpoint_every or args.resume):
+        parser.error("--cache cannot be combined with recording or checkpoints")
+    if args.shards is not None:
+        if args.shards < 1 or args.sync_every < 1:
+            parser.error("--shards and --sync-every must be at least 1")
+        if args.runs > 1 or args.cache or args.scenario:
+            parser.error("--shards cannot be combined with --runs, --cache, --scenario")
+        if args.record or args.metrics or args.checkpoint_every or args.resume:
+            parser.error("--shards cannot be combined with recording or checkpoints")
+        if stop_conditions(args):
+            parser.error("--shards cannot be combined with stop conditions")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    if args.adaptive:
+        if args.runs < 2:
+            parser.error("--adaptive needs --runs, the maximal runs per agent")
+        if stop_conditions(args):
+            parser.error("--adaptive cannot be combined with stop conditions")
+    if args.serve and args.connect:
+        parser.error("--serve and --connect cannot be combined")
+    if args.connect and (args.agents_dir is not None or not args.builtin_agents):
+        parser.error("--connect uses the agents of the server, pass these to --serve")
+    if args.agents_dir is None:
+        args.agents_dir = "player_agents"
     args.log_level -= 10 * args.verbose  # Every 10 reduces log-level by one
 
     return args
 
 
-def main(argv=None):
-    args = parse_args(argv)
+def parse_sweep_value(value: str) -> Sequence[int]:
+    """Parse the values of a --param: 1,2,5 or an inclusive range LOW:HIGH[:STEP]."""
+    if ":" in value:
+        low, high, *step = (int(v) for v in value.split(":"))
+        if len(step) > 1:
+            raise ValueError(f"Ranges are LOW:HIGH or LOW:HIGH:STEP, found {value}")
+        return range(low, high + 1, *step)
+    return [int(v) for v in value.split(",")]
+
+
+def parse_sweep_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="smithg sweep",
+        description="Sweep world settings and rank them by an objective.",
+    )
+    parser.add_argument("--log-level", default=logging.WARNING)
+    parser.add_argument("-f", "--format", help="Output format", choices=("text", "json", "csv"), default="text")
+    parser.add_argument("-o", "--output", metavar="FILE", default=None, help="Write the result table to FILE instead of stdout")
+    builtin_agents = parser.add_mutually_exclusive_group(required=False)
+    builtin_agents.add_argument("--no-builtin-agents", dest="builtin_agents", action="store_false", help="Do not load builtin agents")
+    builtin_agents.add_argument("--builtin-agents", dest="builtin_agents", action="store_true", help="Load builtin agents")
+    builtin_agents.set_defaults(builtin_agents=True)
+    parser.add_argument("-d", "--agents-dir", help="Read agents files from the given directory", default="player_agents")
+
+    parser.add_argument("-p", "--param", metavar="NAME=VALUES", action="append", required=True, help=f"Values of a setting to sweep, as 1,2,5 or LOW:HIGH[:STEP]. Settings: {', '.join(smithg.engine.sweep.SETTINGS)}")
+    parser.add_argument("--samples", metavar="N", type=int, default=None, help="Sample N configurations instead of sweeping the whole grid")
+    parser.add_argument("--objective", choices=tuple(smithg.engine.sweep.OBJECTIVES), default="spread", help="What makes a configuration good: spread of the agents' mean scores, mean score, or winner's margin (default: spread)")
+    parser.add_argument("--steps", type=int, default=1000, help="Steps of full runs (default: 1000)")
+    parser.add_argument("--runs", type=int, default=3, help="Seeded runs per configuration (default: 3)")
+    parser.add_argument("--eta", type=int, default=3, help="Keep the best 1/ETA configurations after every rung, which then run ETA times longer (default: 3)")
+    parser.add_argument("--min-steps", type=int, default=50, help="Steps of the shortest partial runs (default: 50)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the runs and of sampling")
+
+    args = parser.parse_args(args=argv)
+    args.space = {}
+    for param in args.param:
+        name, _, values = param.partition("=")
+        try:
+            args.space[name] = parse_sweep_value(values)
+        except ValueError:
+            parser.error(f"Invalid --param {param}, expected NAME=1,2 or NAME=LOW:HIGH")
+        if name not in smithg.engine.sweep.SETTINGS:
+            parser.error(f"Cannot sweep {name}")
+        if not args.space[name]:
+            parser.error(f"--param {param} has no values")
+    if args.eta < 2 or args.runs < 1 or args.steps < 1:
+        parser.error("--eta must be at least 2, --runs and --steps at least 1")
+    return args
+
+
+def output_sweep(
+    args: argparse.Namespace, results: list[smithg.engine.sweep.TrialResult]
+) -> None:
+    header, rows = smithg.engine.sweep.table(results)
+    with contextlib.ExitStack() as stack:
+        out = sys.stdout
+        if args.output:
+            out = stack.enter_context(open(args.output, "w", newline=""))
+        if args.format == "json":
+            import json
+
+            json.dump([dict(zip(header, row)) for row in rows], out)
+            out.write("\n")
+        elif args.format == "csv":
+            import csv
+
+            writer = csv.writer(out)
+            writer.writerow(header)
+            writer.writerows(rows)
+        else:
+            widths = [max(12, len(name)) for name in header]
+            print("  ".join(f"{n:>{w}}" for n, w in zip(header, widths)), file=out)
+            for row in rows:
+                cells = [f"{c:.1f}" if isinstance(c, float) else str(c) for c in row]
+                print("  ".join(f"{c:>{w}}" for c, w in zip(cells, widths)), file=out)
+
+
+def sweep_main(argv: list[str]) -> None:
+    args = parse_sweep_args(argv)
     logging.basicConfig(level=args.log_level)
+    load_agents(args)
+
+    sweep = smithg.engine.sweep
+    if args.samples is not None:
+        configs = sweep.sample(args.space, args.samples, args.seed)
+    else:
+        configs = sweep.grid(args.space)
+    results = sweep.run_sweep(
+        configs,
+        smithg.engine.CANONICAL_ITEMS,
+        smithg.agents.global_agent_registry.agents,
+        objective=sweep.OBJECTIVES[args.objective],
+        steps=args.steps,
+        runs=args.runs,
+        jobs=args.jobs if args.jobs is not None else os.cpu_count() or 1,
+        recipes=smithg.engine.CANONICAL_RECIPES,
+        seed=args.seed,
+        eta=args.eta,
+        min_steps=args.min_steps,
+    )
+    output_sweep(args, results)
 
-    agents_path = "player_agents"
-    _logger.info("Loading agents from %s", agents_path)
 
+def load_agents(args: argparse.Namespace) -> None:
+    _logger.info("Loading agents from %s", args.agents_dir)
     if args.builtin_agents:
         importlib.import_module("smithg.agents.examples")
     discover_agents(args.agents_dir)
     _logger.info("Loading done.")
 
-    _logger.info("Running simulation...")
-    agent_container = smithg.engine.simulate()
 
-    results = [Result(cont.agent_name, cont.state.balance) for cont in agent_container]
+def stop_conditions(
+    args: argparse.Namespace,
+) -> list[smithg.engine.stopping.StopCondition]:
+    stopping = smithg.engine.stopping
+    conditions: list[smithg.engine.stopping.StopCondition] = []
+    if args.stop_rank_stable is not None:
+        conditions.append(stopping.RankStable(args.stop_rank_stable))
+    if args.stop_converged is not None:
+        conditions.append(
+            stopping.BalancesConverged(args.stop_converged, args.stop_tolerance)
+        )
+    if args.max_wall_time is not None:
+        conditions.append(stopping.WallTime(args.max_wall_time))
+    return conditions
+
+
+def run_simulation(
+    args: argparse.Namespace,
+    registry: smithg.agents.Registry = smithg.agents.global_agent_registry,
+) -> tuple[Results, Optional[smithg.engine.profiler.Profiler]]:
+    """Run the simulation described by args with the agents of registry."""
+    _logger.info("Running simulation...")
+    profiler = smithg.engine.profiler.Profiler() if args.profile else None
+    stop = stop_conditions(args)
+    cache = None
+    if args.cache:
+        cache = smithg.engine.cache.ResultCache(args.cache, args.cache_size << 20)
+    results: Results
+    try:
+        if args.shards is not None:
+            agents = registry.agents
+            config = smithg.engine.sharding.ShardConfig(
+                smithg.engine.CANONICAL_ITEMS,
+                args.shards,
+                sync_every=args.sync_every,
+                transport_cost=args.transport_cost,
+                recipes=smithg.engine.CANONICAL_RECIPES,
+                seed=args.seed,
+                time_budget=args.time_budget,
+                profile=profiler is not None,
+            )
+            balances = smithg.engine.sharding.run_sharded(config, agents, profiler)
+            results = [Result(name, b) for (_, name), b in zip(agents, balances)]
+        elif args.runs == 1 and cache is not None:
+            # Single runs go through the tournament machinery, which knows the cache
+            seed = args.seed if args.seed is not None else random.getrandbits(64)
+            agents = registry.agents
+            (balances,) = smithg.engine.tournament.run_seeds(
+                [seed],
+                smithg.engine.CANONICAL_ITEMS,
+                agents,
+                recipes=smithg.engine.CANONICAL_RECIPES,
+                time_budget=args.time_budget,
+                profiler=profiler,
+                cache=cache,
+                stop=stop,
+                scenario=args.scenario,
+            )
+            results = [Result(name, b) for (_, name), b in zip(agents, balances)]
+        elif args.runs > 1:
+            tournament = smithg.engine.tournament
+            if args.adaptive:
+                stats = tournament.run_adaptive_tournament(
+                    args.runs,
+                    smithg.engine.CANONICAL_ITEMS,
+                    jobs=args.jobs,
+                    seed=args.seed,
+                    recipes=smithg.engine.CANONICAL_RECIPES,
+                    time_budget=args.time_budget,
+                    profiler=profiler,
+                    cache=cache,
+                    scenario=args.scenario,
+                    confidence=args.confidence,
+                    min_runs=min(5, args.runs),
+                    registry=registry,
+                )
+            else:
+                stats = tournament.run_tournament(
+                    args.runs,
+                    smithg.engine.CANONICAL_ITEMS,
+                    jobs=args.jobs,
+                    seed=args.seed,
+                    recipes=smithg.engine.CANONICAL_RECIPES,
+                    time_budget=args.time_budget,
+                    profiler=profiler,
+                    cache=cache,
+                    stop=stop,
+                    scenario=args.scenario,
+                    confidence=args.confidence,
+                    registry=registry,
+                )
+            results = [
+                TournamentResult(
+                    s.name, s.mean, s.stddev, s.win_rate, s.runs, s.ci, s.win_runs
+                )
+                for s in stats
+            ]
+        else:
+            recorder = smithg.engine.Recorder(args.record) if args.record else None
+            with contextlib.ExitStack() as stack:
+                metrics = None
+                if args.metrics == "-":
+                    metrics = sys.stdout
+                elif args.metrics:
+                    metrics = stack.enter_context(
+                        open(args.metrics, "w", buffering=1 << 16, newline="")
+                    )
+                agent_container = smithg.engine.simulate(
+                    seed=args.seed,
+                    time_budget=args.time_budget,
+                    profiler=profiler,
+                    recorder=recorder,
+                    checkpoint=args.checkpoint,
+                    checkpoint_every=args.checkpoint_every,
+                    resume=args.resume,
+                    metrics=metrics,
+                    metrics_format=args.metrics_format,
+                    stop=stop,
+                    scenario=args.scenario,
+                    agent_registry=registry,
+                )
+            results = [
+                Result(cont.agent_name, cont.state.balance)
+                for cont in agent_container
+            ]
+    finally:
+        if cache is not None:
+            cache.close()
     results.sort(key=lambda r: r.score, reverse=True)
+    return results, profiler
+
+
+def format_profile(
+    args: argparse.Namespace, profiler: smithg.engine.profiler.Profiler
+) -> str:
+    if args.profile == "json":
+        return profiler.to_json()
+    return profiler.format_table()
+
+
+def serve_job(request: dict) -> Iterator[dict]:
+    """Run a job submitted to the daemon and yield the messages of its results."""
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            args = parse_args(request["argv"])
+    except SystemExit:
+        raise ValueError(stderr.getvalue().strip()) from None
+    if args.metrics == "-":
+        raise ValueError("Served simulations can only write --metrics to a file")
+    # Files are relative to the client, not to the server
+    for option in ("record", "checkpoint", "metrics", "cache", "scenario"):
+        path = getattr(args, option)
+        if path is not None:
+            setattr(args, option, os.path.join(request["cwd"], path))
+
+    # Every job starts from fresh agents, like every run of a tournament
+    agents = copy.deepcopy(smithg.agents.global_agent_registry.agents)
+    results, profiler = run_simulation(args, smithg.agents.Registry(agents))
+    tournament = args.runs > 1
+    for result in results:
+        yield {"type": "result", "tournament": tournament, "result": list(result)}
+    if profiler is not None:
+        yield {"type": "profile", "text": format_profile(args, profiler)}
+
+
+def submit_job(args: argparse.Namespace, argv: list[str]) -> int:
+    """Run a simulation on a daemon, print its results and return the exit status."""
+    results: Results = []
+    for message in smithg.daemon.submit(
+        args.connect, {"argv": argv, "cwd": os.getcwd()}
+    ):
+        if message["type"] == "reloaded":
+            _logger.info("Server reloaded %s", ", ".join(message["modules"]))
+        elif message["type"] == "result":
+            cls = TournamentResult if message["tournament"] else Result
+            results.append(cls(*message["result"]))  # type: ignore
+        elif message["type"] == "profile":
+            print(message["text"], file=sys.stderr)
+        elif message["type"] == "error":
+            print(f"Simulation failed: {message['message']}", file=sys.stderr)
+            return 1
+    _FORMATTERS.get(args.format, output_text)(results)
+    return 0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["sweep"]:
+        sweep_main(argv[1:])
+        return
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+
+    if args.replay:
+        with smithg.engine.replay.ReplayLog(args.replay) as log:
+            states = log.final_states()
+            replayed = [
+                Result(name, state.balance)
+                for name, state in zip(log.agent_names, states)
+            ]
+        replayed.sort(key=lambda r: r.score, reverse=True)
+        _FORMATTERS.get(args.format, output_text)(replayed)
+        return
+
+    if args.connect:
+        sys.exit(submit_job(args, argv))
+
+    if args.serve:
+        if args.builtin_agents:
+            importlib.import_module("smithg.agents.examples")
+        watcher = smithg.daemon.AgentWatcher(args.agents_dir)
+        smithg.daemon.serve(args.serve, watcher, serve_job)
+        return
+    load_agents(args)
+
+    results, profiler = run_simulation(args)
 
     formatter = _FORMATTERS.get(args.format, output_text)
-    formatter(results)
+    if args.metrics == "-":
+        # Keep the metrics stream on stdout parseable
+        with contextlib.redirect_stdout(sys.stderr):
+            formatter(results)
+    else:
+        formatter(results)
+
+    if profiler is not None:
+        print(format_profile(args, profiler), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""
+A long-lived simulation server.
+
+The server keeps the engine and the registered agents loaded and runs simulation jobs
+it receives over a local Unix socket. Before every job, it re-imports the modules of
+the agents directory which changed since the last job, and replaces their agents in
+the registry. Changes to smithg itself need a restart of the server.
+
+The protocol is one JSON object per line. A client sends one request, with the
+command line arguments and the working directory of the job, and the server answers
+with a stream of messages, the last one being {"type": "done"} or
+{"type": "error", "message": ...}.
+"""
+
+from typing import Any, Callable, Iterator, Optional
+import errno
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import sys
+
+from smithg.agents import Registry, global_agent_registry
+
+_logger = logging.getLogger(__name__)
+
+# Handles the request of a client and yields the messages to send back
+JobHandler = Callable[[dict], Iterator[dict]]
+
+
+def _agent_module(agent_func: Any) -> Optional[str]:
+    return getattr(agent_func, "__module__", None)
+
+
+class AgentWatcher:
+    """
+    Keeps the agents of a directory loaded and up to date in a registry.
+
+    Agent modules are imported as `<agents_dir>.<file stem>`, like smithg.cli does.
+    """
+
+    def __init__(self, agents_dir: str, registry: Registry = global_agent_registry):
+        self.agents_dir = agents_dir
+        self.registry = registry
+        self._stats: dict[str, tuple[int, int]] = {}
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        stats = {}
+        for path in pathlib.Path(self.agents_dir).glob("*.py"):
+            st = path.stat()
+            stats[f"{self.agents_dir}.{path.stem}"] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def _drop_bytecode(self, name: str) -> None:
+        # Bytecode is validated by mtime in seconds and size, which misses quick edits
+        path = pathlib.Path(self.agents_dir, f"{name.rpartition('.')[2]}.py")
+        try:
+            os.unlink(importlib.util.cache_from_source(str(path)))
+        except OSError:
+            pass
+
+    def refresh(self) -> list[str]:
+        """Import new and changed agent modules and return their names."""
+        stats = self._scan()
+        changed = [name for name, st in stats.items() if self._stats.get(name) != st]
+        removed = [name for name in self._stats if name not in stats]
+        if changed or removed:
+            importlib.invalidate_caches()
+
+        for name in removed:
+            _logger.info("Removing agents of %s", name)
+            self._remove_agents(name)
+            sys.modules.pop(name, None)
+        for name in sorted(changed):
+            _logger.info("Loading agents of %s", name)
+            position = self._remove_agents(name)
+            start = len(self.registry.agents)
+            self._drop_bytecode(name)
+            try:
+                if name in sys.modules:
+                    importlib.reload(sys.modules[name])
+                else:
+                    importlib.import_module(name)
+            except Exception:
+                # Keep the directory state, a broken module is retried once it changes
+                _logger.exception("Cannot load %s", name)
+                del self.registry.agents[start:]
+                continue
+            finally:
+                self._stats[name] = stats[name]
+            # Reloaded agents take the place of their previous versions
+            if position is not None:
+                new = self.registry.agents[start:]
+                del self.registry.agents[start:]
+                self.registry.agents[position:position] = new
+
+        for name in removed:
+            del self._stats[name]
+        return sorted(changed)
+
+    def _remove_agents(self, module: str) -> Optional[int]:
+        agents = self.registry.agents
+        positions = [i for i, (f, _) in enumerate(agents) if _agent_module(f) == module]
+        agents[:] = [(f, n) for f, n in agents if _agent_module(f) != module]
+        return positions[0] if positions else None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "SimulationServer"
+
+    def handle(self) -> None:
+        def send(message: dict) -> None:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+
+        try:
+            request = json.loads(self.rfile.readline())
+            reloaded = self.server.watcher.refresh()
+            if reloaded:
+                send({"type": "reloaded", "modules": reloaded})
+            for message in self.server.handle_job(request):
+                send(message)
+            send({"type": "done"})
+        except BrokenPipeError:
+            _logger.info("Client went away")
+        except Exception as e:
+            _logger.exception("Job failed")
+            try:
+                send({"type": "error", "message": f"{type(e).__name__}: {e}"})
+            except OSError:
+                pass
+
+
+class SimulationServer(socketserver.UnixStreamServer):
+    """
+    Serves simulation jobs on a Unix socket, one job at a time.
+
+    Jobs run one after the other, because they share the agent registry.
+    """
+
+    def __init__(self, path: str, watcher: AgentWatcher, handle_job: JobHandler):
+        self.watcher = watcher
+        self.handle_job = handle_job
+        self._bound = False
+        if os.path.exists(path):
+            if _is_listening(path):
+                raise OSError(errno.EADDRINUSE, "A server is listening already", path)
+            # A socket file left behind by a server that was killed blocks the address
+            os.unlink(path)
+        super().__init__(path, _Handler)
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        self._bound = True
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self._bound:
+            self._bound = False
+            os.unlink(self.server_address)  # type: ignore
+
+
+def _is_listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(path: str, watcher: AgentWatcher, handle_job: JobHandler) -> None:
+    """Serve jobs on the socket at path until interrupted."""
+    watcher.refresh()
+    with SimulationServer(path, watcher, handle_job) as server:
+        _logger.info("Serving on %s", path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def submit(path: str, request: dict) -> Iterator[dict]:
+    """Send a job to the server at path and yield its messages as they arrive."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                message = json.loads(line)
+                yield message
+                if message["type"] in ("done", "error"):
+                    return
+    raise ConnectionError("Server closed the connection before the job finished")
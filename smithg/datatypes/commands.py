@@ -8,25 +8,30 @@ import abc
 
 from smithg.datatypes.datatypes import Amount, Item, Price, CommandCost
 
+# Fuel cost of BuyItem and SellItem, unless the world sets another trade_cost
+TRADE_COST: CommandCost = 50
+
 
 class Command(abc.ABC):
+    __slots__ = ()
+
     @property
     @abc.abstractmethod
     def cost(self) -> CommandCost:
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class _MakeTrade(Command):
     item: Item
     max_amount: Amount
 
     @property
     def cost(self) -> CommandCost:
-        return 50
+        return TRADE_COST
 
 
-@dataclass
+@dataclass(slots=True)
 class BuyItem(_MakeTrade):
     """
     Informs the world the agent wants to buy an item.
@@ -38,13 +43,18 @@ class BuyItem(_MakeTrade):
     If max_amount * max_price is larger than the agents balance, there
     is a risk the agent will explode due to insufficient funds.
 
-    Executing this command costs command fuel as given by .cost.
+    In markets with resting orders, the unfilled amount stays in the market as a buy
+    offer at max_price until it is filled or cancelled. Its price is reserved from the
+    agents balance in the meantime.
+
+    Executing this command costs env.trade_cost command fuel, which is .cost unless
+    the world sets another trade cost.
     """
 
     max_price: Price
 
 
-@dataclass
+@dataclass(slots=True)
 class SellItem(_MakeTrade):
     """
     Informs the world the agent wants to buy an item.
@@ -53,13 +63,58 @@ class SellItem(_MakeTrade):
     max_amount: Maximal amount of items the agent wants to buy.
     min_price: The minimal price the agent want to sell the item for.
 
-    Executing this command costs command fuel as given by .cost.
+    In markets with resting orders, the unfilled amount stays in the market as a sell
+    offer at min_price until it is filled or cancelled. The items are reserved from
+    the agents inventory in the meantime, so max_amount must not exceed it.
+
+    Executing this command costs env.trade_cost command fuel, which is .cost unless
+    the world sets another trade cost.
     """
 
     min_price: Price
 
 
-@dataclass
+@dataclass(slots=True)
+class CancelOrders(Command):
+    """
+    Cancel all of the agents resting orders for the given item.
+
+    Only markets with resting orders keep unfilled parts of BuyItem and SellItem
+    commands. Funds and items reserved for the cancelled orders are given back.
+
+    Executing this command costs command fuel as given by .cost.
+    """
+
+    item: Item
+
+    @property
+    def cost(self) -> CommandCost:
+        return 10
+
+
+@dataclass(slots=True)
+class Forge(Command):
+    """
+    Forge the given recipe `times` times.
+
+    recipe: Name of the recipe. Must be in env.recipes.
+    times: How many times the recipe is forged.
+
+    The inventory must contain the inputs of the recipe for all `times` forges. They
+    are replaced by the outputs of the recipe.
+
+    Executing this command costs command fuel as given by .cost.
+    """
+
+    recipe: str
+    times: Amount = 1
+
+    @property
+    def cost(self) -> CommandCost:
+        return 20 * self.times
+
+
+@dataclass(slots=True)
 class Work(Command):
     """
     Converts `amount` of command fuel to money.
@@ -74,3 +129,35 @@ class Work(Command):
     @property
     def cost(self) -> CommandCost:
         return self.amount
+
+
+@dataclass(slots=True)
+class Export(Command):
+    """
+    Ship items to another region of a sharded world, see smithg.engine.sharding.
+
+    item: The item to ship. Its amount leaves the inventory right away.
+    amount: How many items to ship.
+    region: Index of the region to sell them in, see events.RegionPrices.
+
+    The items are sold at the next synchronization of the regions, at the average
+    price of the item in the target region minus the transport cost per item. If
+    nobody traded the item there, the items come back with an ExportReturned event.
+
+    Executing this command costs command fuel as given by .cost.
+    """
+
+    item: Item
+    amount: Amount
+    region: int
+
+    @property
+    def cost(self) -> CommandCost:
+        return 50
+
+
+def fuel_cost(command: Command, trade_cost: CommandCost = TRADE_COST) -> CommandCost:
+    """Fuel cost of command in a world whose BuyItem and SellItem cost trade_cost."""
+    if isinstance(command, _MakeTrade):
+        return trade_cost
+    return command.cost
@@ -1,6 +1,7 @@
-from typing import NamedTuple
+from typing import Iterable, Iterator, Mapping, NamedTuple, Optional, Sequence, overload
 import dataclasses
 from dataclasses import dataclass
+import sys
 
 Item = str
 Amount = int
@@ -30,3 +31,96 @@ class SellOffer(TradeOffer):
 
     def __repr__(self):
         return f"SELL({self.amount} {self.item} @ {self.price/100:0.2f})"
+
+
+@dataclass(frozen=True)
+class Recipe:
+    """
+    A recipe turns input items into output items when forged.
+
+    name: Unique name of the recipe, as used in the Forge command.
+    inputs: Items and amounts consumed by forging the recipe once.
+    outputs: Items and amounts produced by forging the recipe once.
+    """
+
+    name: str
+    inputs: Mapping[Item, Amount]
+    outputs: Mapping[Item, Amount]
+
+
+class ItemCatalog(Sequence[Item]):
+    """
+    An ordered set of items, interned to small integer ids.
+
+    Ids are dense, starting from 0 in the order items were added, so they can be used
+    to index arrays and lists. Membership tests and id lookups are O(1).
+    """
+
+    __slots__ = ("_items", "_ids", "_frozen")
+
+    def __init__(self, items: Iterable[Item] = ()):
+        self._items: list[Item] = []
+        self._ids: dict[Item, int] = {}
+        self._frozen: Optional[frozenset[Item]] = None
+        for item in items:
+            self.add(item)
+
+    def add(self, item: Item) -> int:
+        """Add the item, if not known already, and return its id."""
+        item_id = self._ids.get(item)
+        if item_id is None:
+            item = sys.intern(item)
+            item_id = self._ids[item] = len(self._items)
+            self._items.append(item)
+            self._frozen = None
+        return item_id
+
+    @property
+    def ids(self) -> Mapping[Item, int]:
+        """Mapping from item to its id. Do not modify."""
+        return self._ids
+
+    def index(self, item: Item, *args) -> int:  # type: ignore
+        try:
+            return self._ids[item]
+        except KeyError:
+            raise ValueError(f"{item!r} is not a known item") from None
+
+    def frozen(self) -> frozenset[Item]:
+        """Return all items as a frozenset, which is cached until an item is added."""
+        if self._frozen is None:
+            self._frozen = frozenset(self._items)
+        return self._frozen
+
+    @overload
+    def __getitem__(self, item_id: int) -> Item:
+        ...
+
+    @overload
+    def __getitem__(self, item_id: slice) -> list[Item]:
+        ...
+
+    def __getitem__(self, item_id):
+        return self._items[item_id]
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._ids
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ItemCatalog):
+            return self._items == other._items
+        if isinstance(other, (list, tuple)):
+            return self._items == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._items!r})"
+
+    def __reduce__(self):
+        return (self.__class__, (self._items,))
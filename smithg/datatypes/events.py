@@ -1,27 +1,144 @@
 from dataclasses import dataclass
 
-from .datatypes import Amount, Price, Item, CommandCost
+from .datatypes import Amount, Price, Item, CommandCost, BuyOffer, SellOffer
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     @property
     def event_name(self) -> str:
         return self.__class__.__name__
 
 
-@dataclass
+@dataclass(slots=True)
 class TradeReceipt(Event):
     item: Item
     amount: Amount
     price: Price
 
 
-@dataclass
+@dataclass(slots=True)
 class BuyReceipt(TradeReceipt):
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class SellReceipt(TradeReceipt):
     pass
+
+
+@dataclass(slots=True)
+class ForgeReceipt(Event):
+    """The recipe was forged `times` times."""
+
+    recipe: str
+    times: Amount
+
+
+@dataclass(slots=True)
+class OrderPlaced(Event):
+    """The unfilled part of an order rests in the market."""
+
+    item: Item
+    amount: Amount
+    price: Price
+
+
+@dataclass(slots=True)
+class BuyOrderPlaced(OrderPlaced):
+    pass
+
+
+@dataclass(slots=True)
+class SellOrderPlaced(OrderPlaced):
+    pass
+
+
+@dataclass(slots=True)
+class OrderCancelled(Event):
+    """A resting order was cancelled, its reserved funds or items were given back."""
+
+    item: Item
+    amount: Amount
+    price: Price
+
+
+@dataclass(slots=True)
+class BuyOrderCancelled(OrderCancelled):
+    pass
+
+
+@dataclass(slots=True)
+class SellOrderCancelled(OrderCancelled):
+    pass
+
+
+@dataclass(slots=True)
+class StepTimeout(Event):
+    """The agent did not return its commands within the time budget of a step."""
+
+    time_budget: float
+
+
+@dataclass(slots=True)
+class AgentFailed(Event):
+    """The agent raised an exception or its worker died. Its commands were dropped."""
+
+    reason: str
+
+
+@dataclass(slots=True)
+class MarketSnapshot(Event):
+    """
+    Full state for agents with a delta environment, see smithg.agents.DeltaView.
+
+    Sent on the first call and whenever the engine cannot tell what changed since
+    the previous call. It replaces everything the agent knew before.
+    """
+
+    known_items: frozenset[Item]
+    buy_offers: frozenset[BuyOffer]
+    sell_offers: frozenset[SellOffer]
+    inventory: dict[Item, Amount]
+
+
+@dataclass(slots=True)
+class OffersChanged(Event):
+    """Offers added and withdrawn since the previous call. A new price is both."""
+
+    added_buy_offers: frozenset[BuyOffer]
+    withdrawn_buy_offers: frozenset[BuyOffer]
+    added_sell_offers: frozenset[SellOffer]
+    withdrawn_sell_offers: frozenset[SellOffer]
+
+
+@dataclass(slots=True)
+class InventoryChanged(Event):
+    """New amounts of the items whose amount changed since the previous call."""
+
+    amounts: dict[Item, Amount]
+
+
+@dataclass(slots=True)
+class RegionPrices(Event):
+    """
+    Prices of all regions of a sharded world, sent when the regions synchronize.
+
+    region: Index of the agent's own region.
+    prices: Average offer price per item of every region since the previous
+      synchronization, indexed by region.
+    transport_cost: Cost per item of exporting to another region.
+    """
+
+    region: int
+    prices: tuple[dict[Item, Price], ...]
+    transport_cost: Price
+
+
+@dataclass(slots=True)
+class ExportReturned(Event):
+    """Exported items came back, nobody traded them in the target region."""
+
+    item: Item
+    amount: Amount
+    region: int
@@ -1,21 +1,89 @@
-from typing import Callable
+from typing import Callable, Iterable, Optional, TextIO
 import logging
 import functools
 
-from smithg.agents import global_agent_registry
+from smithg.agents import Registry, global_agent_registry
+from smithg.datatypes import Recipe
 from . import engine
+from .bus import EventBus
+from .metrics import write_metrics
+from .profiler import Profiler
+from .replay import Recorder
+from .stopping import StopCondition
 
 _logger = logging.getLogger(__name__)
 
+CANONICAL_ITEMS = (
+    "iron_ore",
+    "iron_ingot",
+    "iron_sword",
+    "iron_sheets",
+    "iron_hammer",
+)
 
-def simulate() -> list[engine.AgentContainer]:
-    canonical_items = (
-        "iron_ore",
-        "iron_ingot",
-        "iron_sword",
-        "iron_sheets",
-        "iron_hammer",
-    )
+CANONICAL_RECIPES = (
+    Recipe("smelt_iron", inputs={"iron_ore": 2}, outputs={"iron_ingot": 1}),
+    Recipe("forge_sword", inputs={"iron_ingot": 3}, outputs={"iron_sword": 1}),
+    Recipe("roll_sheets", inputs={"iron_ingot": 1}, outputs={"iron_sheets": 2}),
+    Recipe("forge_hammer", inputs={"iron_ingot": 2}, outputs={"iron_hammer": 1}),
+)
 
-    world = engine.make_world(canonical_items)
-    return world.simulate()
+
+def simulate(
+    seed: Optional[int] = None,
+    steps: int = 1000,
+    time_budget: Optional[float] = None,
+    profiler: Optional[Profiler] = None,
+    recorder: Optional[Recorder] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    metrics: Optional[TextIO] = None,
+    metrics_format: str = "ndjson",
+    stop: Iterable[StopCondition] = (),
+    scenario: Optional[str] = None,
+    agent_registry: Registry = global_agent_registry,
+) -> list[engine.AgentContainer]:
+    """
+    Simulate the canonical world with the agents of agent_registry.
+
+    With resume, the world is restored from the checkpoint file instead, and only the
+    steps which are left of the given number of steps are simulated. With metrics,
+    the state of every agent is written to that file after every step, see
+    smithg.engine.metrics. The simulation ends early once any of the stop conditions
+    is met, see smithg.engine.stopping. With a scenario file, the market offers its
+    ticks instead of random offers, see smithg.engine.scenario.
+    """
+    if resume:
+        if checkpoint is None:
+            raise ValueError("Resuming needs a checkpoint")
+        world = engine.World.restore(checkpoint)
+    else:
+        market = None
+        known_items: tuple[str, ...] = CANONICAL_ITEMS
+        if scenario is not None:
+            # Imported here, so the module can run as a script
+            from .scenario import ScenarioMarket
+
+            market = ScenarioMarket(path=scenario)
+            known_items += tuple(market.known_items)
+        world = engine.make_world(
+            known_items,
+            agent_registry=agent_registry,
+            seed=seed,
+            market=market,
+            recipes=CANONICAL_RECIPES,
+            time_budget=time_budget,
+        )
+    world.profiler = profiler
+    world.recorder = recorder
+    steps = max(0, steps - world.step_count)
+    try:
+        if metrics is None:
+            return world.simulate(steps, checkpoint, checkpoint_every, stop)
+        names = [cont.agent_name for cont in world.player_agent_containers]
+        snapshots = world.iter_steps(steps, checkpoint, checkpoint_every, stop)
+        write_metrics(metrics, names, snapshots, metrics_format)
+        return world.player_agent_containers
+    finally:
+        world.close()
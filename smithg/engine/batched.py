@@ -0,0 +1,368 @@
+"""
+Batched agents, which act for many agents with one call per step.
+
+A BatchedAgent stands for batch_size member agents, typically copies of one strategy
+with different parameters. It is registered and added to worlds like any other agent,
+and every member gets its own agent container, named `name[i]`, with its own state
+and result. Once per step, act() gets the state of all members as stacked arrays and
+returns the commands of all members as arrays.
+
+In a CompactWorld, the member states are read and written as slices of the
+AgentArrays of the world. With markets which fill every order against the current
+offers, like RandomMarket and ScenarioMarket, the commands of all members are applied
+at once with array operations. With other markets, or with a recorder, profiler or
+observers on the world, they are decoded into command lists and executed member by
+member, with the same result.
+
+This module requires numpy (`pip install smithg[numpy]`).
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+import abc
+
+import numpy as np
+
+from smithg.datatypes import CommandCost, ItemCatalog, commands
+from smithg.engine.compact import CompactWorld
+from smithg.engine.engine import AgentContainer, InvalidAgentState, MarketView, World
+from smithg.engine.market import Market
+
+
+@dataclass
+class BatchEnvironment:
+    """
+    What all members of a batched agent see in a step.
+
+    Arrays indexed by member have one row per member. Item columns are in the order of
+    known_items, recipe columns in the order of recipes. Offer arrays hold 0 for items
+    without an offer. All arrays are read-only.
+
+    balances, command_fuel: [members]
+    inventories: [members, items]
+    buy_prices, buy_amounts, sell_prices, sell_amounts: [items], the market offers.
+    recipe_inputs, recipe_outputs: [recipes, items], amounts per forge.
+    trade_cost: Command fuel of every SellItem and BuyItem, see World.trade_cost.
+    """
+
+    step: int
+    known_items: ItemCatalog
+    recipes: tuple[str, ...]
+    recipe_inputs: np.ndarray
+    recipe_outputs: np.ndarray
+    balances: np.ndarray
+    command_fuel: np.ndarray
+    inventories: np.ndarray
+    buy_prices: np.ndarray
+    buy_amounts: np.ndarray
+    sell_prices: np.ndarray
+    sell_amounts: np.ndarray
+    trade_cost: CommandCost = commands.TRADE_COST
+
+
+@dataclass
+class BatchCommands:
+    """
+    Commands of all members of a batched agent, as integer arrays.
+
+    Arrays have the shapes of BatchEnvironment, and None or 0 means no command. Every
+    member executes Work, then SellItem for every item with sell > 0, then BuyItem
+    for every item with buy > 0, then Forge for every recipe with forge > 0.
+
+    work: [members] fuel to work.
+    sell, sell_price: [members, items] max_amount and min_price of SellItem.
+    buy, buy_price: [members, items] max_amount and max_price of BuyItem.
+    forge: [members, recipes] times of Forge.
+    """
+
+    work: Optional[np.ndarray] = None
+    sell: Optional[np.ndarray] = None
+    sell_price: Optional[np.ndarray] = None
+    buy: Optional[np.ndarray] = None
+    buy_price: Optional[np.ndarray] = None
+    forge: Optional[np.ndarray] = None
+
+
+class BatchedAgent(abc.ABC):
+    """
+    An agent which stands for batch_size members and acts for all of them at once.
+
+    Subclasses implement act(). Batched agents cannot be sandboxed, and they only run
+    in single worlds, not in tournaments or sharded worlds.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+
+    @abc.abstractmethod
+    def act(self, env: BatchEnvironment) -> BatchCommands:
+        ...
+
+    def add_to_world(self, world: World, name: str) -> None:
+        """Add the members of this agent to world, see World.add_agent."""
+        batch = Batch(self, world)
+        for i in range(self.batch_size):
+            cont = world.new_container(self, f"{name}[{i}]", batch=batch)
+            batch.members.append(cont)
+            world.player_agent_containers.append(cont)
+
+    def __call__(self, env, events):
+        raise TypeError("Batched agents are called through their Batch")
+
+
+class Batch:
+    """The members of a batched agent in one world."""
+
+    def __init__(self, agent: BatchedAgent, world: World):
+        self.agent = agent
+        self.members: list[AgentContainer] = []
+        # Members of a CompactWorld are consecutive rows of its AgentArrays
+        self.start: Optional[int] = None
+        if isinstance(world, CompactWorld):
+            self.start = world.arrays.size
+
+        book = world.recipe_book
+        self.recipes = tuple(book.recipes)
+        ids = world.known_items.ids
+        self.recipe_inputs = np.zeros((len(self.recipes), len(ids)), dtype=np.int64)
+        self.recipe_outputs = np.zeros_like(self.recipe_inputs)
+        for r, recipe in enumerate(book.recipes.values()):
+            for item, amount in recipe.inputs.items():
+                self.recipe_inputs[r, ids[item]] = amount
+            for item, amount in recipe.outputs.items():
+                self.recipe_outputs[r, ids[item]] = amount
+        self.recipe_inputs.flags.writeable = False
+        self.recipe_outputs.flags.writeable = False
+
+    def _members(self, world: World) -> list[AgentContainer]:
+        if not self.members:
+            self.members = [c for c in world.player_agent_containers if c.batch is self]
+        return self.members
+
+    def states(self, world: World) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Balances, command fuel and inventories of all members, as copies."""
+        if self.start is not None:
+            arrays = world.arrays  # type: ignore
+            rows = slice(self.start, self.start + len(self.members))
+            return (
+                arrays.balances[rows].copy(),
+                arrays.command_fuel[rows].copy(),
+                arrays.inventories[rows].copy(),
+            )
+        ids = world.known_items.ids
+        n = len(self.members)
+        inventories = np.zeros((n, len(ids)), dtype=np.int64)
+        for i, cont in enumerate(self.members):
+            for item, amount in cont.state.items.items():
+                inventories[i, ids[item]] = amount
+        return (
+            np.fromiter((c.state.balance for c in self.members), np.int64, n),
+            np.fromiter((c.state.command_fuel for c in self.members), np.int64, n),
+            inventories,
+        )
+
+    def store(
+        self,
+        world: World,
+        balances: np.ndarray,
+        command_fuel: np.ndarray,
+        inventories: np.ndarray,
+    ) -> None:
+        if self.start is not None:
+            arrays = world.arrays  # type: ignore
+            rows = slice(self.start, self.start + len(self.members))
+            arrays.balances[rows] = balances
+            arrays.command_fuel[rows] = command_fuel
+            arrays.inventories[rows] = inventories
+            return
+        items = world.known_items
+        for cont, balance, fuel, row in zip(
+            self.members, balances.tolist(), command_fuel.tolist(), inventories.tolist()
+        ):
+            cont.state.balance = balance
+            cont.state.command_fuel = fuel
+            for item, amount in zip(items, row):
+                if amount or item in cont.state.items:
+                    cont.state.items[item] = amount
+
+    def balances(self, world: World) -> np.ndarray:
+        """Balances of all members, for example to select the best parameters."""
+        self._members(world)
+        return self.states(world)[0]
+
+    def environment(
+        self, world: World, market_view: MarketView, states: tuple[np.ndarray, ...]
+    ) -> BatchEnvironment:
+        ids = world.known_items.ids
+        offers = np.zeros((4, len(ids)), dtype=np.int64)
+        for offer in market_view.buy_offers:
+            offers[0, ids[offer.item]] = offer.price
+            offers[1, ids[offer.item]] = offer.amount
+        for offer in market_view.sell_offers:
+            offers[2, ids[offer.item]] = offer.price
+            offers[3, ids[offer.item]] = offer.amount
+
+        views = []
+        for array in (*states, *offers):
+            view = array.view()
+            view.flags.writeable = False
+            views.append(view)
+        return BatchEnvironment(
+            world.step_count,
+            world.known_items,
+            self.recipes,
+            self.recipe_inputs,
+            self.recipe_outputs,
+            *views,
+            trade_cost=world.trade_cost,
+        )
+
+    def run(
+        self,
+        world: World,
+        cont: AgentContainer,
+        market_view: MarketView,
+        execute: Callable[..., None],
+    ) -> None:
+        """
+        Let the agent act for all members and apply the commands.
+
+        World.run_agents calls this for every member, the batch acts at the first one.
+        """
+        if cont is not self._members(world)[0]:
+            return
+        states = self.states(world)
+        env = self.environment(world, market_view, states)
+        cmds = self._check(self.agent.act(env), env)
+        # Members get no events, receipts would only pile up
+        for member in self.members:
+            if member.events_queue:
+                member.events_queue.clear()
+
+        market = type(world.market)
+        vectorized = (
+            market.buy is Market.buy
+            and market.sell is Market.sell
+            and world.recorder is None
+            and world.profiler is None
+            and world.bus is None
+        )
+        if vectorized:
+            self._apply(world, env, cmds, *states)
+        else:
+            for cont, queued_commands in zip(self.members, self.decode(world, cmds)):
+                execute(cont, world, queued_commands)
+
+    def _check(self, cmds: BatchCommands, env: BatchEnvironment) -> BatchCommands:
+        """Return cmds with all arrays present, integer and of the right shape."""
+        n, items = env.inventories.shape
+        shapes = {
+            "work": (n,),
+            "sell": (n, items),
+            "sell_price": (n, items),
+            "buy": (n, items),
+            "buy_price": (n, items),
+            "forge": (n, len(self.recipes)),
+        }
+        arrays = {}
+        for name, shape in shapes.items():
+            array = getattr(cmds, name)
+            if array is None:
+                arrays[name] = np.zeros(shape, dtype=np.int64)
+                continue
+            array = np.asarray(array)
+            if array.shape != shape or array.dtype.kind not in "iu":
+                raise InvalidAgentState(
+                    f"Batched command {name} must be an integer array of shape {shape}"
+                    f". Found {array.dtype} {array.shape}"
+                )
+            if name != "sell_price" and name != "buy_price" and (array < 0).any():
+                raise InvalidAgentState(f"Batched command {name} must not be negative")
+            arrays[name] = array.astype(np.int64, copy=False)
+        # Prices only matter where something is traded
+        for side in ("sell", "buy"):
+            if ((arrays[side] > 0) & (arrays[f"{side}_price"] <= 0)).any():
+                raise InvalidAgentState(f"Batched {side} orders need a positive price")
+        return BatchCommands(**arrays)
+
+    def decode(self, world: World, cmds: BatchCommands) -> list[list[commands.Command]]:
+        """Turn checked batched commands into a command list per member."""
+        items = world.known_items
+        decoded: list[list[commands.Command]] = [[] for _ in self.members]
+        assert cmds.work is not None and cmds.forge is not None
+        for i in np.flatnonzero(cmds.work).tolist():
+            decoded[i].append(commands.Work(amount=int(cmds.work[i])))
+        trades: tuple[tuple[type, Any, Any], ...] = (
+            (commands.SellItem, cmds.sell, cmds.sell_price),
+            (commands.BuyItem, cmds.buy, cmds.buy_price),
+        )
+        for kind, amounts, prices in trades:
+            for i, j in zip(*np.nonzero(amounts)):
+                amount, price = int(amounts[i, j]), int(prices[i, j])
+                decoded[i].append(kind(items[j], amount, price))
+        for i, r in zip(*np.nonzero(cmds.forge)):
+            times = int(cmds.forge[i, r])
+            decoded[i].append(commands.Forge(self.recipes[r], times=times))
+        return decoded
+
+    def _apply(
+        self,
+        world: World,
+        env: BatchEnvironment,
+        cmds: BatchCommands,
+        balances: np.ndarray,
+        command_fuel: np.ndarray,
+        inventories: np.ndarray,
+    ) -> None:
+        """Apply checked commands to all members with array operations."""
+        work, sell, buy, forge = cmds.work, cmds.sell, cmds.buy, cmds.forge
+        assert work is not None and sell is not None and buy is not None
+        assert forge is not None
+
+        # Forge commands know their cost, so it is taken from them
+        forge_cost = commands.Forge("", 1).cost
+        trades = np.count_nonzero(sell, axis=1) + np.count_nonzero(buy, axis=1)
+        cost = work + env.trade_cost * trades + forge_cost * forge.sum(axis=1)
+        self._fail_where(cost > command_fuel, "ran out of fuel")
+        command_fuel -= cost
+        balances += self.members[0].work_to_money * work
+
+        # Every order is filled against the offers, like Market.buy and Market.sell
+        offered = env.buy_amounts > 0
+        filled = (sell > 0) & offered & (cmds.sell_price <= env.buy_prices)
+        sold = np.where(filled, np.minimum(sell, env.buy_amounts), 0)
+        self._fail_where((sold > inventories).any(axis=1), "sold more than it has")
+        inventories -= sold
+        balances += sold @ env.buy_prices
+
+        offered = env.sell_amounts > 0
+        filled = (buy > 0) & offered & (cmds.buy_price >= env.sell_prices)
+        bought = np.where(filled, np.minimum(buy, env.sell_amounts), 0)
+        inventories += bought
+        balances -= bought @ env.sell_prices
+
+        # Recipes are forged in order, so later recipes can use earlier outputs
+        for r in np.flatnonzero(forge.any(axis=0)).tolist():
+            times = forge[:, r : r + 1]
+            needed = times * self.recipe_inputs[r]
+            self._fail_where((needed > inventories).any(axis=1), "lacks forge inputs")
+            inventories += times * (self.recipe_outputs[r] - self.recipe_inputs[r])
+
+        self.store(world, balances, command_fuel, inventories)
+
+    def _fail_where(self, failed: np.ndarray, reason: str) -> None:
+        if failed.any():
+            cont = self.members[int(np.argmax(failed))]
+            raise InvalidAgentState(f"Agent {cont.agent_name} {reason}")
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Members are checkpointed on their own and reference the batch, they are
+        # found again in the world on the next run
+        state["members"] = []
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.recipe_inputs.flags.writeable = False
+        self.recipe_outputs.flags.writeable = False
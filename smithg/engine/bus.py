@@ -0,0 +1,134 @@
+"""
+An event bus for observing the engine.
+
+The engine emits the events below at fixed points of a step. Observers subscribe to
+event types on the bus of a world, see World.subscribe. A world without observers
+has no bus and pays one attribute check per emit point, and event objects are only
+created for types which have observers.
+
+Observers run synchronously inside the step and must not change the world.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional
+import logging
+
+from smithg.datatypes import Amount, Item, Price
+from smithg.datatypes.commands import Command
+
+if TYPE_CHECKING:
+    from smithg.engine.engine import AgentContainer, World
+
+_logger = logging.getLogger("smithg.engine.engine")
+
+Observer = Callable[[Any], None]
+
+
+@dataclass(slots=True, frozen=True)
+class TickStarted:
+    """A step started, before the market ticks."""
+
+    world: "World"
+    step: int
+
+
+@dataclass(slots=True, frozen=True)
+class AgentCalled:
+    """An agent is about to be called with the events in its queue."""
+
+    agent: "AgentContainer"
+    step: int
+
+
+@dataclass(slots=True, frozen=True)
+class CommandExecuted:
+    """A command of an agent was executed and its fuel paid."""
+
+    agent: "AgentContainer"
+    command: Command
+
+
+@dataclass(slots=True, frozen=True)
+class TradeFilled:
+    """
+    An order of an agent was filled.
+
+    buy: True if the agent bought, False if it sold.
+    maker: The agent whose resting order was filled, None for market offers.
+    """
+
+    agent: "AgentContainer"
+    item: Item
+    amount: Amount
+    price: Price
+    buy: bool
+    maker: Optional["AgentContainer"]
+
+
+@dataclass(slots=True, frozen=True)
+class AgentFailed:
+    """
+    An agent misbehaved.
+
+    This covers invalid commands, which end the simulation right after this event,
+    and agents which timed out or crashed, which only lose their commands.
+    """
+
+    agent: "AgentContainer"
+    reason: str
+
+
+class EventBus:
+    """Calls the observers of an event type with every emitted event of that type."""
+
+    __slots__ = ("_observers",)
+
+    def __init__(self) -> None:
+        self._observers: dict[type, list[Observer]] = {}
+
+    def subscribe(self, event_type: type, observer: Observer) -> None:
+        self._observers.setdefault(event_type, []).append(observer)
+
+    def unsubscribe(self, event_type: type, observer: Observer) -> None:
+        observers = self._observers.get(event_type, [])
+        if observer in observers:
+            observers.remove(observer)
+        if not observers:
+            self._observers.pop(event_type, None)
+
+    def listens(self, event_type: type) -> bool:
+        """Return True if event_type has observers."""
+        return event_type in self._observers
+
+    def emit(self, event_type: type, *args: Any) -> None:
+        """Create an event from args and pass it to the observers of its type."""
+        observers = self._observers.get(event_type)
+        if observers:
+            event = event_type(*args)
+            for observer in observers:
+                observer(event)
+
+    def __bool__(self) -> bool:
+        return bool(self._observers)
+
+
+def log_trade(event: TradeFilled) -> None:
+    verb = "bought" if event.buy else "sold"
+    _logger.info("Agent %s %d of %s at %d", verb, event.amount, event.item, event.price)
+
+
+def log_agent_called(event: AgentCalled) -> None:
+    _logger.debug("Calling agent with events: %s", event.agent.events_queue)
+
+
+def log_command(event: CommandExecuted) -> None:
+    _logger.debug("Agent executed command %s", event.command)
+
+
+def subscribe_logging(bus: EventBus, level: int) -> None:
+    """Subscribe the observers which log engine events at level or above."""
+    if level <= logging.INFO:
+        bus.subscribe(TradeFilled, log_trade)
+    if level <= logging.DEBUG:
+        bus.subscribe(AgentCalled, log_agent_called)
+        bus.subscribe(CommandExecuted, log_command)
@@ -0,0 +1,217 @@
+"""
+A content-addressed cache of simulation results.
+
+Results are keyed by a hash of everything that determines them: the source of the
+engine, the source module and the seeded state of the agent, the world configuration
+and the seed. Changing an agent file therefore only invalidates the results of that
+agent, and changing the engine invalidates everything.
+
+The cache is an SQLite database on local disk. It is bounded in size and evicts the
+least recently used results first.
+"""
+
+from dataclasses import fields
+from typing import Any, Iterable, Mapping, Optional, Union
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+import pickle
+import platform
+import sqlite3
+import sys
+import time
+
+from smithg.agents import AgentFunc
+from smithg.datatypes import Item, Recipe
+from smithg.engine import engine
+
+# World parameters which make_world does not change and which are part of every key
+_WORLD_PARAMETERS = (
+    "work_to_money",
+    "balance_init",
+    "balance_increase",
+    "command_fuel_init",
+    "command_fuel_increase",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def engine_fingerprint() -> str:
+    """Hash of the smithg sources, except for the example agents and the CLI."""
+    package = pathlib.Path(__file__).resolve().parent.parent
+    digest = hashlib.sha256()
+    for path in sorted(package.rglob("*.py")):
+        relative = path.relative_to(package).as_posix()
+        if relative.startswith("agents/examples/") or relative == "cli.py":
+            continue
+        digest.update(relative.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=256)
+def _file_fingerprint(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _module_fingerprint(module_name: str) -> Optional[str]:
+    # Keyed by the file state, so modules reloaded by the daemon get a new hash
+    path = getattr(sys.modules.get(module_name), "__file__", None)
+    if not path or not path.endswith(".py"):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return _file_fingerprint(path, st.st_mtime_ns, st.st_size)
+
+
+def agent_fingerprint(agent_func: AgentFunc) -> Optional[str]:
+    """Hash of the source module of an agent, or None if it has no source."""
+    if inspect.isfunction(agent_func):
+        module = agent_func.__module__
+    else:
+        module = type(agent_func).__module__
+    return _module_fingerprint(module)
+
+
+def run_key(
+    agent_func: AgentFunc,
+    name: str,
+    seed: int,
+    known_items: Iterable[Item],
+    steps: int,
+    recipes: Iterable[Recipe] = (),
+    settings: Optional[Mapping[str, Any]] = None,
+) -> Optional[str]:
+    """
+    Return the cache key of the result of one agent in one seeded run.
+
+    settings are the World fields of the run which differ from their defaults.
+
+    Returns None if the result cannot be cached, because the agent source is unknown
+    or the agent cannot be pickled.
+    """
+    source = agent_fingerprint(agent_func)
+    if source is None:
+        return None
+    agent_func = copy.deepcopy(agent_func)
+    engine.seed_agent(agent_func, seed, name)
+    try:
+        state = pickle.dumps(agent_func, protocol=4)
+    except Exception:
+        return None
+
+    defaults = {f.name: f.default for f in fields(engine.World)}
+    config = {
+        "engine": engine_fingerprint(),
+        "python": platform.python_version_tuple()[:2],
+        "agent": source,
+        "name": name,
+        "seed": seed,
+        "steps": steps,
+        "known_items": list(known_items),
+        "recipes": [(r.name, r.inputs, r.outputs) for r in recipes],
+        "world": {**{p: defaults[p] for p in _WORLD_PARAMETERS}, **(settings or {})},
+    }
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+    digest.update(state)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of JSON serializable results on local disk.
+
+    directory: Directory of the cache database, created if it does not exist.
+    max_bytes: Upper bound for the size of all cached keys and values.
+    """
+
+    def __init__(
+        self, directory: Union[str, os.PathLike], max_bytes: int = 256 << 20
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(os.path.join(directory, "results.sqlite"))
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, used INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+            )
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Return the cached results of those keys which are in the cache."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._db:
+            # Stay below the SQLite limit for query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({marks})", chunk
+                )
+                found.update((key, json.loads(value)) for key, value in rows)
+                self._db.execute(
+                    f"UPDATE results SET used = ? WHERE key IN ({marks})",
+                    [time.time_ns(), *chunk],
+                )
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, results: Mapping[str, Any]) -> None:
+        """Store results and evict the least recently used ones beyond max_bytes."""
+        now = time.time_ns()
+        rows = []
+        for key, result in results.items():
+            value = json.dumps(result)
+            rows.append((key, value, len(key) + len(value), now))
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict()
+
+    def put(self, key: str, result: Any) -> None:
+        self.put_many({key: result})
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM results ORDER BY used"
+        ):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def size(self) -> int:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        return total
+
+    def __len__(self) -> int:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+        return count
+
+    def close(self) -> None:
+        self._db.close()
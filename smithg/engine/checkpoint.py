@@ -0,0 +1,209 @@
+"""
+Incremental checkpoints of worlds.
+
+A checkpoint file is an append-only sequence of frames. The world is split into
+components (the world itself, its market, every agent container and every agent),
+which are pickled separately. References between them are stored as references, so
+shared objects stay shared after a restore. A checkpoint appends only the components
+whose pickle changed since the previous checkpoint, followed by a commit frame.
+Restoring takes the latest version of every component as of the last complete commit,
+so a crash while writing loses at most the checkpoint being written.
+
+When the file has grown to several times the size of the live state, it is rewritten
+with a single full checkpoint.
+
+Everything in a world must be picklable: agents which are functions must be
+importable, and agent objects are pickled with their state, for example the random
+generator of RandomAgent. Profilers and recorders are not part of checkpoints.
+"""
+
+from typing import Any, BinaryIO, Optional, Union
+import hashlib
+import io
+import os
+import pickle
+import struct
+
+from smithg.engine.engine import World
+
+MAGIC = b"SMGCKPT\x01"
+
+_FRAME = struct.Struct("<BI")
+_COMPONENT = 0
+_COMMIT = 1
+
+_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Rewrite the file once it is this many times larger than the live state
+_COMPACT_RATIO = 4
+
+
+class CheckpointError(ValueError):
+    pass
+
+
+def components(world: World) -> dict[str, Any]:
+    """Return the separately stored parts of a world by name."""
+    parts: dict[str, Any] = {"world": world, "market": world.market}
+    prev_batch = None
+    for i, cont in enumerate(world.player_agent_containers):
+        # Agent states change every step, agents themselves often do not
+        parts[f"agent:{i}"] = cont
+        parts[f"agent_func:{i}"] = cont.agent_func
+        # Members of a batched agent share their batch
+        if cont.batch is not None and cont.batch is not prev_batch:
+            parts[f"batch:{i}"] = cont.batch
+        prev_batch = cont.batch
+    parts.update(world.checkpoint_components())
+    return parts
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file: BinaryIO, shared: dict[int, str], current: Any):
+        super().__init__(file, _PROTOCOL)
+        self._shared = shared
+        self._current = current
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        if obj is self._current:
+            return None
+        return self._shared.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file: BinaryIO, loader: "_Loader"):
+        super().__init__(file)
+        self._loader = loader
+
+    def persistent_load(self, pid: str) -> Any:
+        return self._loader.load(pid)
+
+
+class _Loader:
+    def __init__(self, data: dict[str, bytes]):
+        self._data = data
+        self._loaded: dict[str, Any] = {}
+        self._loading: set[str] = set()
+
+    def load(self, name: str) -> Any:
+        if name in self._loaded:
+            return self._loaded[name]
+        if name in self._loading:
+            raise CheckpointError(f"Checkpoint components reference each other: {name}")
+        if name not in self._data:
+            raise CheckpointError(f"Checkpoint is missing component {name}")
+        self._loading.add(name)
+        obj = _Unpickler(io.BytesIO(self._data[name]), self).load()
+        self._loaded[name] = obj
+        return obj
+
+
+class Checkpointer:
+    """
+    Writes checkpoints of a world to one file.
+
+    The first checkpoint rewrites the file completely, later ones append what changed.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        self._file: Optional[BinaryIO] = None
+        # Digest and size of the last written pickle of every component
+        self._written: dict[str, tuple[bytes, int]] = {}
+
+    def write(self, world: World) -> int:
+        """Write a checkpoint and return the number of bytes appended."""
+        parts = components(world)
+        shared = {id(obj): name for name, obj in parts.items()}
+        pickles = {}
+        for name, obj in parts.items():
+            buffer = io.BytesIO()
+            _Pickler(buffer, shared, obj).dump(obj)
+            pickles[name] = buffer.getvalue()
+
+        live_size = sum(len(data) for data in pickles.values())
+        if self._file is None or self._file.tell() > _COMPACT_RATIO * live_size:
+            self._rewrite(pickles)
+            return os.path.getsize(self.path)
+
+        file = self._file
+        start = file.tell()
+        for name, data in pickles.items():
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if self._written.get(name, (None,))[0] != digest:
+                _write_component(file, name, data)
+                self._written[name] = (digest, len(data))
+        _write_frame(file, _COMMIT, pickle.dumps(sorted(pickles), _PROTOCOL))
+        file.flush()
+        return file.tell() - start
+
+    def _rewrite(self, pickles: dict[str, bytes]) -> None:
+        if self._file is not None:
+            self._file.close()
+        tmp = f"{os.fspath(self.path)}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(MAGIC)
+            for name, data in pickles.items():
+                _write_component(file, name, data)
+            _write_frame(file, _COMMIT, pickle.dumps(sorted(pickles), _PROTOCOL))
+        # Replacing is atomic, a crash leaves either the old or the new file
+        os.replace(tmp, self.path)
+
+        self._file = open(self.path, "ab")
+        self._written = {
+            name: (hashlib.blake2b(data, digest_size=16).digest(), len(data))
+            for name, data in pickles.items()
+        }
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self) -> dict:
+        # Open files cannot be pickled, the next checkpoint rewrites the file
+        return {"path": self.path, "_file": None, "_written": {}}
+
+
+def _write_frame(file: BinaryIO, kind: int, payload: bytes) -> None:
+    file.write(_FRAME.pack(kind, len(payload)))
+    file.write(payload)
+
+
+def _write_component(file: BinaryIO, name: str, data: bytes) -> None:
+    encoded = name.encode()
+    _write_frame(file, _COMPONENT, bytes([len(encoded)]) + encoded + data)
+
+
+def restore(path: Union[str, os.PathLike]) -> World:
+    """Restore the world of the last complete checkpoint in a file."""
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise CheckpointError(f"{path} is not a checkpoint")
+
+    latest: dict[str, bytes] = {}
+    committed: Optional[dict[str, bytes]] = None
+    offset = len(MAGIC)
+    while offset + _FRAME.size <= len(data):
+        kind, length = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        if offset + length > len(data):
+            # Torn write of the last checkpoint
+            break
+        payload = data[offset : offset + length]
+        offset += length
+        if kind == _COMPONENT:
+            name_length = payload[0]
+            name = payload[1 : 1 + name_length].decode()
+            latest[name] = payload[1 + name_length :]
+        else:
+            names = pickle.loads(payload)
+            committed = {name: latest[name] for name in names}
+
+    if committed is None:
+        raise CheckpointError(f"{path} does not contain a complete checkpoint")
+    world = _Loader(committed).load("world")
+    if not isinstance(world, World):
+        raise CheckpointError(f"{path} does not contain a world")
+    return world
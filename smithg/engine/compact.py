@@ -0,0 +1,200 @@
+"""
+A compact world-state backend for large agent populations.
+
+Balances, command fuel and inventories of all agents live in contiguous NumPy arrays,
+indexed by agent and item. Agent containers keep working as before: their state is a
+thin view on one row of that storage. Replenishing fuel and balances is a single
+vectorized operation per step instead of a loop over all agents.
+
+This module requires numpy (`pip install smithg[numpy]`).
+"""
+
+from typing import Any, Iterable, Iterator, Optional
+from dataclasses import dataclass
+import collections.abc
+
+import numpy as np
+
+from smithg.agents import InventoryView
+from smithg.datatypes import Item, ItemCatalog, Amount
+from smithg.engine.engine import AgentContainer, World
+
+
+class AgentArrays:
+    """
+    Struct-of-arrays storage for the state of many agents.
+
+    Arrays grow geometrically when agents are added. Views must therefore always go
+    through this object instead of keeping references to the arrays.
+    """
+
+    def __init__(self, known_items: Iterable[Item], capacity: int = 64):
+        if not isinstance(known_items, ItemCatalog):
+            known_items = ItemCatalog(known_items)
+        self.items = known_items
+        self.item_index = known_items.ids
+        self.size = 0
+        self.balances = np.zeros(capacity, dtype=np.int64)
+        self.command_fuel = np.zeros(capacity, dtype=np.int64)
+        self.balance_increase = np.zeros(capacity, dtype=np.int64)
+        self.command_fuel_increase = np.zeros(capacity, dtype=np.int64)
+        self.inventories = np.zeros((capacity, len(self.items)), dtype=np.int64)
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self.balances)
+        for name in (
+            "balances",
+            "command_fuel",
+            "balance_increase",
+            "command_fuel_increase",
+            "inventories",
+        ):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def add(
+        self,
+        balance: Amount,
+        command_fuel: Amount,
+        balance_increase: Amount,
+        command_fuel_increase: Amount,
+    ) -> int:
+        if self.size == len(self.balances):
+            self._grow()
+        index = self.size
+        self.balances[index] = balance
+        self.command_fuel[index] = command_fuel
+        self.balance_increase[index] = balance_increase
+        self.command_fuel_increase[index] = command_fuel_increase
+        self.size += 1
+        return index
+
+    def replenish(self) -> None:
+        n = self.size
+        self.command_fuel[:n] += self.command_fuel_increase[:n]
+        self.balances[:n] += self.balance_increase[:n]
+
+
+class CompactInventory(collections.abc.MutableMapping):
+    """
+    Inventory of one agent, stored in a row of AgentArrays.inventories.
+
+    Like Inventory, it reads missing items as 0 and hands out copy-on-write views.
+    Only known items can be stored, and items with amount 0 are not listed.
+    """
+
+    __slots__ = ("_arrays", "_index", "_view")
+
+    def __init__(self, arrays: AgentArrays, index: int):
+        self._arrays = arrays
+        self._index = index
+        self._view: Optional[InventoryView] = None
+
+    def view(self) -> InventoryView:
+        view = self._view
+        if view is None or view.owned:
+            view = self._view = InventoryView(self)
+        return view
+
+    def __getitem__(self, item: Item) -> Amount:
+        i = self._arrays.item_index.get(item)
+        if i is None:
+            return 0
+        return int(self._arrays.inventories[self._index, i])
+
+    def get(self, item: Item, default: Optional[Amount] = None) -> Optional[Amount]:  # type: ignore
+        if item not in self._arrays.item_index:
+            return default
+        return self[item]
+
+    def __setitem__(self, item: Item, amount: Amount) -> None:
+        if self._view is not None:
+            self._view.detach()
+            self._view = None
+        self._arrays.inventories[self._index, self._arrays.item_index[item]] = amount
+
+    def __delitem__(self, item: Item) -> None:
+        self[item] = 0
+
+    def __contains__(self, item: object) -> bool:
+        i = self._arrays.item_index.get(item)  # type: ignore
+        return i is not None and bool(self._arrays.inventories[self._index, i])
+
+    def __iter__(self) -> Iterator[Item]:
+        items = self._arrays.items
+        row = self._arrays.inventories[self._index]
+        return (items[i] for i in np.flatnonzero(row).tolist())
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._arrays.inventories[self._index]))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+
+class CompactState:
+    """AgentContainer.State look-alike backed by AgentArrays."""
+
+    __slots__ = ("_arrays", "_index", "items")
+
+    def __init__(self, arrays: AgentArrays, index: int):
+        self._arrays = arrays
+        self._index = index
+        self.items = CompactInventory(arrays, index)
+
+    @property
+    def balance(self) -> Amount:
+        return int(self._arrays.balances[self._index])
+
+    @balance.setter
+    def balance(self, value: Amount) -> None:
+        self._arrays.balances[self._index] = value
+
+    @property
+    def command_fuel(self) -> Amount:
+        return int(self._arrays.command_fuel[self._index])
+
+    @command_fuel.setter
+    def command_fuel(self, value: Amount) -> None:
+        self._arrays.command_fuel[self._index] = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (CompactState, AgentContainer.State)):
+            return NotImplemented
+        return (self.command_fuel, self.balance, dict(self.items)) == (
+            other.command_fuel,
+            other.balance,
+            {item: amount for item, amount in other.items.items() if amount},
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(command_fuel={self.command_fuel}, "
+            f"balance={self.balance}, items={self.items!r})"
+        )
+
+
+@dataclass
+class CompactWorld(World):
+    """A World which keeps the state of all agents in AgentArrays."""
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.arrays = AgentArrays(self.known_items)
+
+    def new_agent_state(self) -> CompactState:  # type: ignore
+        index = self.arrays.add(
+            balance=self.balance_init,
+            command_fuel=self.command_fuel_init,
+            balance_increase=self.balance_increase,
+            command_fuel_increase=self.command_fuel_increase,
+        )
+        return CompactState(self.arrays, index)
+
+    def replenish_agents(self) -> None:
+        self.arrays.replenish()
+
+    def checkpoint_components(self) -> dict[str, Any]:
+        return {"arrays": self.arrays}
@@ -1,14 +1,59 @@
 from dataclasses import dataclass, field
-from typing import Iterable, Callable
+from typing import (
+    Any,
+    Awaitable,
+    Iterable,
+    Callable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Optional,
+    TYPE_CHECKING,
+    cast,
+)
+import asyncio
+import hashlib
+import inspect
 import logging
-import collections
-
-from smithg.agents import AgentFunc, Environment, Registry, global_agent_registry
-from smithg.datatypes import Item, Amount, BuyOffer, SellOffer, events, commands
+import random
+
+from smithg.agents import (
+    AgentFunc,
+    Environment,
+    Inventory,
+    Registry,
+    global_agent_registry,
+)
+from smithg.datatypes import (
+    Item,
+    ItemCatalog,
+    Amount,
+    CommandCost,
+    Price,
+    Recipe,
+    BuyOffer,
+    SellOffer,
+    events,
+    commands,
+)
+from smithg.engine import bus as engine_bus
 from smithg.engine import market as engine_market
+from smithg.engine.recipes import RecipeBook
+from smithg.engine.sandbox import SandboxedAgent
+
+if TYPE_CHECKING:
+    from smithg.engine.profiler import Profiler
+    from smithg.engine.replay import Recorder
+    from smithg.engine.checkpoint import Checkpointer
+    from smithg.engine.stopping import StopCondition
 
 _logger = logging.getLogger(__name__)
 
+# Reason of AgentFailed bus events for coroutine agents which missed step_deadline
+_MISSED_DEADLINE = "Missed the step deadline"
+# Seconds coroutines get to finish after being cancelled at the step deadline
+_CANCEL_GRACE = 0.1
+
 
 @dataclass(slots=True, frozen=True)  # type: ignore
 class AgentContainer:
@@ -16,9 +61,19 @@ class AgentContainer:
     class State:
         command_fuel: int = 0
         balance: Amount = 0
-        items: dict[Item, Amount] = field(
-            default_factory=lambda: collections.defaultdict(int)
-        )
+        items: Inventory = field(default_factory=Inventory)
+
+        def __post_init__(self):
+            if not isinstance(self.items, Inventory):
+                self.items = Inventory(self.items)
+
+    @dataclass
+    class DeltaState:
+        """What an agent with a delta environment was told so far."""
+
+        step: int = -1
+        known_items: frozenset[Item] = frozenset()
+        inventory: dict[Item, Amount] = field(default_factory=dict)
 
     agent_func: AgentFunc
     agent_name: str
@@ -28,11 +83,43 @@ class AgentContainer:
     balance_increase: Amount = 0
     command_fuel_increase: Amount = 25  # Fuel generation every round
     work_to_money: int = 1
+    # Set for agents which get delta events, see deliver_deltas
+    delta: Optional["AgentContainer.DeltaState"] = None
+    # Set for the members of a batched agent, see smithg.engine.batched
+    batch: Optional[Any] = None
+
+
+class MarketView(NamedTuple):
+    """
+    The market and world part of the Environment.
+
+    It is built once per step and shared read-only by all agents called in that step.
+    """
+
+    known_items: frozenset[Item]
+    buy_offers: frozenset[BuyOffer]
+    sell_offers: frozenset[SellOffer]
+    recipes: Mapping[str, Recipe]
+    production_costs: Mapping[Item, Price]
+
+
+class StepSnapshot(NamedTuple):
+    """
+    Compact state of all agents after a step, in the order of the world's agents.
+
+    trades counts the trade receipts waiting in the event queue of every agent.
+    """
+
+    step: int
+    balances: tuple[Amount, ...]
+    command_fuel: tuple[Amount, ...]
+    item_totals: tuple[Amount, ...]
+    trades: tuple[int, ...]
 
 
 @dataclass
 class World:
-    known_items: list[Item]
+    known_items: ItemCatalog
     market: engine_market.Market = field(default_factory=engine_market.Market)
     player_agent_containers: list[AgentContainer] = field(default_factory=list)
 
@@ -41,6 +128,68 @@ class World:
     balance_increase: Amount = 0
     command_fuel_init: Amount = 100
     command_fuel_increase: Amount = 25
+    # Command fuel of BuyItem and SellItem, which agents see in Environment.trade_cost
+    trade_cost: CommandCost = commands.TRADE_COST
+
+    # Compiled into a RecipeBook when the world is created
+    recipes: Iterable[Recipe] = ()
+    base_costs: Optional[Mapping[Item, Price]] = None
+
+    # When set, agents run in worker processes with this many seconds per step
+    time_budget: Optional[float] = None
+    # Agents with a seed method are seeded from this when they are added
+    seed: Optional[int] = None
+    # Seconds coroutine agents have to finish in every step, None waits forever
+    step_deadline: Optional[float] = None
+    # Records timings when set, see smithg.engine.profiler
+    profiler: Optional["Profiler"] = None
+    # Writes a replay log when set, see smithg.engine.replay
+    recorder: Optional["Recorder"] = None
+    # Observers of engine events, see subscribe and smithg.engine.bus
+    bus: Optional[engine_bus.EventBus] = None
+    # Number of steps simulated so far
+    step_count: int = field(default=0, init=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _checkpointer: Optional["Checkpointer"] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # Offers of the last step delta events were computed for, see offer_changes
+    _offers: Optional[tuple[int, frozenset, frozenset, events.OffersChanged]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        if not isinstance(self.known_items, ItemCatalog):
+            self.known_items = ItemCatalog(self.known_items)
+        self.recipe_book = RecipeBook(
+            self.recipes,
+            self.known_items,
+            base_costs=self.base_costs,
+            fuel_price=self.work_to_money,
+        )
+        self._subscribe_logging()
+
+    def _subscribe_logging(self) -> None:
+        # Engine logs are observers, so they cost nothing unless enabled
+        level = _logger.getEffectiveLevel()
+        if level <= logging.INFO:
+            if self.bus is None:
+                self.bus = engine_bus.EventBus()
+            engine_bus.subscribe_logging(self.bus, level)
+
+    def subscribe(self, event_type: type, observer: engine_bus.Observer) -> None:
+        """Call observer with every event of event_type, see smithg.engine.bus."""
+        if self.bus is None:
+            self.bus = engine_bus.EventBus()
+        self.bus.subscribe(event_type, observer)
+
+    def unsubscribe(self, event_type: type, observer: engine_bus.Observer) -> None:
+        if self.bus is not None:
+            self.bus.unsubscribe(event_type, observer)
+            if not self.bus:
+                self.bus = None
 
     def add_agents_from_registry(self, registry: Registry) -> None:
         for agent_func, name in registry.agents:
@@ -49,49 +198,341 @@ class World:
     def add_agent(self, agent_func: AgentFunc, name: str = None) -> None:
         if not name:
             name = agent_func.__name__
+        if self.seed is not None:
+            seed_agent(agent_func, self.seed, name)
+        # Agents which stand for several agents add their members themselves
+        add_to_world = getattr(agent_func, "add_to_world", None)
+        if add_to_world is not None:
+            add_to_world(self, name)
+            return
+        delta = None
+        if getattr(agent_func, "delta_environment", False):
+            delta = AgentContainer.DeltaState()
+        if self.time_budget is not None:
+            agent_func = SandboxedAgent(agent_func, time_budget=self.time_budget)
 
         self.player_agent_containers.append(
-            AgentContainer(
-                agent_func=agent_func,
-                agent_name=name,
-                state=AgentContainer.State(
-                    command_fuel=self.command_fuel_init, balance=self.balance_init
-                ),
-                command_fuel_increase=self.command_fuel_increase,
-                balance_increase=self.balance_increase,
-                work_to_money=self.work_to_money,
-            )
+            self.new_container(agent_func, name, delta=delta)
+        )
+
+    def new_container(
+        self, agent_func: AgentFunc, name: str, **kwargs: Any
+    ) -> AgentContainer:
+        """Create the container of a new agent, kwargs are passed to AgentContainer."""
+        return AgentContainer(
+            agent_func=agent_func,
+            agent_name=name,
+            state=self.new_agent_state(),
+            command_fuel_increase=self.command_fuel_increase,
+            balance_increase=self.balance_increase,
+            work_to_money=self.work_to_money,
+            **kwargs,
         )
 
+    def new_agent_state(self) -> AgentContainer.State:
+        return AgentContainer.State(
+            command_fuel=self.command_fuel_init, balance=self.balance_init
+        )
+
+    def close(self) -> None:
+        """Stop sandboxed agents, the event loop and the market, flush the recorder."""
+        for cont in self.player_agent_containers:
+            if isinstance(cont.agent_func, SandboxedAgent):
+                cont.agent_func.close()
+        self.market.close()
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+        if self.recorder is not None:
+            self.recorder.close()
+        if self._checkpointer is not None:
+            self._checkpointer.close()
+
+    def checkpoint(self, path: str) -> int:
+        """
+        Save the world to path and return the number of bytes written.
+
+        Repeated checkpoints to the same path only append what changed since the
+        previous one, see smithg.engine.checkpoint.
+        """
+        from smithg.engine.checkpoint import Checkpointer
+
+        if self._checkpointer is None or self._checkpointer.path != path:
+            if self._checkpointer is not None:
+                self._checkpointer.close()
+            self._checkpointer = Checkpointer(path)
+        return self._checkpointer.write(self)
+
+    @classmethod
+    def restore(cls, path: str) -> "World":
+        """Load the world of the last complete checkpoint in path."""
+        from smithg.engine.checkpoint import restore
+
+        return restore(path)
+
+    def checkpoint_components(self) -> dict[str, Any]:
+        """Objects shared by agent states, which are checkpointed separately."""
+        return {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Not part of the simulation, and not picklable
+        state.update(
+            _loop=None, _checkpointer=None, profiler=None, recorder=None, bus=None
+        )
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        # Observers are not saved, but the logs follow the logging configuration
+        self._subscribe_logging()
+
     # Simulate a run with the given number of steps
-    def simulate(self, steps=1000) -> list[AgentContainer]:
-        for s in range(steps):
-            self.step(s)
+    def simulate(
+        self,
+        steps=1000,
+        checkpoint: Optional[str] = None,
+        checkpoint_every: int = 0,
+        stop: Iterable["StopCondition"] = (),
+    ) -> list[AgentContainer]:
+        """
+        Simulate the given number of steps.
+
+        With checkpoint and checkpoint_every set, the world is checkpointed to the
+        given path every checkpoint_every steps. The simulation ends early once any of
+        the stop conditions is met, see smithg.engine.stopping.
+        """
+        for _ in self._run_steps(steps, checkpoint, checkpoint_every, stop):
+            pass
 
         return self.player_agent_containers
 
+    def iter_steps(
+        self,
+        steps=1000,
+        checkpoint: Optional[str] = None,
+        checkpoint_every: int = 0,
+        stop: Iterable["StopCondition"] = (),
+    ) -> Iterator[StepSnapshot]:
+        """
+        Simulate like simulate, yielding a snapshot after every step.
+
+        Steps are only simulated as the snapshots are consumed.
+        """
+        for _ in self._run_steps(steps, checkpoint, checkpoint_every, stop):
+            yield self.snapshot()
+
+    def _run_steps(
+        self,
+        steps: int,
+        checkpoint: Optional[str],
+        checkpoint_every: int,
+        stop: Iterable["StopCondition"],
+    ) -> Iterator[None]:
+        stop = tuple(stop)
+        for _ in range(steps):
+            self.step(self.step_count)
+            if checkpoint and checkpoint_every:
+                if self.step_count % checkpoint_every == 0:
+                    self.checkpoint(checkpoint)
+            yield
+            if stop:
+                # Every condition sees every step, they may keep state
+                met = [condition for condition in stop if condition(self)]
+                if met:
+                    _logger.info("Stopping after step %d: %s", self.step_count, met)
+                    return
+
+    def snapshot(self) -> StepSnapshot:
+        """Return the state of all agents as of the last step."""
+        states = [cont.state for cont in self.player_agent_containers]
+        return StepSnapshot(
+            step=self.step_count,
+            balances=tuple(state.balance for state in states),
+            command_fuel=tuple(state.command_fuel for state in states),
+            item_totals=tuple(sum(state.items.values()) for state in states),
+            trades=tuple(
+                sum(isinstance(e, events.TradeReceipt) for e in cont.events_queue)
+                for cont in self.player_agent_containers
+            ),
+        )
+
     def process_step(self) -> None:
         self.market.tick()
 
+    def market_view(self) -> MarketView:
+        trades = self.market.trades
+        return MarketView(
+            known_items=self.known_items.frozen(),
+            buy_offers=trades.buy_offer_set(),
+            sell_offers=trades.sell_offer_set(),
+            recipes=self.recipe_book.recipes,
+            production_costs=self.recipe_book.production_costs,
+        )
+
+    def offer_changes(self, market_view: MarketView) -> Optional[events.OffersChanged]:
+        """
+        Return how the offers of market_view differ from those of the previous step.
+
+        Returns None if the offers of the previous step are not known. The result is
+        computed once per step and shared by all agents.
+        """
+        offers = self._offers
+        if offers is not None and offers[0] == self.step_count:
+            return offers[3]
+        changes = None
+        if offers is not None and offers[0] == self.step_count - 1:
+            _, buys, sells, _ = offers
+            changes = events.OffersChanged(
+                added_buy_offers=market_view.buy_offers - buys,
+                withdrawn_buy_offers=buys - market_view.buy_offers,
+                added_sell_offers=market_view.sell_offers - sells,
+                withdrawn_sell_offers=sells - market_view.sell_offers,
+            )
+        self._offers = (
+            self.step_count,
+            market_view.buy_offers,
+            market_view.sell_offers,
+            changes,
+        )
+        return changes
+
+    def replenish_agents(self) -> None:
+        """Create some fuel for new commands, and pay the basic income."""
+        for cont in self.player_agent_containers:
+            cont.state.command_fuel += cont.command_fuel_increase
+            cont.state.balance += cont.balance_increase
+
     def step(self, s: int) -> None:
-        self.process_step()
+        """
+        Tick the market and call every agent once.
+
+        Coroutine agents run concurrently on the event loop of the world, so a step
+        takes as long as its slowest coroutine instead of the sum of all of them.
+        Coroutines which miss the step_deadline are cancelled; they get no commands
+        executed and a StepTimeout event. Commands are always applied in agent order,
+        which keeps simulations reproducible.
+        """
+        self.step_count += 1
+        if self.bus is not None:
+            self.bus.emit(engine_bus.TickStarted, self, self.step_count)
+        if self.profiler is not None:
+            self.profiler.step(self, s)
+            return
 
+        self.process_step()
+        self.replenish_agents()
+        self.run_agents(self.market_view())
+
+    def run_agents(
+        self,
+        market_view: MarketView,
+        call: Optional[Callable[..., Any]] = None,
+        execute: Optional[Callable[..., None]] = None,
+    ) -> None:
+        """
+        Call all agents and execute their commands.
+
+        call and execute replace call_agent and execute_commands, for example to
+        instrument them.
+        """
+        call = call or call_agent
+        execute = execute or execute_commands
+        recorder = self.recorder
+        if recorder is not None:
+            execute = recorder.begin_step(self, market_view, execute)
+
+        # Commands are applied in agent order. Once the first coroutine agent shows
+        # up, all later agents wait until the coroutines are done.
+        deferred: list[tuple[AgentContainer, Any]] = []
+        bus = self.bus
         for cont in self.player_agent_containers:
-            execute_agent(cont, self)
+            if cont.batch is not None:
+                cont.batch.run(self, cont, market_view, execute)
+                continue
+            if bus is not None:
+                bus.emit(engine_bus.AgentCalled, cont, self.step_count)
+            queued_commands = call(cont, self, market_view)
+            if bus is not None and isinstance(cont.agent_func, SandboxedAgent):
+                for reason in cont.agent_func.failures:
+                    bus.emit(engine_bus.AgentFailed, cont, reason)
+            if not deferred and not inspect.isawaitable(queued_commands):
+                cont.events_queue.clear()
+                execute(cont, self, queued_commands)
+            else:
+                deferred.append((cont, queued_commands))
+
+        if deferred:
+            self.execute_deferred(deferred, execute)
+        if recorder is not None:
+            recorder.end_step()
+
+    def execute_deferred(
+        self,
+        deferred: list[tuple[AgentContainer, Any]],
+        execute: Optional[Callable[..., None]] = None,
+    ) -> None:
+        """Run all coroutine agents concurrently, then apply commands in order."""
+        execute = execute or execute_commands
+        awaitables = [q for _, q in deferred if inspect.isawaitable(q)]
+        results = iter(self.run_concurrently(awaitables))
+
+        queued = [
+            next(results) if inspect.isawaitable(q) else q for _, q in deferred
+        ]
+        # Coroutines only ran now, so the events are cleared after they were seen
+        for cont, _ in deferred:
+            cont.events_queue.clear()
+        for (cont, _), queued_commands in zip(deferred, queued):
+            if queued_commands is None:
+                cont.events_queue.append(events.StepTimeout(self.step_deadline or 0))
+                if self.bus is not None:
+                    self.bus.emit(engine_bus.AgentFailed, cont, _MISSED_DEADLINE)
+                continue
+            execute(cont, self, queued_commands)
+
+    def run_concurrently(self, awaitables: list[Awaitable]) -> list[Optional[Any]]:
+        """
+        Await all awaitables on the event loop of this world, until step_deadline.
+
+        Returns their results in order, None for those which missed the deadline.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(_gather(awaitables, self.step_deadline))
 
 
 def make_world(
     known_items: Iterable[str],
     player_agents: Iterable[tuple[AgentFunc, str]] = None,
     agent_registry: Registry = global_agent_registry,
+    seed: Optional[int] = None,
+    market: Optional[engine_market.Market] = None,
+    world_cls: type[World] = World,
+    recipes: Iterable[Recipe] = (),
+    time_budget: Optional[float] = None,
+    settings: Optional[Mapping[str, Any]] = None,
 ) -> World:
+    """
+    Create a world with the given agents.
+
+    settings: Further World fields, for example balance_init or work_to_money.
+    """
     if not player_agents:
         player_agents = []
 
-    known_items = list(known_items)
-    world = World(
+    known_items = ItemCatalog(known_items)
+    if market is None:
+        market = engine_market.RandomMarket(
+            rand=random.Random(seed), known_items=known_items
+        )
+    world = world_cls(
         known_items=known_items,
-        market=engine_market.RandomMarket(known_items=known_items),
+        market=market,
+        recipes=recipes,
+        seed=seed,
+        time_budget=time_budget,
+        **(settings or {}),
     )
 
     world.add_agents_from_registry(agent_registry)
@@ -102,103 +543,386 @@ def make_world(
     return world
 
 
-def execute_agent(cont: AgentContainer, world: World) -> None:
-    # Create some fuel for new commands
-    cont.state.command_fuel += cont.command_fuel_increase
-    cont.state.balance += cont.balance_increase
+def agent_seed(seed: int, name: str) -> int:
+    """Derive the seed of an agent, independent of the other agents in the world."""
+    digest = hashlib.sha256(f"{seed}:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def seed_agent(agent_func: AgentFunc, seed: int, name: str) -> None:
+    """Seed an agent which has a seed method, see Agent.seed."""
+    seed_method = getattr(agent_func, "seed", None)
+    if callable(seed_method):
+        seed_method(agent_seed(seed, name))
+
+
+async def _gather(
+    awaitables: list[Awaitable], timeout: Optional[float]
+) -> list[Optional[Any]]:
+    tasks = [asyncio.ensure_future(a) for a in awaitables]
+    if not tasks:
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        # Coroutines which ignore the cancellation are abandoned, they must not hold
+        # up the step. They keep running on the loop until they finish or it closes
+        _, running = await asyncio.wait(pending, timeout=_CANCEL_GRACE)
+        if running:
+            _logger.warning(
+                "Abandoning %d coroutine agents which ignored cancellation", len(running)
+            )
+    return [None if task in pending else task.result() for task in tasks]
+
 
-    # Tell the agent about its environment.
-    env = Environment(
-        known_items=frozenset(world.known_items),
-        buy_offers=world.market.trades.buy_offer_set(),
-        sell_offers=world.market.trades.sell_offer_set(),
+def execute_agent(
+    cont: AgentContainer, world: World, market_view: Optional[MarketView] = None
+) -> None:
+    queued_commands = call_agent(cont, world, market_view)
+    if inspect.isawaitable(queued_commands):
+        queued_commands = world.run_concurrently([queued_commands])[0]
+    cont.events_queue.clear()
+    if queued_commands is None:
+        cont.events_queue.append(events.StepTimeout(world.step_deadline or 0))
+        if world.bus is not None:
+            world.bus.emit(engine_bus.AgentFailed, cont, _MISSED_DEADLINE)
+        return
+    execute_commands(cont, world, queued_commands)
+
+
+def call_agent(
+    cont: AgentContainer, world: World, market_view: Optional[MarketView] = None
+) -> Any:
+    """
+    Call the agent with its environment and events.
+
+    Returns the command list, or an awaitable for it if the agent is a coroutine.
+    """
+    env = build_environment(cont, world, market_view)
+    return cont.agent_func(env, cont.events_queue)  # type: ignore # https://github.com/python/mypy/issues/5485
+
+
+def build_environment(
+    cont: AgentContainer, world: World, market_view: Optional[MarketView] = None
+) -> Environment:
+    """Tell the agent about its environment."""
+    if market_view is None:
+        market_view = world.market_view()
+    if cont.delta is not None:
+        deliver_deltas(cont, world, market_view)
+
+    return Environment(
+        known_items=market_view.known_items,
+        buy_offers=market_view.buy_offers,
+        sell_offers=market_view.sell_offers,
         balance=cont.state.balance,
         command_fuel=cont.state.command_fuel,
-        inventory=collections.defaultdict(
-            int, {item: amount for item, amount in cont.state.items.items()}
-        ),
+        inventory=cont.state.items.view(),
+        recipes=market_view.recipes,
+        production_costs=market_view.production_costs,
+        trade_cost=world.trade_cost,
     )
 
-    _logger.debug("Calling agent with events: %s", cont.events_queue)
-    queued_commands = cont.agent_func(env, cont.events_queue)  # type: ignore # https://github.com/python/mypy/issues/5485
-    _logger.debug("Agent finished and is executing commands %s", queued_commands)
 
+# Events after which an agent may have missed deltas it was sent
+_RESYNC_EVENTS = (events.StepTimeout, events.AgentFailed)
+
+
+def deliver_deltas(cont: AgentContainer, world: World, market_view: MarketView) -> None:
+    """
+    Put the changes since its previous call in front of the events of a delta agent.
+
+    The agent gets a full MarketSnapshot instead if it was not called in the previous
+    step, if the known items changed, or if it may have lost events of its previous
+    call. Calling this again in the same step adds nothing.
+    """
+    delta = cast(AgentContainer.DeltaState, cont.delta)
+    if delta.step == world.step_count:
+        return
+    changes = world.offer_changes(market_view)
+    inventory = cont.state.items
+
+    deltas: list[events.Event] = []
+    if (
+        changes is None
+        or delta.step != world.step_count - 1
+        or delta.known_items is not market_view.known_items
+        or any(isinstance(evt, _RESYNC_EVENTS) for evt in cont.events_queue)
+    ):
+        delta.inventory = {item: n for item, n in inventory.items() if n}
+        deltas.append(
+            events.MarketSnapshot(
+                known_items=market_view.known_items,
+                buy_offers=market_view.buy_offers,
+                sell_offers=market_view.sell_offers,
+                inventory=dict(delta.inventory),
+            )
+        )
+    else:
+        if (
+            changes.added_buy_offers
+            or changes.withdrawn_buy_offers
+            or changes.added_sell_offers
+            or changes.withdrawn_sell_offers
+        ):
+            deltas.append(changes)
+        previous = delta.inventory
+        amounts = {
+            item: n for item, n in inventory.items() if previous.get(item, 0) != n
+        }
+        amounts.update((item, 0) for item in previous if not inventory.get(item, 0))
+        if amounts:
+            deltas.append(events.InventoryChanged(amounts))
+            for item, n in amounts.items():
+                if n:
+                    previous[item] = n
+                else:
+                    del previous[item]
+
+    delta.step = world.step_count
+    delta.known_items = market_view.known_items
+    cont.events_queue[:0] = deltas
+
+
+# Executes a command of one type, after its fuel was paid
+CommandHandler = Callable[[AgentContainer, World, Any], None]
+
+# Handlers by exact command type. Commands of other types are rejected.
+COMMAND_HANDLERS: dict[type[commands.Command], CommandHandler] = {}
+
+
+def command_handler(
+    command_type: type[commands.Command],
+) -> Callable[[CommandHandler], CommandHandler]:
+    """
+    Register the decorated function as the handler of command_type.
+
+    This is how new commands are added: subclass commands.Command and register a
+    handler for it. Subclasses of registered commands need their own handler.
+    """
+
+    def register(handler: CommandHandler) -> CommandHandler:
+        COMMAND_HANDLERS[command_type] = handler
+        return handler
+
+    return register
+
+
+def prepare_commands(
+    cont: AgentContainer,
+    queued_commands: list[commands.Command],
+    trade_cost: CommandCost = commands.TRADE_COST,
+) -> tuple[list[tuple[CommandHandler, commands.Command]], int]:
+    """
+    Look up the handlers of a command list and its total fuel cost.
+
+    Trade commands cost trade_cost, the trade_cost of the world.
+
+    Raises InvalidAgentState, before anything is executed, if the list is not a list,
+    contains something which is not a registered command, or costs more fuel than the
+    agent has.
+    """
     if not isinstance(queued_commands, list):
         raise InvalidAgentState(
             f"Returned command list is not a list. Found {type(queued_commands)}"
         )
-    cont.events_queue.clear()
-
-    for cmd in queued_commands:
-        if not isinstance(cmd, commands.Command):
-            raise InvalidAgentState(
-                f"Returned command is not a subclass of Command. Found {type(cmd)}"
-            )
 
-        # TODO: Make sure the command is of a subclass within commands and not something fishy the agent gave us
-        execute_command(cont, world, cmd)
+    handlers = COMMAND_HANDLERS
+    try:
+        prepared = [(handlers[type(cmd)], cmd) for cmd in queued_commands]
+    except KeyError:
+        for cmd in queued_commands:
+            if not isinstance(cmd, commands.Command):
+                raise InvalidAgentState(
+                    f"Returned command is not a subclass of Command. Found {type(cmd)}"
+                ) from None
+            if type(cmd) not in handlers:
+                raise InvalidAgentState(
+                    f"Returned command has no handler. Found {type(cmd)}"
+                ) from None
+        raise
+
+    fuel_cost = commands.fuel_cost
+    cost = sum(fuel_cost(cmd, trade_cost) for cmd in queued_commands)
+    if cost > cont.state.command_fuel:
+        fuel = cont.state.command_fuel
+        for cmd in queued_commands:
+            fuel -= fuel_cost(cmd, trade_cost)
+            if fuel < 0:
+                raise InvalidAgentState(f"Agent ran out of fuel with command {cmd}")
+    return prepared, cost
+
+
+def execute_commands(
+    cont: AgentContainer, world: World, queued_commands: list[commands.Command]
+) -> None:
+    """Execute a command list, which is validated as a whole first."""
+    bus = world.bus
+    try:
+        prepared, cost = prepare_commands(cont, queued_commands, world.trade_cost)
+        cont.state.command_fuel -= cost
+        if bus is None or not bus.listens(engine_bus.CommandExecuted):
+            for handler, cmd in prepared:
+                handler(cont, world, cmd)
+        else:
+            for handler, cmd in prepared:
+                handler(cont, world, cmd)
+                bus.emit(engine_bus.CommandExecuted, cont, cmd)
+    except InvalidAgentState as e:
+        if bus is not None:
+            bus.emit(engine_bus.AgentFailed, cont, str(e))
+        raise
 
 
 def execute_command(cont: AgentContainer, world: World, cmd: commands.Command) -> None:
-    cont.state.command_fuel -= cmd.cost
+    handler = COMMAND_HANDLERS.get(type(cmd))
+    if handler is None:
+        raise InvalidAgentState(f"Returned command has no handler. Found {type(cmd)}")
+    cont.state.command_fuel -= commands.fuel_cost(cmd, world.trade_cost)
     if cont.state.command_fuel < 0:
         raise InvalidAgentState(f"Agent ran out of fuel with command {cmd}")
+    handler(cont, world, cmd)
 
-    if isinstance(cmd, commands.Work):
-        # Fuel has already been paid. Now it's payday!
-        cont.state.balance += cont.work_to_money * cmd.cost
-    if isinstance(cmd, commands.BuyItem):
-        # Check if the world has an open SellOffer for this buy
-        item = cmd.item
-        if item not in world.known_items:
-            raise InvalidAgentState(
-                f"Agent provided invalid buy command for non-existent item {item}"
+
+@command_handler(commands.Work)
+def execute_work(cont: AgentContainer, world: World, cmd: commands.Work) -> None:
+    # Fuel has already been paid. Now it's payday!
+    cont.state.balance += cont.work_to_money * cmd.cost
+
+
+@command_handler(commands.BuyItem)
+def execute_buy(cont: AgentContainer, world: World, cmd: commands.BuyItem) -> None:
+    item = cmd.item
+    if item not in world.known_items:
+        raise InvalidAgentState(
+            f"Agent provided invalid buy command for non-existent item {item}"
+        )
+    if cmd.max_amount <= 0 or cmd.max_price <= 0:
+        raise InvalidAgentState(
+            f"Agent tried to buy {cmd.max_amount} {item} for {cmd.max_price}"
+        )
+
+    result = world.market.buy(cont, item, cmd.max_amount, cmd.max_price)
+    for fill in result.fills:
+        cont.state.balance -= fill.amount * fill.price
+        cont.state.items[item] += fill.amount
+        cont.events_queue.append(events.BuyReceipt(item, fill.amount, fill.price))
+        if world.bus is not None:
+            world.bus.emit(
+                engine_bus.TradeFilled,
+                cont,
+                item,
+                fill.amount,
+                fill.price,
+                True,
+                fill.maker,
             )
+        if fill.maker is not None:
+            # The seller's items were reserved when the order was placed
+            maker = cast(AgentContainer, fill.maker)
+            maker.state.balance += fill.amount * fill.price
+            receipt: events.Event = events.SellReceipt(item, fill.amount, fill.price)
+            maker.events_queue.append(receipt)
+            if world.recorder is not None:
+                world.recorder.maker_event(maker, receipt)
+            if world.profiler is not None:
+                world.profiler.maker_event(maker, receipt)
+
+    if result.resting > 0:
+        cont.state.balance -= result.resting * cmd.max_price
+        cont.events_queue.append(
+            events.BuyOrderPlaced(item, result.resting, cmd.max_price)
+        )
 
-        sell = world.market.trades.find_sell(item)
-        if not sell:
-            _logger.info("Agent tried to buy an item that is not for sale.")
-            return
-        if sell.price > cmd.max_price:
-            _logger.info("Agent is not willing to pay that is necessary to buy.")
-            return
-        # Agent can buy
-        bought_amount = min(sell.amount, cmd.max_amount)
-        total_price = bought_amount * sell.price
-        cont.state.balance -= total_price
-        cont.state.items[item] += bought_amount
-
-        cont.events_queue.append(events.BuyReceipt(item, bought_amount, sell.price))
-        _logger.info(f"Agent bought {bought_amount} of {item} at {sell.price}")
-        return
-    if isinstance(cmd, commands.SellItem):
-        # Check if the world has an open BuyOffer for this buy
-        item = cmd.item
-        if item not in world.known_items:
-            raise InvalidAgentState(
-                f"Agent provided invalid buy command for non-existent item {item}"
+
+@command_handler(commands.SellItem)
+def execute_sell(cont: AgentContainer, world: World, cmd: commands.SellItem) -> None:
+    item = cmd.item
+    if item not in world.known_items:
+        raise InvalidAgentState(
+            f"Agent provided invalid buy command for non-existent item {item}"
+        )
+    if cmd.max_amount <= 0 or cmd.min_price <= 0:
+        raise InvalidAgentState(
+            f"Agent tried to sell {cmd.max_amount} {item} for {cmd.min_price}"
+        )
+    if world.market.resting_orders and cmd.max_amount > cont.state.items[item]:
+        raise InvalidAgentState(f"Agent is trying to sell more {item} thatn it has")
+
+    result = world.market.sell(cont, item, cmd.max_amount, cmd.min_price)
+    if sum(fill.amount for fill in result.fills) > cont.state.items[item]:
+        raise InvalidAgentState(f"Agent is trying to sell more {item} thatn it has")
+    for fill in result.fills:
+        cont.state.balance += fill.amount * fill.price
+        cont.state.items[item] -= fill.amount
+        cont.events_queue.append(events.SellReceipt(item, fill.amount, fill.price))
+        if world.bus is not None:
+            world.bus.emit(
+                engine_bus.TradeFilled,
+                cont,
+                item,
+                fill.amount,
+                fill.price,
+                False,
+                fill.maker,
             )
+        if fill.maker is not None:
+            # The buyer's funds were reserved when the order was placed
+            maker = cast(AgentContainer, fill.maker)
+            maker.state.items[item] += fill.amount
+            receipt = events.BuyReceipt(item, fill.amount, fill.price)
+            maker.events_queue.append(receipt)
+            if world.recorder is not None:
+                world.recorder.maker_event(maker, receipt)
+            if world.profiler is not None:
+                world.profiler.maker_event(maker, receipt)
+
+    if result.resting > 0:
+        cont.state.items[item] -= result.resting
+        cont.events_queue.append(
+            events.SellOrderPlaced(item, result.resting, cmd.min_price)
+        )
 
-        buy = world.market.trades.find_buy(item)
-        if not buy:
-            _logger.info("Agent tried to sell an item that nobody is buying.")
-            return
-        if buy.price < cmd.min_price:
-            _logger.info(
-                "Agent is not willing to sell for the price that the item is wanted for."
+
+@command_handler(commands.Forge)
+def execute_forge(cont: AgentContainer, world: World, cmd: commands.Forge) -> None:
+    book = world.recipe_book
+    recipe_id = book.ids.get(cmd.recipe)
+    if recipe_id is None:
+        raise InvalidAgentState(f"Agent tried to forge unknown recipe {cmd.recipe}")
+    if cmd.times < 1:
+        raise InvalidAgentState(f"Agent tried to forge {cmd.times} times")
+
+    items = cont.state.items
+    for item, amount in book.inputs[recipe_id]:
+        if items[item] < amount * cmd.times:
+            raise InvalidAgentState(
+                f"Agent does not have enough {item} to forge {cmd.recipe}"
+            )
+    for item, amount in book.inputs[recipe_id]:
+        items[item] -= amount * cmd.times
+    for item, amount in book.outputs[recipe_id]:
+        items[item] += amount * cmd.times
+
+    cont.events_queue.append(events.ForgeReceipt(cmd.recipe, cmd.times))
+
+
+@command_handler(commands.CancelOrders)
+def execute_cancel(
+    cont: AgentContainer, world: World, cmd: commands.CancelOrders
+) -> None:
+    for order in world.market.cancel(cont, cmd.item):
+        if order.is_buy:
+            cont.state.balance += order.amount * order.price
+            cont.events_queue.append(
+                events.BuyOrderCancelled(order.item, order.amount, order.price)
+            )
+        else:
+            cont.state.items[order.item] += order.amount
+            cont.events_queue.append(
+                events.SellOrderCancelled(order.item, order.amount, order.price)
             )
-            return
-        # Agent can sell
-        bought_amount = min(buy.amount, cmd.max_amount)
-        if bought_amount > cont.state.items[item]:
-            raise InvalidAgentState(f"Agent is trying to sell more {item} thatn it has")
-        total_price = bought_amount * buy.price
-        cont.state.balance += total_price
-        cont.state.items[item] -= bought_amount
-
-        cont.events_queue.append(events.SellReceipt(item, bought_amount, buy.price))
-        _logger.info(f"Agent sold {bought_amount} of {item} at {buy.price}")
-        return
 
 
 class InvalidAgentState(RuntimeError):
@@ -1,11 +1,48 @@
-from typing import Optional, Iterable, Callable
+from typing import Optional, Iterable, Callable, NamedTuple
 from dataclasses import dataclass, field
 
 import collections
+import functools
+import logging
 import random
 
 from smithg.datatypes import Item, Amount, Price, BuyOffer, SellOffer, TradeOffer
 
+_logger = logging.getLogger(__name__)
+
+
+class Fill(NamedTuple):
+    """
+    A (partial) execution of an order.
+
+    maker: Owner of the resting order the fill was matched against, or None if the
+      counterparty is the market itself.
+    """
+
+    item: Item
+    amount: Amount
+    price: Price
+    maker: Optional[object] = None
+
+
+class OrderResult(NamedTuple):
+    """
+    Result of an order sent to the market.
+
+    fills: Executed parts of the order, in execution order.
+    resting: Amount that was not filled and now rests in the market as a limit order.
+    """
+
+    fills: tuple[Fill, ...] = ()
+    resting: Amount = 0
+
+
+class RestingOrder(NamedTuple):
+    item: Item
+    amount: Amount
+    price: Price
+    is_buy: bool
+
 
 @dataclass
 class Trades:
@@ -25,33 +62,78 @@ class Trades:
             return None
 
     def buy_offer_set(self) -> frozenset[BuyOffer]:
-        return frozenset(BuyOffer(*b) for b in self.buys.values())
+        return frozenset(self.buys.values())
 
     def sell_offer_set(self) -> frozenset[SellOffer]:
-        return frozenset(SellOffer(*s) for s in self.sells.values())
+        return frozenset(self.sells.values())
 
 
 @dataclass
 class Market:
+    """
+    A market which fills agent orders against the current trade offers.
+
+    The base market takes whatever is in self.trades and never keeps any orders: the
+    unfilled part of an order is dropped.
+    """
+
     trades: Trades = field(default_factory=Trades)
 
+    # Markets with resting orders escrow funds and items of unfilled orders
+    resting_orders = False
+
     def tick(self) -> None:
         pass
 
+    def buy(
+        self, owner: object, item: Item, max_amount: Amount, max_price: Price
+    ) -> OrderResult:
+        sell = self.trades.find_sell(item)
+        if not sell:
+            _logger.info("Agent tried to buy an item that is not for sale.")
+            return OrderResult()
+        if sell.price > max_price:
+            _logger.info("Agent is not willing to pay that is necessary to buy.")
+            return OrderResult()
+        return OrderResult((Fill(item, min(sell.amount, max_amount), sell.price),))
+
+    def sell(
+        self, owner: object, item: Item, max_amount: Amount, min_price: Price
+    ) -> OrderResult:
+        buy = self.trades.find_buy(item)
+        if not buy:
+            _logger.info("Agent tried to sell an item that nobody is buying.")
+            return OrderResult()
+        if buy.price < min_price:
+            _logger.info(
+                "Agent is not willing to sell for the price that the item is wanted for."
+            )
+            return OrderResult()
+        return OrderResult((Fill(item, min(buy.amount, max_amount), buy.price),))
+
+    def cancel(self, owner: object, item: Item) -> list[RestingOrder]:
+        """Cancel all resting orders of owner for item and return what was cancelled."""
+        return []
+
+    def close(self) -> None:
+        """Release the resources of the market, when its world is closed."""
+
 
 @dataclass
 class RandomMarket(Market):
     rand: random.Random = field(default_factory=random.Random)
     known_items: list[Item] = field(default_factory=list)
-    item_distributions: dict[Item, tuple[Callable[[], Amount], Callable[[], Price]]] = field(default_factory=dict)
+    item_distributions: dict[Item, tuple[Callable[[], Price], Callable[[], Amount]]] = field(default_factory=dict)
 
     def __post_init__(self):
         for item in self.known_items:
             mid_price = self.rand.randint(2, 9999)
             mid_amount = self.rand.randint(-999, 999)
+            # Every item has its own distribution. Partials, unlike lambdas, can be
+            # pickled, which makes the market checkpointable.
             self.item_distributions[item] = (
-                lambda: int(self.rand.triangular(1, 10000, mid_price)),
-                lambda: int(self.rand.triangular(-1000, 1000, mid_amount)),
+                functools.partial(self.rand.triangular, 1, 10000, mid_price),
+                functools.partial(self.rand.triangular, -1000, 1000, mid_amount),
             )
 
     def tick(self) -> None:
@@ -59,8 +141,8 @@ class RandomMarket(Market):
         self.trades.sells.clear()
 
         for item, distrs in self.item_distributions.items():
-            price = distrs[0]()
-            amount = distrs[1]()
+            price = int(distrs[0]())
+            amount = int(distrs[1]())
 
             if amount < 0:
                 # Selling
@@ -0,0 +1,63 @@
+"""
+Streaming of per-step metrics.
+
+Snapshots from World.iter_steps are written as one row per agent and step, either as
+JSON lines (ndjson) or CSV, while the simulation runs. Only one step is held in
+memory at a time, so runs of any length can be piped into other tools.
+"""
+
+from typing import Iterable, TextIO
+import csv
+import json
+
+from smithg.engine.engine import StepSnapshot
+
+FIELDS = ("step", "agent_name", "balance", "command_fuel", "items", "trades")
+FORMATS = ("ndjson", "csv")
+
+
+def rows(names: list[str], snapshots: Iterable[StepSnapshot]) -> Iterable[tuple]:
+    """Flatten snapshots to one tuple of FIELDS per agent and step."""
+    for snapshot in snapshots:
+        for agent in zip(
+            names,
+            snapshot.balances,
+            snapshot.command_fuel,
+            snapshot.item_totals,
+            snapshot.trades,
+        ):
+            yield (snapshot.step, *agent)
+
+
+def write_metrics(
+    file: TextIO,
+    names: list[str],
+    snapshots: Iterable[StepSnapshot],
+    format: str = "ndjson",
+    flush_every: int = 100,
+) -> None:
+    """
+    Write the metrics of snapshots to file as they are produced.
+
+    The file is flushed every flush_every steps, so readers at the other end of a
+    pipe keep up with the simulation.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown metrics format {format}")
+    flush_rows = max(1, flush_every * len(names))
+    if format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        write = writer.writerow
+    else:
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+        def write(row: tuple) -> None:
+            file.write(dumps(dict(zip(FIELDS, row))))
+            file.write("\n")
+
+    for i, row in enumerate(rows(names, snapshots), 1):
+        write(row)
+        if i % flush_rows == 0:
+            file.flush()
+    file.flush()
@@ -0,0 +1,152 @@
+"""
+A vectorized drop-in replacement for RandomMarket.
+
+Prices and amounts for all items are drawn thousands of ticks at a time into NumPy
+arrays, so a tick is just a move to the next row. Offers are only turned into
+BuyOffer/SellOffer tuples when somebody asks for them.
+
+This module requires numpy (`pip install smithg[numpy]`).
+"""
+
+from typing import Iterable, Optional
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from smithg.datatypes import Item, ItemCatalog, BuyOffer, SellOffer
+from smithg.engine.market import Market, Trades
+
+
+class ArrayTrades(Trades):
+    """
+    Trades backed by one row of prices and amounts per item.
+
+    Positive amounts are buy offers, negative amounts are sell offers. Offer sets and
+    the buys/sells dicts are built lazily, at most once per row.
+    """
+
+    def __init__(self, items: Iterable[Item]):
+        self.items = ItemCatalog(items)
+        self.index = self.items.ids
+        self.prices = np.zeros(len(self.items), dtype=np.int32)
+        self.amounts = np.zeros(len(self.items), dtype=np.int32)
+        self._buy_offers: Optional[frozenset[BuyOffer]] = None
+        self._sell_offers: Optional[frozenset[SellOffer]] = None
+
+    def set_row(self, prices: np.ndarray, amounts: np.ndarray) -> None:
+        self.prices = prices
+        self.amounts = amounts
+        self._buy_offers = None
+        self._sell_offers = None
+
+    @property  # type: ignore
+    def buys(self) -> dict[Item, BuyOffer]:  # type: ignore
+        return {offer.item: offer for offer in self.buy_offer_set()}
+
+    @property  # type: ignore
+    def sells(self) -> dict[Item, SellOffer]:  # type: ignore
+        return {offer.item: offer for offer in self.sell_offer_set()}
+
+    def find_buy(self, item: Item) -> Optional[BuyOffer]:
+        i = self.index.get(item)
+        if i is None:
+            return None
+        amount = int(self.amounts[i])
+        if amount <= 0:
+            return None
+        return BuyOffer(item, amount, int(self.prices[i]))
+
+    def find_sell(self, item: Item) -> Optional[SellOffer]:
+        i = self.index.get(item)
+        if i is None:
+            return None
+        amount = int(self.amounts[i])
+        if amount >= 0:
+            return None
+        return SellOffer(item, -amount, int(self.prices[i]))
+
+    def buy_offer_set(self) -> frozenset[BuyOffer]:
+        if self._buy_offers is None:
+            idx = np.flatnonzero(self.amounts > 0)
+            items = self.items
+            self._buy_offers = frozenset(
+                BuyOffer(items[i], amount, price)
+                for i, amount, price in zip(
+                    idx.tolist(),
+                    self.amounts[idx].tolist(),
+                    self.prices[idx].tolist(),
+                )
+            )
+        return self._buy_offers
+
+    def sell_offer_set(self) -> frozenset[SellOffer]:
+        if self._sell_offers is None:
+            idx = np.flatnonzero(self.amounts < 0)
+            items = self.items
+            self._sell_offers = frozenset(
+                SellOffer(items[i], -amount, price)
+                for i, amount, price in zip(
+                    idx.tolist(),
+                    self.amounts[idx].tolist(),
+                    self.prices[idx].tolist(),
+                )
+            )
+        return self._sell_offers
+
+
+@dataclass
+class VectorizedRandomMarket(Market):
+    """
+    RandomMarket with block pregenerated offers.
+
+    Every item has a triangular price distribution on [1, 10000] and a triangular
+    amount distribution on [-1000, 1000], like in RandomMarket. The random streams
+    only depend on the seed, not on block_size, so changing the block size does not
+    change the simulation.
+
+    seed: Seed for the numpy random generator.
+    block_size: Maximal number of ticks generated at once.
+    max_block_elements: Upper bound for ticks * items in a block, to bound memory use
+      for large item catalogs.
+    """
+
+    known_items: list[Item] = field(default_factory=list)
+    seed: Optional[int] = None
+    block_size: int = 4096
+    max_block_elements: int = 1 << 22
+
+    def __post_init__(self):
+        self.trades = ArrayTrades(self.known_items)
+
+        mids, prices, amounts = np.random.SeedSequence(self.seed).spawn(3)
+        mid_rng = np.random.default_rng(mids)
+        n = len(self.known_items)
+        self.mid_prices = mid_rng.integers(2, 10000, size=n)
+        self.mid_amounts = mid_rng.integers(-999, 1000, size=n)
+        self._price_rng = np.random.default_rng(prices)
+        self._amount_rng = np.random.default_rng(amounts)
+
+        self._block_ticks = max(
+            1, min(self.block_size, self.max_block_elements // max(1, n))
+        )
+        self._prices = np.empty((0, n), dtype=np.int32)
+        self._amounts = np.empty((0, n), dtype=np.int32)
+        self._row = 0
+
+    def _generate_block(self) -> None:
+        shape = (self._block_ticks, len(self.known_items))
+        self._prices = self._price_rng.triangular(
+            1, self.mid_prices, 10000, size=shape
+        ).astype(np.int32)
+        self._amounts = self._amount_rng.triangular(
+            -1000, self.mid_amounts, 1000, size=shape
+        ).astype(np.int32)
+        self._row = 0
+
+    def tick(self) -> None:
+        if self._row >= len(self._prices):
+            self._generate_block()
+
+        trades: ArrayTrades = self.trades  # type: ignore
+        trades.set_row(self._prices[self._row], self._amounts[self._row])
+        self._row += 1
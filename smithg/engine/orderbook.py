@@ -0,0 +1,213 @@
+"""
+A price-time-priority order book market.
+
+Every item has a book of bids and asks. Orders are matched against the best price
+first, and orders with the same price in the order they arrived. Unfilled parts of
+agent orders rest in the book as limit orders until they are filled by a later order
+or cancelled.
+
+Books are binary heaps with lazy deletion, so inserting and matching an order costs
+O(log n) in the number of resting orders. The best bid and ask of every item are kept
+up to date in self.trades, which is what agents see in their Environment.
+"""
+
+from typing import Optional
+from dataclasses import dataclass, field
+import heapq
+
+from smithg.datatypes import Item, Amount, Price, BuyOffer, SellOffer
+from smithg.engine.market import Market, Fill, OrderResult, RestingOrder
+
+
+class Order:
+    __slots__ = ("owner", "item", "price", "remaining", "is_buy")
+
+    def __init__(
+        self, owner: object, item: Item, price: Price, amount: Amount, is_buy: bool
+    ):
+        self.owner = owner
+        self.item = item
+        self.price = price
+        self.remaining = amount
+        self.is_buy = is_buy
+
+    def __repr__(self) -> str:
+        side = "BUY" if self.is_buy else "SELL"
+        return f"{side}({self.remaining} {self.item} @ {self.price})"
+
+
+# Heap entries are (key, sequence, order). Bids use the negated price as key, so the
+# smallest key is always the best price, and ties go to the earliest order.
+_Entry = tuple[Price, int, Order]
+
+
+@dataclass
+class Book:
+    bids: list[_Entry] = field(default_factory=list)
+    asks: list[_Entry] = field(default_factory=list)
+    # Total resting amount per price level, for the top-of-book amounts
+    bid_levels: dict[Price, Amount] = field(default_factory=dict)
+    ask_levels: dict[Price, Amount] = field(default_factory=dict)
+
+
+def _top(heap: list[_Entry]) -> Optional[Order]:
+    """Return the best live order, dropping filled and cancelled ones on the way."""
+    while heap:
+        order = heap[0][2]
+        if order.remaining:
+            return order
+        heapq.heappop(heap)
+    return None
+
+
+def _take(levels: dict[Price, Amount], price: Price, amount: Amount) -> None:
+    left = levels[price] - amount
+    if left:
+        levels[price] = left
+    else:
+        del levels[price]
+
+
+@dataclass
+class OrderBookMarket(Market):
+    """
+    A market where agents trade with each other through limit orders.
+
+    Use add_order to seed the book with orders that are not owned by any agent, for
+    example to provide liquidity.
+    """
+
+    books: dict[Item, Book] = field(default_factory=dict)
+    orders_by_owner: dict[int, dict[Item, list[Order]]] = field(default_factory=dict)
+    _sequence: int = field(default=0, repr=False)
+
+    resting_orders = True
+
+    def _book(self, item: Item) -> Book:
+        book = self.books.get(item)
+        if book is None:
+            book = self.books[item] = Book()
+        return book
+
+    def buy(
+        self, owner: object, item: Item, max_amount: Amount, max_price: Price
+    ) -> OrderResult:
+        return self._submit(owner, item, max_amount, max_price, is_buy=True)
+
+    def sell(
+        self, owner: object, item: Item, max_amount: Amount, min_price: Price
+    ) -> OrderResult:
+        return self._submit(owner, item, max_amount, min_price, is_buy=False)
+
+    def add_order(
+        self, item: Item, amount: Amount, price: Price, is_buy: bool
+    ) -> OrderResult:
+        """Add an order which is not owned by an agent."""
+        return self._submit(None, item, amount, price, is_buy)
+
+    def _submit(
+        self, owner: object, item: Item, amount: Amount, limit: Price, is_buy: bool
+    ) -> OrderResult:
+        if amount <= 0 or limit <= 0:
+            raise ValueError(f"Order of {amount} {item} @ {limit} is not positive")
+        book = self._book(item)
+        if is_buy:
+            opposite, levels = book.asks, book.ask_levels
+        else:
+            opposite, levels = book.bids, book.bid_levels
+
+        fills = []
+        while amount > 0:
+            maker = _top(opposite)
+            if maker is None:
+                break
+            if (maker.price > limit) if is_buy else (maker.price < limit):
+                break
+
+            filled = min(amount, maker.remaining)
+            maker.remaining -= filled
+            amount -= filled
+            _take(levels, maker.price, filled)
+            fills.append(Fill(item, filled, maker.price, maker.owner))
+
+        if amount > 0:
+            self._rest(Order(owner, item, limit, amount, is_buy))
+
+        self._update_top(item, book)
+        return OrderResult(tuple(fills), amount)
+
+    def _rest(self, order: Order) -> None:
+        book = self._book(order.item)
+        self._sequence += 1
+        if order.is_buy:
+            heapq.heappush(book.bids, (-order.price, self._sequence, order))
+            levels = book.bid_levels
+        else:
+            heapq.heappush(book.asks, (order.price, self._sequence, order))
+            levels = book.ask_levels
+        levels[order.price] = levels.get(order.price, 0) + order.remaining
+
+        if order.owner is not None:
+            owned = self.orders_by_owner.setdefault(id(order.owner), {})
+            orders = owned.setdefault(order.item, [])
+            orders.append(order)
+            # Drop filled orders now and then, amortized O(1) per order
+            if len(orders) >= 64 and len(orders) & (len(orders) - 1) == 0:
+                orders[:] = [o for o in orders if o.remaining]
+
+    def cancel(self, owner: object, item: Item) -> list[RestingOrder]:
+        orders = self.orders_by_owner.get(id(owner), {}).pop(item, [])
+        book = self._book(item)
+
+        cancelled = []
+        for order in orders:
+            if not order.remaining:
+                continue
+            levels = book.bid_levels if order.is_buy else book.ask_levels
+            _take(levels, order.price, order.remaining)
+            cancelled.append(
+                RestingOrder(item, order.remaining, order.price, order.is_buy)
+            )
+            # The heap entry is dropped lazily once it reaches the top
+            order.remaining = 0
+
+        if cancelled:
+            self._update_top(item, book)
+        return cancelled
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Owners are keyed by id, which does not survive pickling
+        del state["orders_by_owner"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.orders_by_owner = {}
+        entries = [
+            entry
+            for book in self.books.values()
+            for entry in (*book.bids, *book.asks)
+            if entry[2].remaining and entry[2].owner is not None
+        ]
+        # Orders of an owner are kept in the order they arrived
+        for _, _, order in sorted(entries, key=lambda entry: entry[1]):
+            owned = self.orders_by_owner.setdefault(id(order.owner), {})
+            owned.setdefault(order.item, []).append(order)
+
+    def _update_top(self, item: Item, book: Book) -> None:
+        bid = _top(book.bids)
+        if bid is None:
+            self.trades.buys.pop(item, None)
+        else:
+            self.trades.buys[item] = BuyOffer(
+                item, book.bid_levels[bid.price], bid.price
+            )
+
+        ask = _top(book.asks)
+        if ask is None:
+            self.trades.sells.pop(item, None)
+        else:
+            self.trades.sells[item] = SellOffer(
+                item, book.ask_levels[ask.price], ask.price
+            )
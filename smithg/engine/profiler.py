@@ -0,0 +1,261 @@
+"""
+Optional instrumentation of the engine.
+
+Attach a Profiler to a world (`world.profiler = Profiler()`) to record where a
+simulation spends its time: per step phase, per agent and per command type. Worlds
+without a profiler take the uninstrumented code path, so profiling costs nothing
+when it is disabled.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Awaitable
+import inspect
+import json
+import time
+
+from smithg.datatypes import Amount, events
+from smithg.datatypes.commands import Command, fuel_cost
+from smithg.engine import bus as engine_bus
+from smithg.engine.engine import (
+    AgentContainer,
+    InvalidAgentState,
+    MarketView,
+    World,
+    build_environment,
+    prepare_commands,
+)
+
+
+@dataclass
+class Timing:
+    calls: int = 0
+    time: float = 0.0
+
+    def add(self, elapsed: float, calls: int = 1) -> None:
+        self.calls += calls
+        self.time += elapsed
+
+    def merge(self, other: "Timing") -> None:
+        self.add(other.time, other.calls)
+
+
+@dataclass
+class AgentProfile:
+    """
+    Profile of one agent.
+
+    agent: Time spent in the agent function.
+    environment: Time spent building the agent's environments.
+    execution: Time spent executing the agent's commands.
+    commands: Number of commands issued.
+    fuel_spent: Command fuel spent on those commands.
+    trade_volume: Money traded in the agent's buy and sell receipts, including the
+      fills of its resting orders.
+    """
+
+    agent: Timing = field(default_factory=Timing)
+    environment: Timing = field(default_factory=Timing)
+    execution: Timing = field(default_factory=Timing)
+    commands: int = 0
+    fuel_spent: Amount = 0
+    trade_volume: Amount = 0
+
+    def merge(self, other: "AgentProfile") -> None:
+        self.agent.merge(other.agent)
+        self.environment.merge(other.environment)
+        self.execution.merge(other.execution)
+        self.commands += other.commands
+        self.fuel_spent += other.fuel_spent
+        self.trade_volume += other.trade_volume
+
+
+@dataclass
+class Profiler:
+    """
+    Records wall times and counters of a simulation.
+
+    phases: Timings of the step phases (tick, replenish, market_view, agents) and of
+      whole steps.
+    agents: Profiles by agent name. Agents with the same name are aggregated.
+    commands: Execution timings by command type.
+    """
+
+    phases: dict[str, Timing] = field(default_factory=dict)
+    agents: dict[str, AgentProfile] = field(default_factory=dict)
+    commands: dict[str, Timing] = field(default_factory=dict)
+
+    def _phase(self, name: str) -> Timing:
+        timing = self.phases.get(name)
+        if timing is None:
+            timing = self.phases[name] = Timing()
+        return timing
+
+    def _agent(self, cont: AgentContainer) -> AgentProfile:
+        profile = self.agents.get(cont.agent_name)
+        if profile is None:
+            profile = self.agents[cont.agent_name] = AgentProfile()
+        return profile
+
+    def step(self, world: World, s: int) -> None:
+        """Instrumented version of World.step."""
+        clock = time.perf_counter
+        start = clock()
+        world.process_step()
+        ticked = clock()
+        world.replenish_agents()
+        replenished = clock()
+        market_view = world.market_view()
+        viewed = clock()
+        world.run_agents(market_view, self.call_agent, self.execute_commands)
+        done = clock()
+
+        self._phase("tick").add(ticked - start)
+        self._phase("replenish").add(replenished - ticked)
+        self._phase("market_view").add(viewed - replenished)
+        self._phase("agents").add(done - viewed)
+        self._phase("step").add(done - start)
+
+    def call_agent(
+        self, cont: AgentContainer, world: World, market_view: MarketView
+    ) -> Any:
+        profile = self._agent(cont)
+        clock = time.perf_counter
+        start = clock()
+        env = build_environment(cont, world, market_view)
+        built = clock()
+        queued_commands = cont.agent_func(env, cont.events_queue)  # type: ignore
+        done = clock()
+
+        profile.environment.add(built - start)
+        if inspect.isawaitable(queued_commands):
+            return self._time_coroutine(profile, queued_commands)
+        profile.agent.add(done - built)
+        return queued_commands
+
+    async def _time_coroutine(
+        self, profile: AgentProfile, awaitable: Awaitable
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            profile.agent.add(time.perf_counter() - start)
+
+    def execute_commands(
+        self,
+        cont: AgentContainer,
+        world: World,
+        queued_commands: list[Command],
+    ) -> None:
+        bus = world.bus
+        try:
+            self._execute(cont, world, queued_commands)
+        except InvalidAgentState as e:
+            if bus is not None:
+                bus.emit(engine_bus.AgentFailed, cont, str(e))
+            raise
+
+    def _execute(
+        self,
+        cont: AgentContainer,
+        world: World,
+        queued_commands: list[Command],
+    ) -> None:
+        profile = self._agent(cont)
+        prepared, cost = prepare_commands(cont, queued_commands, world.trade_cost)
+        cont.state.command_fuel -= cost
+
+        clock = time.perf_counter
+        bus = world.bus
+        for handler, cmd in prepared:
+            receipts = len(cont.events_queue)
+            start = clock()
+            handler(cont, world, cmd)
+            elapsed = clock() - start
+            if bus is not None:
+                bus.emit(engine_bus.CommandExecuted, cont, cmd)
+
+            name = type(cmd).__name__
+            timing = self.commands.get(name)
+            if timing is None:
+                timing = self.commands[name] = Timing()
+            timing.add(elapsed)
+            profile.execution.add(elapsed)
+            profile.commands += 1
+            profile.fuel_spent += fuel_cost(cmd, world.trade_cost)
+            for evt in cont.events_queue[receipts:]:
+                if isinstance(evt, events.TradeReceipt):
+                    profile.trade_volume += evt.amount * evt.price
+
+    def maker_event(self, maker: AgentContainer, evt: events.Event) -> None:
+        """Count the receipt of a filled resting order into the volume of its owner."""
+        if isinstance(evt, events.TradeReceipt):
+            self._agent(maker).trade_volume += evt.amount * evt.price
+
+    def merge(self, other: "Profiler") -> None:
+        """Add the numbers of another profiler, for example of another run."""
+        for name, timing in other.phases.items():
+            self._phase(name).merge(timing)
+        for name, profile in other.agents.items():
+            self.agents.setdefault(name, AgentProfile()).merge(profile)
+        for name, timing in other.commands.items():
+            self.commands.setdefault(name, Timing()).merge(timing)
+
+    def report(self) -> dict:
+        """Return all numbers as a JSON serializable dict."""
+
+        def timing(t: Timing) -> dict:
+            return {"calls": t.calls, "time": t.time}
+
+        return {
+            "phases": {name: timing(t) for name, t in self.phases.items()},
+            "agents": {
+                name: {
+                    "agent": timing(p.agent),
+                    "environment": timing(p.environment),
+                    "execution": timing(p.execution),
+                    "commands": p.commands,
+                    "fuel_spent": p.fuel_spent,
+                    "trade_volume": p.trade_volume,
+                }
+                for name, p in self.agents.items()
+            },
+            "commands": {name: timing(t) for name, t in self.commands.items()},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.report())
+
+    def format_table(self) -> str:
+        """Return a human readable summary, slowest agents first."""
+        lines = [f"{'phase':24} {'calls':>9} {'total s':>10} {'per call us':>12}"]
+        for name, t in self.phases.items():
+            lines.append(_timing_row(name, t))
+
+        lines.append("")
+        lines.append(
+            f"{'agent':24} {'calls':>9} {'total s':>10} {'per call us':>12}"
+            f" {'env s':>8} {'exec s':>8} {'commands':>9} {'fuel':>9} {'volume':>12}"
+        )
+        by_time = sorted(
+            self.agents.items(), key=lambda a: a[1].agent.time, reverse=True
+        )
+        for name, p in by_time:
+            lines.append(
+                f"{_timing_row(name, p.agent)} {p.environment.time:8.3f}"
+                f" {p.execution.time:8.3f} {p.commands:9d} {p.fuel_spent:9d}"
+                f" {p.trade_volume:12d}"
+            )
+
+        lines.append("")
+        lines.append(
+            f"{'command':24} {'calls':>9} {'total s':>10} {'per call us':>12}"
+        )
+        for name, t in sorted(self.commands.items()):
+            lines.append(_timing_row(name, t))
+        return "\n".join(lines)
+
+
+def _timing_row(name: str, t: Timing) -> str:
+    per_call = t.time / t.calls * 1e6 if t.calls else 0.0
+    return f"{name:24.24} {t.calls:9d} {t.time:10.3f} {per_call:12.1f}"
@@ -0,0 +1,115 @@
+"""
+Recipes are compiled once, when a world is created, into a RecipeBook.
+
+The book orders all items topologically, so that every item comes after the items it
+can be forged from, and keeps dense per-recipe tables of inputs and outputs. Checking
+and executing a Forge command therefore costs O(recipe inputs), without walking the
+recipe graph. The cheapest production cost of every item is computed once as well.
+"""
+
+from typing import Iterable, Mapping, Optional
+import collections
+
+from smithg.datatypes import Amount, Item, ItemCatalog, Price, Recipe, commands
+
+
+class RecipeError(ValueError):
+    pass
+
+
+class RecipeBook:
+    """
+    Compiled recipes of a world.
+
+    recipes: Recipes by name.
+    ids: Dense recipe ids by name, which index inputs and outputs.
+    inputs, outputs: Per recipe id, tuples of (item, amount) for one forge.
+    item_order: All known items in topological order of the recipe graph.
+    production_costs: Cheapest cost to obtain one unit of every item which can be
+      forged or has a base cost. A forged item costs the cost of its inputs plus the
+      money value of the command fuel spent forging it, spread evenly over all
+      produced units. Inputs without base cost, which cannot be forged, count as 0.
+
+    recipes and production_costs are shared with the agents and must not be modified.
+    """
+
+    def __init__(
+        self,
+        recipes: Iterable[Recipe] = (),
+        known_items: Iterable[Item] = (),
+        base_costs: Optional[Mapping[Item, Price]] = None,
+        fuel_price: Price = 1,
+    ):
+        if not isinstance(known_items, ItemCatalog):
+            known_items = ItemCatalog(known_items)
+        base_costs = base_costs or {}
+
+        self.recipes: dict[str, Recipe] = {}
+        for recipe in recipes:
+            if recipe.name in self.recipes:
+                raise RecipeError(f"Recipe {recipe.name} is defined twice")
+            self.recipes[recipe.name] = recipe
+        self.ids: dict[str, int] = {}
+        self.inputs: list[tuple[tuple[Item, Amount], ...]] = []
+        self.outputs: list[tuple[tuple[Item, Amount], ...]] = []
+
+        produced_by: dict[Item, list[int]] = collections.defaultdict(list)
+        for recipe_id, recipe in enumerate(self.recipes.values()):
+            for item, amount in (*recipe.inputs.items(), *recipe.outputs.items()):
+                if item not in known_items:
+                    raise RecipeError(f"Recipe {recipe.name} uses unknown item {item}")
+                if amount <= 0:
+                    raise RecipeError(f"Recipe {recipe.name} has amount {amount}")
+            if not recipe.outputs:
+                raise RecipeError(f"Recipe {recipe.name} produces nothing")
+
+            self.ids[recipe.name] = recipe_id
+            self.inputs.append(tuple(recipe.inputs.items()))
+            self.outputs.append(tuple(recipe.outputs.items()))
+            for item in recipe.outputs:
+                produced_by[item].append(recipe_id)
+
+        self.item_order = self._topological_order(known_items, produced_by)
+
+        fuel_cost = commands.Forge(recipe="", times=1).cost * fuel_price
+        costs: dict[Item, Price] = {}
+        for item in self.item_order:
+            candidates = [base_costs[item]] if item in base_costs else []
+            for recipe_id in produced_by[item]:
+                total = fuel_cost + sum(
+                    amount * costs.get(i, 0) for i, amount in self.inputs[recipe_id]
+                )
+                units = sum(amount for _, amount in self.outputs[recipe_id])
+                candidates.append(-(-total // units))
+            if candidates:
+                costs[item] = min(candidates)
+        self.production_costs: dict[Item, Price] = costs
+
+    def _topological_order(
+        self, known_items: ItemCatalog, produced_by: Mapping[Item, list[int]]
+    ) -> tuple[Item, ...]:
+        # Kahn's algorithm over items, an item depends on the inputs of its recipes
+        dependencies = {
+            item: {i for r in produced_by.get(item, ()) for i, _ in self.inputs[r]}
+            for item in known_items
+        }
+        dependents: dict[Item, list[Item]] = collections.defaultdict(list)
+        for item, inputs in dependencies.items():
+            for i in inputs:
+                dependents[i].append(item)
+
+        missing = {item: len(inputs) for item, inputs in dependencies.items()}
+        ready = collections.deque(item for item in known_items if not missing[item])
+        order = []
+        while ready:
+            item = ready.popleft()
+            order.append(item)
+            for dependent in dependents[item]:
+                missing[dependent] -= 1
+                if not missing[dependent]:
+                    ready.append(dependent)
+
+        if len(order) != len(known_items):
+            cyclic = sorted(item for item, count in missing.items() if count)
+            raise RecipeError(f"Recipes contain a cycle through {cyclic}")
+        return tuple(order)
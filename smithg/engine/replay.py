@@ -0,0 +1,511 @@
+"""
+Binary replay logs of simulations.
+
+A Recorder attached to a world (`world.recorder = Recorder(path)`) appends one block
+per step to a log file: the market offers the agents saw, the commands every agent
+executed, and the receipts those commands produced for the agent and its trade
+counterparts. ReplayLog memory-maps such a file, seeks to any step in O(1) and
+reconstructs the state of all agents from the log alone, without running any agent.
+
+File layout, all integers in native byte order:
+
+    magic (8 bytes) | header length (u32) | JSON header | padding to 8 bytes
+    step block*
+
+The header holds the known items, the recipes and every agent's name, income and
+state when recording started. A step block is
+
+    block length (u32) | offer rows (u32) | command rows (u32) | event rows (u32)
+    offers:   amount i64[] | price i64[] | item u32[] | side u8[] | padding
+    commands: amount i64[] | price i64[] | agent u32[] | ref u32[] | kind u8[] | padding
+    events:   amount i64[] | price i64[] | agent u32[] | ref u32[] | kind u8[] |
+              maker u8[] | padding
+
+where ref is an item id (an index into the known items) or a recipe id. Every column
+is a contiguous array, so readers get zero-copy views on it.
+
+Commands without an encoding, like those of custom command handlers, are logged with
+only their fuel cost and read back as UnknownCommand. Replays charge their fuel, but
+cannot know what else their handler changed.
+"""
+
+from array import array
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Union, cast
+import json
+import mmap
+import os
+import struct
+import sys
+
+from smithg.datatypes import BuyOffer, SellOffer, Recipe, CommandCost, commands, events
+from smithg.agents import Inventory
+from smithg.engine.engine import AgentContainer, MarketView, World
+
+MAGIC = b"SMGRPLY\x01"
+
+_U32 = struct.Struct("I")
+_BLOCK_HEADER = struct.Struct("4I")
+
+# Kinds of commands and events, in the order of their kind id
+_COMMANDS = (
+    commands.BuyItem,
+    commands.SellItem,
+    commands.Work,
+    commands.Forge,
+    commands.CancelOrders,
+)
+_EVENTS = (
+    events.BuyReceipt,
+    events.SellReceipt,
+    events.ForgeReceipt,
+    events.BuyOrderPlaced,
+    events.SellOrderPlaced,
+    events.BuyOrderCancelled,
+    events.SellOrderCancelled,
+)
+_COMMAND_KINDS = {cls: kind for kind, cls in enumerate(_COMMANDS)}
+# Kind of commands without an encoding, far from the kinds of known commands
+_UNKNOWN_COMMAND = 255
+_EVENT_KINDS = {cls: kind for kind, cls in enumerate(_EVENTS)}
+
+_OFFER_COLUMNS = (("amount", "q"), ("price", "q"), ("item", "I"), ("side", "B"))
+_COMMAND_COLUMNS = (
+    ("amount", "q"),
+    ("price", "q"),
+    ("agent", "I"),
+    ("ref", "I"),
+    ("kind", "B"),
+)
+_EVENT_COLUMNS = (
+    ("amount", "q"),
+    ("price", "q"),
+    ("agent", "I"),
+    ("ref", "I"),
+    ("kind", "B"),
+    ("maker", "B"),
+)
+
+_ROW_SIZES = tuple(
+    sum(array(typecode).itemsize for _, typecode in layout)
+    for layout in (_OFFER_COLUMNS, _COMMAND_COLUMNS, _EVENT_COLUMNS)
+)
+
+Columns = dict[str, Any]
+
+
+class ReplayError(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class UnknownCommand(commands.Command):
+    """A recorded command which has no encoding in the log, with its fuel cost."""
+
+    fuel: CommandCost
+
+    @property
+    def cost(self) -> CommandCost:
+        return self.fuel
+
+
+def _padding(size: int) -> bytes:
+    return bytes(-size % 8)
+
+
+def _new_columns(layout: tuple[tuple[str, str], ...]) -> Columns:
+    return {name: array(typecode) for name, typecode in layout}
+
+
+class Recorder:
+    """
+    Writes a replay log of the world it is attached to.
+
+    Recording starts with the next step, and all agents must have been added to the
+    world by then. Call close(), or World.close(), to flush the file.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        self._file: Optional[BinaryIO] = None
+        self._agents: dict[int, int] = {}
+        self._offers = _new_columns(_OFFER_COLUMNS)
+        self._commands = _new_columns(_COMMAND_COLUMNS)
+        self._events = _new_columns(_EVENT_COLUMNS)
+        self._maker_events: set[int] = set()
+
+    def _start(self, world: World) -> None:
+        self._item_ids = world.known_items.ids
+        self._recipe_ids = world.recipe_book.ids
+        self._trade_cost = world.trade_cost
+        containers = world.player_agent_containers
+        self._agents = {id(cont): i for i, cont in enumerate(containers)}
+
+        header = {
+            "byteorder": sys.byteorder,
+            "known_items": list(world.known_items),
+            "trade_cost": world.trade_cost,
+            "recipes": [
+                {"name": r.name, "inputs": r.inputs, "outputs": r.outputs}
+                for r in world.recipe_book.recipes.values()
+            ],
+            "agents": [
+                {
+                    "name": cont.agent_name,
+                    "work_to_money": cont.work_to_money,
+                    "balance_increase": cont.balance_increase,
+                    "command_fuel_increase": cont.command_fuel_increase,
+                    "balance": cont.state.balance,
+                    "command_fuel": cont.state.command_fuel,
+                    "items": {k: v for k, v in cont.state.items.items() if v},
+                }
+                for cont in containers
+            ],
+        }
+        data = json.dumps(header).encode()
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC + _U32.pack(len(data)) + data)
+        self._file.write(_padding(len(MAGIC) + _U32.size + len(data)))
+
+    def begin_step(
+        self, world: World, market_view: MarketView, execute: Callable[..., None]
+    ) -> Callable[..., None]:
+        """Record the offers of a step and return execute wrapped for recording."""
+        if self._file is None:
+            self._start(world)
+        elif len(world.player_agent_containers) != len(self._agents):
+            raise ReplayError("Agents cannot be added while recording")
+
+        ids = self._item_ids
+        offers = self._offers
+        sides = (market_view.buy_offers, market_view.sell_offers)
+        for side, offer_set in enumerate(sides):
+            ordered = sorted(offer_set, key=lambda o: ids[o.item])
+            offers["amount"].extend([o.amount for o in ordered])
+            offers["price"].extend([o.price for o in ordered])
+            offers["item"].extend([ids[o.item] for o in ordered])
+            offers["side"].extend(bytes([side]) * len(ordered))
+
+        def execute_recorded(
+            cont: AgentContainer, world: World, queued_commands: list
+        ) -> None:
+            start = len(cont.events_queue)
+            execute(cont, world, queued_commands)
+            agent = self._agents[id(cont)]
+            for cmd in queued_commands:
+                self._command(agent, cmd)
+            for evt in cont.events_queue[start:]:
+                if id(evt) not in self._maker_events:
+                    self._event(agent, evt, maker=False)
+            self._maker_events.clear()
+
+        return execute_recorded
+
+    def maker_event(self, maker: AgentContainer, evt: events.Event) -> None:
+        """Record an event of a counterparty whose resting order was filled."""
+        self._event(self._agents[id(maker)], evt, maker=True)
+        self._maker_events.add(id(evt))
+
+    def _command(self, agent: int, cmd: commands.Command) -> None:
+        kind = _COMMAND_KINDS.get(type(cmd), _UNKNOWN_COMMAND)
+        amount = price = ref = 0
+        if kind == _UNKNOWN_COMMAND:
+            amount = commands.fuel_cost(cmd, self._trade_cost)
+        elif isinstance(cmd, commands.BuyItem):
+            ref, amount = self._item_ids[cmd.item], cmd.max_amount
+            price = cmd.max_price
+        elif isinstance(cmd, commands.SellItem):
+            ref, amount = self._item_ids[cmd.item], cmd.max_amount
+            price = cmd.min_price
+        elif isinstance(cmd, commands.Work):
+            amount = cmd.amount
+        elif isinstance(cmd, commands.Forge):
+            ref, amount = self._recipe_ids[cmd.recipe], cmd.times
+        elif isinstance(cmd, commands.CancelOrders):
+            ref = self._item_ids[cmd.item]
+
+        columns = self._commands
+        columns["amount"].append(amount)
+        columns["price"].append(price)
+        columns["agent"].append(agent)
+        columns["ref"].append(ref)
+        columns["kind"].append(kind)
+
+    def _event(self, agent: int, evt: events.Event, maker: bool) -> None:
+        kind = _EVENT_KINDS.get(type(evt))
+        if kind is None:
+            # Timeouts and failures do not change the state of the world
+            return
+        if isinstance(evt, events.ForgeReceipt):
+            ref, amount, price = self._recipe_ids[evt.recipe], evt.times, 0
+        else:
+            trade = cast(events.TradeReceipt, evt)
+            ref, amount, price = self._item_ids[trade.item], trade.amount, trade.price
+
+        columns = self._events
+        columns["amount"].append(amount)
+        columns["price"].append(price)
+        columns["agent"].append(agent)
+        columns["ref"].append(ref)
+        columns["kind"].append(kind)
+        columns["maker"].append(maker)
+
+    def end_step(self) -> None:
+        """Append the block of the current step to the log."""
+        assert self._file is not None
+        tables = (self._offers, self._commands, self._events)
+        rows = [len(t["amount"]) for t in tables]
+        sizes = [n * row_size for n, row_size in zip(rows, _ROW_SIZES)]
+        length = _BLOCK_HEADER.size - 4 + sum(size + -size % 8 for size in sizes)
+
+        write = self._file.write
+        write(_BLOCK_HEADER.pack(length, *rows))
+        for columns, size in zip(tables, sizes):
+            for column in columns.values():
+                write(column)
+                # Columns are reused for the next step
+                del column[:]
+            write(_padding(size))
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+@dataclass
+class StepRecord:
+    """
+    The recorded block of one step.
+
+    The columns are zero-copy views into the memory-mapped log, keyed by column name
+    (see the module docstring). They are only valid until the log is closed.
+    """
+
+    log: "ReplayLog"
+    offer_columns: Columns
+    command_columns: Columns
+    event_columns: Columns
+
+    @property
+    def offers(self) -> list[Union[BuyOffer, SellOffer]]:
+        items = self.log.known_items
+        c = self.offer_columns
+        return [
+            (SellOffer if side else BuyOffer)(items[item], amount, price)
+            for amount, price, item, side in zip(
+                c["amount"], c["price"], c["item"], c["side"]
+            )
+        ]
+
+    @property
+    def commands(self) -> list[tuple[int, commands.Command]]:
+        """Executed commands, as (agent index, command) in execution order."""
+        items, recipes = self.log.known_items, self.log.recipe_names
+        c = self.command_columns
+        result = []
+        for amount, price, agent, ref, kind in zip(
+            c["amount"], c["price"], c["agent"], c["ref"], c["kind"]
+        ):
+            if kind == _UNKNOWN_COMMAND:
+                result.append((agent, UnknownCommand(amount)))
+                continue
+            cls = _COMMANDS[kind]
+            cmd: commands.Command
+            if cls is commands.BuyItem:
+                cmd = commands.BuyItem(items[ref], max_amount=amount, max_price=price)
+            elif cls is commands.SellItem:
+                cmd = commands.SellItem(items[ref], max_amount=amount, min_price=price)
+            elif cls is commands.Work:
+                cmd = commands.Work(amount=amount)
+            elif cls is commands.Forge:
+                cmd = commands.Forge(recipes[ref], times=amount)
+            else:
+                cmd = commands.CancelOrders(items[ref])
+            result.append((agent, cmd))
+        return result
+
+    @property
+    def events(self) -> list[tuple[int, events.Event, bool]]:
+        """Receipts, as (agent index, event, filled a resting order of the agent)."""
+        items, recipes = self.log.known_items, self.log.recipe_names
+        c = self.event_columns
+        result = []
+        for amount, price, agent, ref, kind, maker in zip(
+            c["amount"], c["price"], c["agent"], c["ref"], c["kind"], c["maker"]
+        ):
+            cls = _EVENTS[kind]
+            evt: events.Event
+            if cls is events.ForgeReceipt:
+                evt = events.ForgeReceipt(recipes[ref], amount)
+            else:
+                evt = cls(items[ref], amount, price)  # type: ignore
+            result.append((agent, evt, bool(maker)))
+        return result
+
+
+class ReplayLog:
+    """
+    Read access to a replay log.
+
+    The file is memory-mapped. Opening it reads the header and the block lengths, and
+    indexing returns the StepRecord of a step without reading any other step.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if self._view[: len(MAGIC)] != MAGIC:
+            raise ReplayError(f"{path} is not a replay log")
+        (length,) = _U32.unpack_from(self._mmap, len(MAGIC))
+        start = len(MAGIC) + _U32.size
+        header = json.loads(bytes(self._view[start : start + length]))
+        if header["byteorder"] != sys.byteorder:
+            raise ReplayError(f"{path} was written on a {header['byteorder']} machine")
+
+        self.header = header
+        self.known_items: list[str] = header["known_items"]
+        self.recipes = [
+            Recipe(r["name"], inputs=r["inputs"], outputs=r["outputs"])
+            for r in header["recipes"]
+        ]
+        self.recipe_names = [r.name for r in self.recipes]
+        self.agent_names: list[str] = [a["name"] for a in header["agents"]]
+
+        # A block which was cut off, for example by a crash, is ignored
+        self._offsets = []
+        offset = start + length + len(_padding(start + length))
+        size = len(self._mmap)
+        while offset + _BLOCK_HEADER.size <= size:
+            (block_length,) = _U32.unpack_from(self._mmap, offset)
+            end = offset + 4 + block_length
+            if end > size:
+                break
+            self._offsets.append(offset)
+            offset = end
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, step: int) -> StepRecord:
+        offset = self._offsets[step]
+        _, *rows = _BLOCK_HEADER.unpack_from(self._mmap, offset)
+        offset += _BLOCK_HEADER.size
+
+        tables = []
+        for n, layout in zip(rows, (_OFFER_COLUMNS, _COMMAND_COLUMNS, _EVENT_COLUMNS)):
+            columns = {}
+            start = offset
+            for name, typecode in layout:
+                size = n * array(typecode).itemsize
+                columns[name] = self._view[offset : offset + size].cast(typecode)
+                offset += size
+            offset += len(_padding(offset - start))
+            tables.append(columns)
+        return StepRecord(self, *tables)
+
+    def __iter__(self) -> Iterator[StepRecord]:
+        for step in range(len(self)):
+            yield self[step]
+
+    def initial_states(self) -> list[AgentContainer.State]:
+        return [
+            AgentContainer.State(
+                command_fuel=a["command_fuel"],
+                balance=a["balance"],
+                items=Inventory(a["items"]),
+            )
+            for a in self.header["agents"]
+        ]
+
+    def replay(self) -> Iterator[list[AgentContainer.State]]:
+        """
+        Reconstruct the agent states after every step from the log.
+
+        The same state objects are updated and yielded for every step.
+        """
+        states = self.initial_states()
+        agents = self.header["agents"]
+        recipes = [
+            (tuple(r.inputs.items()), tuple(r.outputs.items())) for r in self.recipes
+        ]
+        items = self.known_items
+        # Logs of older versions have no trade_cost, they used the default
+        trade_cost = self.header.get("trade_cost", commands.TRADE_COST)
+
+        for step, record in enumerate(self):
+            if step:
+                for state, agent in zip(states, agents):
+                    state.command_fuel += agent["command_fuel_increase"]
+                    state.balance += agent["balance_increase"]
+
+            for agent_id, cmd in record.commands:
+                state = states[agent_id]
+                state.command_fuel -= commands.fuel_cost(cmd, trade_cost)
+                if isinstance(cmd, commands.Work):
+                    state.balance += agents[agent_id]["work_to_money"] * cmd.cost
+
+            c = record.event_columns
+            for amount, price, agent_id, ref, kind, maker in zip(
+                c["amount"], c["price"], c["agent"], c["ref"], c["kind"], c["maker"]
+            ):
+                state = states[agent_id]
+                cls = _EVENTS[kind]
+                _apply_event(state, cls, items, recipes, ref, amount, price, maker)
+            yield states
+
+    def final_states(self) -> list[AgentContainer.State]:
+        states = self.initial_states()
+        for states in self.replay():
+            pass
+        return states
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "ReplayLog":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def _apply_event(
+    state: AgentContainer.State,
+    cls: type,
+    items: list[str],
+    recipes: list,
+    ref: int,
+    amount: int,
+    price: int,
+    maker: int,
+) -> None:
+    # Mirrors the settlement in engine.execute_command. Resting orders escrow funds
+    # and items when they are placed, so filling them only pays out the other side.
+    if cls is events.ForgeReceipt:
+        inputs, outputs = recipes[ref]
+        for item, n in inputs:
+            state.items[item] -= n * amount
+        for item, n in outputs:
+            state.items[item] += n * amount
+        return
+
+    item = items[ref]
+    if cls is events.BuyReceipt:
+        state.items[item] += amount
+        if not maker:
+            state.balance -= amount * price
+    elif cls is events.SellReceipt:
+        state.balance += amount * price
+        if not maker:
+            state.items[item] -= amount
+    elif cls is events.BuyOrderPlaced:
+        state.balance -= amount * price
+    elif cls is events.SellOrderPlaced:
+        state.items[item] -= amount
+    elif cls is events.BuyOrderCancelled:
+        state.balance += amount * price
+    elif cls is events.SellOrderCancelled:
+        state.items[item] += amount
@@ -0,0 +1,252 @@
+"""
+Run agents in long-lived worker processes with a wall-clock budget per step.
+
+A sandboxed agent is an AgentFunc itself, so it can be registered and added to a world
+like any other agent. Every call is forwarded to a worker process which keeps the
+agent, and its state, alive across steps. Requests and replies are pickled over a
+pipe. The parts of the environment which rarely change (known items, recipes and
+production costs) are only sent when they did. Replies may only contain the commands
+of smithg.datatypes.commands, so an agent cannot run code in the engine process by
+sending a crafted pickle. A worker which sends anything else is restarted.
+
+If the agent does not answer within the time budget, the step gets an empty command
+list and the agent receives a StepTimeout event on its next call. A worker which is
+still busy with an old step gets no new work. If it misses `max_missed` steps in a
+row, or if the agent crashes its worker, the worker is restarted from the original
+agent object and the agent receives an AgentFailed event.
+"""
+
+from typing import Any, Optional
+import io
+import logging
+import multiprocessing
+import multiprocessing.connection
+import pickle
+import time
+
+from smithg.agents import AgentFunc, Environment, InventoryView
+from smithg.datatypes import commands, events
+
+_logger = logging.getLogger(__name__)
+
+_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Builtins which replies may contain, none of them runs code when it is loaded
+_SAFE_BUILTINS = frozenset(
+    {"bytearray", "complex", "frozenset", "range", "set", "slice"}
+)
+
+
+class _ReplyUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str) -> Any:
+        if module == "builtins" and name in _SAFE_BUILTINS:
+            return super().find_class(module, name)
+        if module == commands.__name__:
+            cls = getattr(commands, name, None)
+            if isinstance(cls, type) and issubclass(cls, commands.Command):
+                return cls
+        raise pickle.UnpicklingError(f"Replies cannot contain {module}.{name}")
+
+
+def _load_reply(data: bytes) -> Any:
+    return _ReplyUnpickler(io.BytesIO(data)).load()
+
+
+def _worker(conn: multiprocessing.connection.Connection, agent_func: AgentFunc) -> None:
+    static: tuple = ()
+    while True:
+        try:
+            request = conn.recv_bytes()
+        except (EOFError, OSError):
+            return
+
+        seq, new_static, dynamic, agent_events = pickle.loads(request)
+        if new_static is not None:
+            static = new_static
+        known_items, recipes, production_costs, trade_cost = static
+        buy_offers, sell_offers, balance, command_fuel, inventory = dynamic
+        env = Environment(
+            known_items=known_items,
+            buy_offers=buy_offers,
+            sell_offers=sell_offers,
+            balance=balance,
+            command_fuel=command_fuel,
+            inventory=InventoryView(inventory),
+            recipes=recipes,
+            production_costs=production_costs,
+            trade_cost=trade_cost,
+        )
+
+        try:
+            reply = pickle.dumps((seq, True, agent_func(env, agent_events)), _PROTOCOL)
+        except Exception as e:
+            reply = pickle.dumps((seq, False, repr(e)), _PROTOCOL)
+        conn.send_bytes(reply)
+
+
+class SandboxedAgent:
+    """
+    An AgentFunc which runs the wrapped agent in a worker process.
+
+    agent_func: The agent to run. With the spawn start method it must be picklable.
+    time_budget: Wall-clock seconds the agent has to answer in every step.
+    max_missed: Consecutive missed steps after which a busy worker is restarted.
+    """
+
+    def __init__(
+        self,
+        agent_func: AgentFunc,
+        time_budget: float = 0.1,
+        max_missed: int = 3,
+        mp_context: Optional[Any] = None,
+    ):
+        self.agent_func = agent_func
+        self.__name__ = getattr(agent_func, "__name__", type(agent_func).__name__)
+        self.time_budget = time_budget
+        self.max_missed = max_missed
+        self._mp = mp_context or multiprocessing.get_context()
+        self._process: Optional[multiprocessing.process.BaseProcess] = None
+        self._conn: Optional[multiprocessing.connection.Connection] = None
+        self._seq = 0
+        self._busy = False
+        self._missed = 0
+        self._static: Optional[tuple] = None
+        self._pending_events: list[events.Event] = []
+        # Why the last call failed or timed out, for observers of the engine
+        self.failures: list[str] = []
+
+    def start(self) -> None:
+        conn, worker_conn = self._mp.Pipe()
+        process = self._mp.Process(
+            target=_worker,
+            args=(worker_conn, self.agent_func),
+            name=f"smithg-agent-{self.__name__}",
+            daemon=True,
+        )
+        try:
+            process.start()
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            worker_conn.close()
+        # Only a started process can be closed
+        self._process = process
+        self._conn = conn
+        self._busy = False
+        self._missed = 0
+        self._static = None
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._process = None
+
+    def restart(self, reason: str) -> None:
+        _logger.warning("Restarting worker of agent %s: %s", self.__name__, reason)
+        self.close()
+        self._pending_events.append(events.AgentFailed(reason))
+        self.failures.append(reason)
+        self.start()
+
+    def __call__(
+        self, env: Environment, agent_events: list[events.Event]
+    ) -> list[commands.Command]:
+        if self._conn is None:
+            self.start()
+        agent_events = self._pending_events + agent_events
+        self._pending_events = []
+        self.failures = []
+
+        try:
+            return self._call(env, agent_events)
+        except (EOFError, OSError, BrokenPipeError) as e:
+            self.restart(f"Worker died: {e!r}")
+            return []
+        except pickle.UnpicklingError as e:
+            self.restart(f"Worker sent an invalid reply: {e}")
+            return []
+
+    def _call(
+        self, env: Environment, agent_events: list[events.Event]
+    ) -> list[commands.Command]:
+        assert self._conn is not None
+        deadline = time.monotonic() + self.time_budget
+
+        if self._busy:
+            # Collect the late answer of a previous step, if it arrived meanwhile
+            while self._conn.poll(0):
+                self._receive()
+        if self._busy:
+            self._missed += 1
+            if self._missed >= self.max_missed:
+                self.restart(f"Agent missed {self._missed} steps")
+            else:
+                self._pending_events.extend(agent_events)
+                self._pending_events.append(events.StepTimeout(self.time_budget))
+                self.failures.append(f"Agent is still busy with step {self._seq}")
+                return []
+
+        self._seq += 1
+        static = (env.known_items, env.recipes, env.production_costs, env.trade_cost)
+        if self._static is not None and all(
+            a is b for a, b in zip(static, self._static)
+        ):
+            new_static = None
+        else:
+            new_static = self._static = static
+        dynamic = (
+            env.buy_offers,
+            env.sell_offers,
+            env.balance,
+            env.command_fuel,
+            dict(env.inventory),
+        )
+        self._conn.send_bytes(
+            pickle.dumps((self._seq, new_static, dynamic, agent_events), _PROTOCOL)
+        )
+        self._busy = True
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._conn.poll(remaining):
+                self._missed += 1
+                self._pending_events.append(events.StepTimeout(self.time_budget))
+                self.failures.append(f"Agent exceeded its {self.time_budget}s budget")
+                return []
+            result = self._receive()
+            if result is not None:
+                self._missed = 0
+                return result
+
+    def _receive(self) -> Optional[list[commands.Command]]:
+        """Read one reply. Returns the commands if it answers the current step."""
+        assert self._conn is not None
+        seq, ok, payload = _load_reply(self._conn.recv_bytes())
+        if seq != self._seq:
+            return None
+        self._busy = False
+        if not ok:
+            self._pending_events.append(events.AgentFailed(payload))
+            self.failures.append(payload)
+            return []
+        return payload
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_process=None, _conn=None, _mp=None, _busy=False, _static=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._mp = multiprocessing.get_context()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
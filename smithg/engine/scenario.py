@@ -0,0 +1,355 @@
+"""
+Scenario markets, which replay recorded price series.
+
+A scenario holds the offers of the market for every tick: a price and a signed amount
+per item. Positive amounts are buy offers, negative amounts sell offers and zero means
+no offer, like the draws of RandomMarket. ScenarioMarket offers one tick per step, so
+agents can be tested against real or handcrafted price histories.
+
+Binary scenario files are memory-mapped and every tick is read when it is needed, so
+scenarios can be much larger than memory. File layout, all integers in native byte
+order:
+
+    magic (8 bytes) | header length (u32) | JSON header | padding to 8 bytes
+    tick*
+
+The header holds the known items. A tick is price i32[items] | amount i32[items], in
+the order of the known items, so tick t is found at a fixed offset.
+
+CSV scenarios have a `tick,item,price,amount` header and rows ordered by tick; items
+without a row in a tick have no offer. ScenarioMarket converts them to a temporary
+binary file when it opens them, and tournaments convert them once for all runs. To
+convert them ahead of time, or to generate seeded scenarios with the offers of a
+RandomMarket, run
+
+    python -m smithg.engine.scenario convert scenario.csv scenario.smgs
+    python -m smithg.engine.scenario generate scenario.smgs --ticks 100000 --seed 1
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Iterable, Iterator, Optional, Sequence, Union
+import argparse
+import contextlib
+import csv
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+
+from smithg.datatypes import Amount, BuyOffer, Item, ItemCatalog, Price, SellOffer
+from smithg.engine.market import Market, RandomMarket
+
+MAGIC = b"SMGSCEN\x01"
+
+_U32 = struct.Struct("I")
+# Bytes of ticks ScenarioMarket reads before it releases their pages
+_RELEASE_BYTES = 64 << 20
+_CSV_FIELDS = ["tick", "item", "price", "amount"]
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def _padding(size: int) -> bytes:
+    return bytes(-size % 8)
+
+
+class ScenarioWriter:
+    """Writes a binary scenario to file, one tick at a time."""
+
+    def __init__(self, file: BinaryIO, known_items: Iterable[Item]):
+        self.known_items = ItemCatalog(known_items)
+        self.ticks = 0
+        self._file = file
+        header = json.dumps(
+            {"byteorder": sys.byteorder, "known_items": list(self.known_items)}
+        ).encode()
+        file.write(MAGIC + _U32.pack(len(header)) + header)
+        file.write(_padding(len(MAGIC) + _U32.size + len(header)))
+
+    def write(self, prices: Sequence[Price], amounts: Sequence[Amount]) -> None:
+        """Append a tick with the price and amount of every known item, in order."""
+        n = len(self.known_items)
+        if len(prices) != n or len(amounts) != n:
+            raise ScenarioError(f"A tick needs a price and an amount for {n} items")
+        try:
+            self._file.write(array("i", prices))
+            self._file.write(array("i", amounts))
+        except OverflowError as e:
+            raise ScenarioError(f"Tick {self.ticks} does not fit into 32 bits") from e
+        self.ticks += 1
+
+    def write_market(self, market: Market) -> None:
+        """Append a tick with the current offers of market."""
+        ids = self.known_items.ids
+        prices = [0] * len(ids)
+        amounts = [0] * len(ids)
+        for offer in market.trades.buy_offer_set():
+            prices[ids[offer.item]] = offer.price
+            amounts[ids[offer.item]] = offer.amount
+        for offer in market.trades.sell_offer_set():
+            prices[ids[offer.item]] = offer.price
+            amounts[ids[offer.item]] = -offer.amount
+        self.write(prices, amounts)
+
+
+def convert_csv(csv_path: Union[str, os.PathLike], file: BinaryIO) -> int:
+    """
+    Write the CSV scenario in csv_path to file in binary form.
+
+    Returns the number of ticks. The CSV file is read twice, once for its items, so
+    it is never loaded into memory as a whole.
+    """
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != _CSV_FIELDS:
+            raise ScenarioError(
+                f"{csv_path} is not a scenario, its header must be "
+                + ",".join(_CSV_FIELDS)
+            )
+        items = ItemCatalog(row["item"] for row in reader)
+
+    writer = ScenarioWriter(file, items)
+    ids = items.ids
+    prices = [0] * len(items)
+    amounts = [0] * len(items)
+    tick = 0
+    with open(csv_path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                row_tick = int(row["tick"])
+                price, amount = int(row["price"]), int(row["amount"])
+            except ValueError as e:
+                raise ScenarioError(f"{csv_path}:{line}: {e}") from None
+            if row_tick < tick:
+                raise ScenarioError(f"{csv_path}:{line}: Rows must be ordered by tick")
+            while tick < row_tick:
+                writer.write(prices, amounts)
+                prices = [0] * len(items)
+                amounts = [0] * len(items)
+                tick += 1
+            prices[ids[row["item"]]] = price
+            amounts[ids[row["item"]]] = amount
+    if items:
+        writer.write(prices, amounts)
+    return writer.ticks
+
+
+def is_binary(path: Union[str, os.PathLike]) -> bool:
+    """Whether path is a binary scenario file, rather than a CSV one."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+@contextlib.contextmanager
+def binary_scenario(path: Union[str, os.PathLike]) -> Iterator[str]:
+    """
+    Path of the scenario in path as a binary file, for the duration of the block.
+
+    CSV scenarios are converted to a temporary file, which is removed afterwards.
+    """
+    if is_binary(path):
+        yield os.fspath(path)
+        return
+    with tempfile.TemporaryDirectory(prefix="smithg-") as tmp:
+        binary = os.path.join(tmp, "scenario.smgs")
+        with open(binary, "wb") as f:
+            convert_csv(path, f)
+        yield binary
+
+
+def generate(
+    file: BinaryIO, known_items: Iterable[Item], ticks: int, seed: Optional[int] = None
+) -> None:
+    """
+    Write a scenario with ticks ticks of a RandomMarket seeded with seed to file.
+
+    A ScenarioMarket of this scenario offers exactly what the RandomMarket of a world
+    created with make_world(known_items, seed=seed) would.
+    """
+    items = ItemCatalog(known_items)
+    market = RandomMarket(rand=random.Random(seed), known_items=items)
+    writer = ScenarioWriter(file, items)
+    for _ in range(ticks):
+        market.tick()
+        writer.write_market(market)
+
+
+class Scenario:
+    """
+    Read access to a binary or CSV scenario.
+
+    Binary files are memory-mapped, CSV files are converted to a memory-mapped
+    temporary file first.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        with open(path, "rb") as f:
+            binary = f.read(len(MAGIC)) == MAGIC
+            if binary:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not binary:
+            # The mapping keeps the temporary file alive after it is closed
+            with tempfile.TemporaryFile() as tmp:
+                convert_csv(path, tmp)
+                tmp.flush()
+                self._mmap = mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mmap)
+        self._released = 0
+
+        (length,) = _U32.unpack_from(self._mmap, len(MAGIC))
+        start = len(MAGIC) + _U32.size
+        header = json.loads(bytes(self._view[start : start + length]))
+        if header["byteorder"] != sys.byteorder:
+            raise ScenarioError(
+                f"{path} was written on a {header['byteorder']} machine"
+            )
+
+        self.path = path
+        self.known_items = ItemCatalog(header["known_items"])
+        self._offset = start + length + len(_padding(start + length))
+        self._column_size = len(self.known_items) * array("i").itemsize
+        # Bytes per tick
+        self.tick_size = 2 * self._column_size
+        self._ticks = 0
+        if self.known_items:
+            # A tick which was cut off is ignored
+            self._ticks = (len(self._mmap) - self._offset) // self.tick_size
+
+    def __len__(self) -> int:
+        return self._ticks
+
+    def __getitem__(self, tick: int) -> tuple[memoryview, memoryview]:
+        """Prices and amounts of tick, as zero-copy views into the file."""
+        if not 0 <= tick < self._ticks:
+            raise IndexError(f"Scenario has no tick {tick}")
+        size = self._column_size
+        start = self._offset + self.tick_size * tick
+        return (
+            self._view[start : start + size].cast("i"),
+            self._view[start + size : start + 2 * size].cast("i"),
+        )
+
+    def offers(
+        self, tick: int, buys: dict[Item, BuyOffer], sells: dict[Item, SellOffer]
+    ) -> None:
+        """Add the offers of tick to buys and sells."""
+        prices, amounts = self[tick]
+        for item, price, amount in zip(self.known_items, prices, amounts):
+            if amount > 0:
+                buys[item] = BuyOffer(item=item, amount=amount, price=price)
+            elif amount < 0:
+                sells[item] = SellOffer(item=item, amount=-amount, price=price)
+
+    def release(self, tick: int) -> None:
+        """
+        Drop the pages of all ticks before tick from memory.
+
+        Mapped pages count towards the memory use of the process until they are
+        released. Ticks can still be read afterwards, from the page cache or the disk.
+        """
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end = self._offset + self.tick_size * min(tick, self._ticks)
+        end -= end % mmap.PAGESIZE
+        if end > self._released:
+            self._mmap.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Scenario":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+@dataclass
+class ScenarioMarket(Market):
+    """
+    A market which offers the ticks of a scenario file, one per step.
+
+    loop: Start over after the last tick, instead of raising ScenarioError.
+    position: The tick offered by the next step.
+    """
+
+    path: Union[str, os.PathLike] = field(kw_only=True)
+    loop: bool = False
+    position: int = 0
+
+    def __post_init__(self):
+        self.scenario = Scenario(self.path)
+        self._release_every = max(1, _RELEASE_BYTES // max(1, self.scenario.tick_size))
+
+    def close(self) -> None:
+        self.scenario.close()
+
+    @property
+    def known_items(self) -> ItemCatalog:
+        return self.scenario.known_items
+
+    def tick(self) -> None:
+        scenario = self.scenario
+        if self.position >= len(scenario):
+            if not self.loop or not len(scenario):
+                raise ScenarioError(f"{self.path} ends after {len(scenario)} ticks")
+            self.position = 0
+
+        self.trades.buys.clear()
+        self.trades.sells.clear()
+        scenario.offers(self.position, self.trades.buys, self.trades.sells)
+        self.position += 1
+        if self.position % self._release_every == 0:
+            scenario.release(self.position)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Memory maps cannot be pickled, the file is opened again instead
+        del state["scenario"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.scenario = Scenario(self.path)
+        self.scenario.release(self.position)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m smithg.engine.scenario",
+        description="Convert and generate scenario files.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert a CSV scenario to binary")
+    convert.add_argument("csv", help="CSV scenario with tick,item,price,amount rows")
+    convert.add_argument("output", help="Binary scenario file to write")
+    gen = commands.add_parser("generate", help="Write the offers of a RandomMarket")
+    gen.add_argument("output", help="Binary scenario file to write")
+    gen.add_argument("--ticks", type=int, default=1000, help="Number of ticks (default: 1000)")
+    gen.add_argument("--seed", type=int, default=None, help="Seed of the market")
+    gen.add_argument("--items", default=None, help="Comma separated items (default: the canonical items)")
+    args = parser.parse_args(argv)
+
+    with open(args.output, "wb") as f:
+        if args.command == "convert":
+            ticks = convert_csv(args.csv, f)
+            print(f"Wrote {ticks} ticks to {args.output}")
+        else:
+            from smithg.engine import CANONICAL_ITEMS
+
+            items = args.items.split(",") if args.items else CANONICAL_ITEMS
+            generate(f, items, args.ticks, args.seed)
+
+
+if __name__ == "__main__":
+    main()
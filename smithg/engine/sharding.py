@@ -0,0 +1,266 @@
+"""
+Sharded worlds, which split a large population of agents over regions.
+
+Every region is a world with its own market, simulated in its own process. Regions
+run sync_every steps independently, then meet at a barrier where only the average
+offer price of every item in every region is exchanged. Agents get these prices as a
+RegionPrices event, and can sell items in another region with the Export command:
+the items are sold at the barrier after the export, at the average price of the
+target region minus the transport cost per item.
+
+Agents are dealt to the regions in turn, so every region gets a similar mix.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional, Sequence
+import logging
+import multiprocessing
+import multiprocessing.connection
+import traceback
+
+from smithg.agents import AgentFunc, Registry
+from smithg.datatypes import Amount, Item, Price, Recipe, commands, events
+from smithg.engine.engine import (
+    AgentContainer,
+    InvalidAgentState,
+    World,
+    agent_seed,
+    command_handler,
+    make_world,
+)
+from smithg.engine.profiler import Profiler
+
+_logger = logging.getLogger(__name__)
+
+# Average offer price of every item in one region
+RegionPriceTable = dict[Item, Price]
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class ShardConfig:
+    """Everything a region needs to build its world, except for its agents."""
+
+    known_items: tuple[Item, ...]
+    regions: int
+    steps: int = 1000
+    sync_every: int = 100
+    transport_cost: Price = 10
+    recipes: tuple[Recipe, ...] = ()
+    seed: Optional[int] = None
+    time_budget: Optional[float] = None
+    profile: bool = False
+
+
+@dataclass
+class RegionWorld(World):
+    """
+    A world which is one region of a sharded world.
+
+    It averages the offer prices of its market between barriers, and keeps the
+    exports of its agents until they are settled at the next barrier.
+    """
+
+    region: int = 0
+    regions: int = 1
+    transport_cost: Price = 10
+    exports: list[tuple[AgentContainer, Item, Amount, int]] = field(
+        default_factory=list, repr=False
+    )
+    # Sum and count of offer prices per item since the last barrier
+    _price_sums: dict[Item, list[int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def process_step(self) -> None:
+        super().process_step()
+        sums = self._price_sums
+        trades = self.market.trades
+        for offers in (trades.buy_offer_set(), trades.sell_offer_set()):
+            for offer in offers:
+                total = sums.get(offer.item)
+                if total is None:
+                    sums[offer.item] = [offer.price, 1]
+                else:
+                    total[0] += offer.price
+                    total[1] += 1
+
+    def average_prices(self) -> RegionPriceTable:
+        """Return the average offer prices since the last call, and start over."""
+        sums = self._price_sums
+        prices = {item: total // count for item, (total, count) in sums.items()}
+        self._price_sums = {}
+        return prices
+
+    def settle(self, prices: Sequence[RegionPriceTable]) -> None:
+        """Sell the pending exports at the given prices and tell agents the prices."""
+        for cont, item, amount, region in self.exports:
+            price = prices[region].get(item)
+            if price is None:
+                cont.state.items[item] += amount
+                cont.events_queue.append(events.ExportReturned(item, amount, region))
+            else:
+                net = max(0, price - self.transport_cost)
+                cont.state.balance += amount * net
+                cont.events_queue.append(events.SellReceipt(item, amount, net))
+        self.exports.clear()
+
+        evt = events.RegionPrices(self.region, tuple(prices), self.transport_cost)
+        for cont in self.player_agent_containers:
+            cont.events_queue.append(evt)
+
+
+@command_handler(commands.Export)
+def execute_export(cont: AgentContainer, world: World, cmd: commands.Export) -> None:
+    if not isinstance(world, RegionWorld):
+        raise InvalidAgentState("Agent tried to export outside of a sharded world")
+    if not 0 <= cmd.region < world.regions or cmd.region == world.region:
+        raise InvalidAgentState(f"Agent tried to export to invalid region {cmd.region}")
+    if cmd.item not in world.known_items:
+        raise InvalidAgentState(f"Agent tried to export non-existent item {cmd.item}")
+    if not 0 < cmd.amount <= cont.state.items[cmd.item]:
+        raise InvalidAgentState(f"Agent tried to export {cmd.amount} of {cmd.item}")
+    cont.state.items[cmd.item] -= cmd.amount
+    world.exports.append((cont, cmd.item, cmd.amount, cmd.region))
+
+
+def make_region(
+    config: ShardConfig, region: int, agents: Iterable[tuple[AgentFunc, str]]
+) -> RegionWorld:
+    seed = None
+    if config.seed is not None:
+        seed = agent_seed(config.seed, f"region-{region}")
+    world = make_world(
+        config.known_items,
+        player_agents=agents,
+        agent_registry=Registry(),
+        seed=seed,
+        world_cls=RegionWorld,
+        recipes=config.recipes,
+        time_budget=config.time_budget,
+    )
+    assert isinstance(world, RegionWorld)
+    world.region = region
+    world.regions = config.regions
+    world.transport_cost = config.transport_cost
+    if config.profile:
+        world.profiler = Profiler()
+    return world
+
+
+def _region_worker(
+    conn: multiprocessing.connection.Connection,
+    config: ShardConfig,
+    region: int,
+    agents: list[tuple[AgentFunc, str]],
+) -> None:
+    """
+    Simulate one region, driven by (steps, prices) messages from run_sharded.
+
+    Every message settles the exports of the previous window at prices, if any, then
+    simulates steps and answers the average prices. Steps None ends the simulation,
+    and is answered with the final balances and the profile. Failures are answered
+    as ("error", traceback).
+    """
+    world = None
+    try:
+        world = make_region(config, region, agents)
+        while True:
+            steps, prices = conn.recv()
+            if prices is not None:
+                world.settle(prices)
+            if steps is None:
+                containers = world.player_agent_containers
+                balances = [cont.state.balance for cont in containers]
+                conn.send(("ok", (balances, world.profiler)))
+                return
+            world.simulate(steps)
+            conn.send(("ok", world.average_prices()))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        if world is not None:
+            world.close()
+        conn.close()
+
+
+def _receive(conns: list[multiprocessing.connection.Connection]) -> list[Any]:
+    results = []
+    for region, conn in enumerate(conns):
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            raise ShardError(f"Region {region} died") from None
+        if status != "ok":
+            raise ShardError(f"Region {region} failed:\n{payload}")
+        results.append(payload)
+    return results
+
+
+def run_sharded(
+    config: ShardConfig,
+    agents: Sequence[tuple[AgentFunc, str]],
+    profiler: Optional[Profiler] = None,
+    mp_context: Optional[Any] = None,
+) -> list[Amount]:
+    """
+    Simulate the agents in config.regions regions and return their final balances.
+
+    Every region runs in its own process. The balances are in the order of agents.
+    If a profiler is given, the profiles of all regions are merged into it.
+    """
+    if config.regions < 1 or config.sync_every < 1:
+        raise ValueError("Sharded worlds need at least one region and sync step")
+    if any(hasattr(func, "add_to_world") for func, _ in agents):
+        raise ValueError("Batched agents cannot run in sharded worlds")
+    mp = mp_context or multiprocessing.get_context()
+    _logger.info("Simulating %d agents in %d regions", len(agents), config.regions)
+    conns = []
+    processes = []
+    results = None
+    try:
+        for region in range(config.regions):
+            conn, worker_conn = mp.Pipe()
+            region_agents = list(agents[region :: config.regions])
+            # Not daemonic, so that regions can start the workers of sandboxed
+            # agents. The regions are killed or joined below in any case
+            process = mp.Process(
+                target=_region_worker,
+                args=(worker_conn, config, region, region_agents),
+                name=f"smithg-region-{region}",
+            )
+            process.start()
+            worker_conn.close()
+            conns.append(conn)
+            processes.append(process)
+
+        prices: Optional[list[RegionPriceTable]] = None
+        done = 0
+        while done < config.steps:
+            steps = min(config.sync_every, config.steps - done)
+            for conn in conns:
+                conn.send((steps, prices))
+            prices = _receive(conns)
+            done += steps
+        for conn in conns:
+            conn.send((None, prices))
+        results = _receive(conns)
+    finally:
+        for conn in conns:
+            conn.close()
+        for process in processes:
+            # Forked regions hold the other ends of each other's pipes, so after a
+            # failure they would never see the connection close
+            if results is None:
+                process.kill()
+            process.join()
+
+    balances: list[Amount] = [0] * len(agents)
+    for region, (region_balances, region_profiler) in enumerate(results):
+        balances[region :: config.regions] = region_balances
+        if profiler is not None and region_profiler is not None:
+            profiler.merge(region_profiler)
+    return balances
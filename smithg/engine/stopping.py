@@ -0,0 +1,100 @@
+"""
+Conditions for stopping simulations early.
+
+A stop condition is any callable which takes the world after a step and returns True
+once the simulation should stop, see World.simulate. All conditions are called after
+every step, so they can keep state across steps. Such state belongs to one
+simulation; tournaments copy the conditions for every run.
+
+The conditions here only look at the balances of the agents and need O(agents) time
+per step.
+"""
+
+from typing import TYPE_CHECKING, Callable, Optional
+import time
+
+from smithg.datatypes import Amount
+
+if TYPE_CHECKING:
+    from smithg.engine.engine import World
+
+StopCondition = Callable[["World"], bool]
+
+
+def _balances(world: "World") -> list[Amount]:
+    return [cont.state.balance for cont in world.player_agent_containers]
+
+
+class RankStable:
+    """Stop when the ranking of the agents by balance did not change for steps."""
+
+    def __init__(self, steps: int):
+        self.steps = steps
+        self._ranking: list[int] = []
+        self._stable = 0
+
+    def __call__(self, world: "World") -> bool:
+        balances = _balances(world)
+        ranking = self._ranking
+        if len(ranking) == len(balances) and all(
+            balances[a] >= balances[b] for a, b in zip(ranking, ranking[1:])
+        ):
+            self._stable += 1
+        else:
+            self._ranking = sorted(
+                range(len(balances)), key=balances.__getitem__, reverse=True
+            )
+            self._stable = 0
+        return self._stable >= self.steps
+
+    def __repr__(self) -> str:
+        return f"RankStable({self.steps})"
+
+
+class BalancesConverged:
+    """
+    Stop when no balance changed by more than tolerance for steps.
+
+    tolerance: Largest change relative to the previous balance which counts as
+      converged. Balances below 1 count as 1.
+    """
+
+    def __init__(self, steps: int, tolerance: float = 0.001):
+        self.steps = steps
+        self.tolerance = tolerance
+        self._previous: Optional[list[Amount]] = None
+        self._stable = 0
+
+    def __call__(self, world: "World") -> bool:
+        balances = _balances(world)
+        previous = self._previous
+        tolerance = self.tolerance
+        if previous is not None and len(previous) == len(balances) and all(
+            abs(new - old) <= tolerance * max(abs(old), 1)
+            for new, old in zip(balances, previous)
+        ):
+            self._stable += 1
+        else:
+            self._stable = 0
+        self._previous = balances
+        return self._stable >= self.steps
+
+    def __repr__(self) -> str:
+        return f"BalancesConverged({self.steps}, {self.tolerance})"
+
+
+class WallTime:
+    """Stop once seconds have passed since the first step."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._deadline: Optional[float] = None
+
+    def __call__(self, world: "World") -> bool:
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + self.seconds
+        return now >= self._deadline
+
+    def __repr__(self) -> str:
+        return f"WallTime({self.seconds})"
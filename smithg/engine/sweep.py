@@ -0,0 +1,249 @@
+"""
+Sweeps over world settings, which tune the economy of the game.
+
+A sweep simulates configurations of world settings, like balance_init or the fuel cost
+of trades, with the same agents and seeds, and scores every configuration with an
+objective on the final balances, for example the spread between the mean scores of
+the agents. Configurations come from a grid of values or are sampled from it.
+
+Most configurations of a large space are not worth a full run. Successive halving
+runs all of them for a fraction of the steps first, keeps the best 1/eta of them and
+runs these eta times longer, until the survivors run all steps. Partial runs start
+from scratch with the same seeds as full runs, so every configuration of a rung is
+judged on the same worlds.
+"""
+
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence
+import concurrent.futures
+import contextlib
+import itertools
+import logging
+import math
+import random
+import statistics
+
+from smithg.agents import AgentFunc
+from smithg.datatypes import Amount, Item, Recipe
+from smithg.engine.tournament import RunConfig, run_world
+
+_logger = logging.getLogger(__name__)
+
+# Fields of World a sweep can change
+SETTINGS = (
+    "work_to_money",
+    "balance_init",
+    "balance_increase",
+    "command_fuel_init",
+    "command_fuel_increase",
+    "trade_cost",
+)
+
+Settings = dict[str, int]
+# Values of every setting, for example {"balance_init": range(0, 1001, 100)}
+SearchSpace = Mapping[str, Sequence[int]]
+# Scores final balances, one row of agent balances per run. Higher is better
+Objective = Callable[[Sequence[Sequence[Amount]]], float]
+
+
+def score_spread(balances: Sequence[Sequence[Amount]]) -> float:
+    """Standard deviation of the mean scores of the agents: how much skill matters."""
+    means = [statistics.fmean(scores) for scores in zip(*balances)]
+    return statistics.pstdev(means) if len(means) > 1 else 0.0
+
+
+def mean_score(balances: Sequence[Sequence[Amount]]) -> float:
+    """Mean final balance of all agents."""
+    return statistics.fmean(itertools.chain.from_iterable(balances))
+
+
+def winner_margin(balances: Sequence[Sequence[Amount]]) -> float:
+    """Mean lead of the winner over the runner-up."""
+    margins = []
+    for run in balances:
+        best, second = sorted(run, reverse=True)[:2] if len(run) > 1 else (0, 0)
+        margins.append(best - second)
+    return statistics.fmean(margins)
+
+
+OBJECTIVES: dict[str, Objective] = {
+    "spread": score_spread,
+    "mean": mean_score,
+    "margin": winner_margin,
+}
+
+
+def _check_space(space: SearchSpace) -> None:
+    unknown = set(space) - set(SETTINGS)
+    if unknown:
+        raise ValueError(
+            f"Cannot sweep {', '.join(sorted(unknown))}, only {', '.join(SETTINGS)}"
+        )
+    for name, values in space.items():
+        if not values:
+            raise ValueError(f"Setting {name} has no values to sweep")
+
+
+def grid(space: SearchSpace) -> list[Settings]:
+    """All combinations of the values of space."""
+    _check_space(space)
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def sample(
+    space: SearchSpace, samples: int, seed: Optional[int] = None
+) -> list[Settings]:
+    """
+    Up to samples distinct configurations with values drawn uniformly from space.
+
+    Fewer configurations are returned if space has fewer combinations.
+    """
+    _check_space(space)
+    size = math.prod(len(values) for values in space.values())
+    rand = random.Random(seed)
+    configs: dict[tuple[int, ...], Settings] = {}
+    while len(configs) < min(samples, size):
+        values = tuple(rand.choice(values) for values in space.values())
+        configs.setdefault(values, dict(zip(space, values)))
+    return list(configs.values())
+
+
+def rungs(configs: int, steps: int, eta: int = 3, min_steps: int = 50) -> list[int]:
+    """
+    Steps of every rung of successive halving for configs configurations.
+
+    Every rung runs eta times longer than the previous one and the last runs all
+    steps. There are as many rungs as it takes to get down to one configuration,
+    but no rung runs less than min_steps steps.
+    """
+    if eta < 2:
+        raise ValueError("Successive halving needs an eta of at least 2")
+    count = 1
+    while eta**count <= configs and steps // eta**count >= min_steps:
+        count += 1
+    return [steps // eta ** (count - 1 - i) for i in range(count)]
+
+
+@dataclass(frozen=True)
+class TrialResult:
+    """
+    Outcome of one configuration of a sweep.
+
+    steps: Steps of the last rung the configuration ran, all steps for finalists.
+    score: Objective of the runs of that rung.
+    """
+
+    settings: Settings
+    steps: int
+    score: float
+
+
+def run_trial(
+    config: RunConfig, settings: Settings, seed: int, steps: int
+) -> list[Amount]:
+    """Simulate one seeded world with settings for steps and return the balances."""
+    config = replace(config, steps=steps, settings=tuple(settings.items()))
+    return run_world(config, seed)
+
+
+# A trial is the index of a configuration, a seed and a number of steps
+_Trial = tuple[int, int, int]
+
+_worker_state: Optional[tuple[RunConfig, list[Settings]]] = None
+
+
+def _init_worker(config: RunConfig, configs: list[Settings]) -> None:
+    global _worker_state
+    _worker_state = (config, configs)
+
+
+def _run_in_worker(trial: _Trial) -> list[Amount]:
+    assert _worker_state is not None, "Worker was not initialized"
+    config, configs = _worker_state
+    index, seed, steps = trial
+    return run_trial(config, configs[index], seed, steps)
+
+
+def run_sweep(
+    configs: Sequence[Settings],
+    known_items: Iterable[Item],
+    agents: Sequence[tuple[AgentFunc, str]],
+    objective: Objective = score_spread,
+    steps: int = 1000,
+    runs: int = 3,
+    jobs: int = 1,
+    recipes: Iterable[Recipe] = (),
+    seed: Optional[int] = None,
+    eta: int = 3,
+    min_steps: int = 50,
+) -> list[TrialResult]:
+    """
+    Run a sweep over configs with successive halving, see the module docstring.
+
+    Every configuration is simulated on runs seeded worlds, derived from seed. Trials
+    are spread over jobs worker processes, so agents must be picklable for jobs > 1.
+    The results are ordered best first: the finalists by score, followed by the
+    configurations eliminated in later rungs before those eliminated earlier.
+    """
+    configs = list(configs)
+    for settings in configs:
+        _check_space({name: [value] for name, value in settings.items()})
+    if runs < 1:
+        raise ValueError("A sweep needs at least one run per configuration")
+    rand = random.Random(seed)
+    seeds = [rand.getrandbits(64) for _ in range(runs)]
+    config = RunConfig(tuple(known_items), tuple(agents), steps, tuple(recipes))
+    schedule = rungs(len(configs), steps, eta, min_steps)
+
+    if not configs:
+        return []
+
+    executor = None
+    with contextlib.ExitStack() as stack:
+        if jobs > 1 and len(configs) * runs > 1:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=_init_worker,
+                    initargs=(config, configs),
+                )
+            )
+
+        def run_trials(trials: list[_Trial]) -> list[list[Amount]]:
+            if executor is None:
+                return [run_trial(config, configs[i], s, n) for i, s, n in trials]
+            chunksize = max(1, len(trials) // (jobs * 4))
+            return list(executor.map(_run_in_worker, trials, chunksize=chunksize))
+
+        alive = list(range(len(configs)))
+        eliminated: list[list[TrialResult]] = []
+        for rung, rung_steps in enumerate(schedule):
+            _logger.info(
+                "Rung %d: %d configurations for %d steps", rung, len(alive), rung_steps
+            )
+            trials = [(i, seed, rung_steps) for i in alive for seed in seeds]
+            balances = iter(run_trials(trials))
+            scores = {i: objective([next(balances) for _ in seeds]) for i in alive}
+            ranked = sorted(alive, key=lambda i: scores[i], reverse=True)
+            keep = len(ranked)
+            if rung < len(schedule) - 1:
+                keep = math.ceil(len(ranked) / eta)
+            alive = ranked[:keep]
+            eliminated.append(
+                [TrialResult(configs[i], rung_steps, scores[i]) for i in ranked[keep:]]
+            )
+
+    results = [TrialResult(configs[i], schedule[-1], scores[i]) for i in alive]
+    for rung_results in reversed(eliminated):
+        results.extend(rung_results)
+    return results
+
+
+def table(results: Sequence[TrialResult]) -> tuple[list[str], list[list[Any]]]:
+    """Header and rows of results as one table, with a column per setting."""
+    names = sorted({name for r in results for name in r.settings}, key=SETTINGS.index)
+    rows = [
+        [*(r.settings.get(name) for name in names), r.steps, r.score] for r in results
+    ]
+    return [*names, "steps", "score"], rows
@@ -0,0 +1,490 @@
+"""
+Tournaments run many seeded worlds with the same agents and aggregate the results.
+
+A single simulation is noisy, so agents are ranked on the statistics of many runs
+instead. Runs are independent of each other and are spread over a process pool.
+
+With a ResultCache, results are cached per agent and run. Agents in a tournament
+cannot influence each other: the RandomMarket draws its offers independently of the
+trades of the agents, and seeded agents are seeded from their name. A run therefore
+only has to simulate the agents whose results are not cached, and changing one agent
+only reruns that agent.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional, Sequence, cast
+import concurrent.futures
+import copy
+import logging
+import math
+import os
+import random
+import statistics
+
+from smithg.agents import AgentFunc, Registry, global_agent_registry
+from smithg.datatypes import Amount, Item, Recipe
+from smithg.engine import engine
+from smithg.engine.cache import ResultCache, run_key
+from smithg.engine.profiler import Profiler
+from smithg.engine.scenario import ScenarioMarket, binary_scenario, is_binary
+from smithg.engine.stopping import StopCondition
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AgentStats:
+    """
+    Aggregated results of one agent over all runs of a tournament.
+
+    mean: Mean final balance.
+    stddev: Sample standard deviation of the final balance.
+    win_rate: Fraction of runs the agent finished with the highest balance. Runs with
+      several tied winners are split evenly between them.
+    runs: Number of runs the statistics are based on.
+    ci: Half width of the confidence interval of the mean, 0 for a single run.
+    win_runs: Number of runs win_rate is based on, those which all agents played.
+    """
+
+    name: str
+    mean: float
+    stddev: float
+    win_rate: float
+    runs: int
+    ci: float = 0.0
+    win_runs: int = 0
+
+    @property
+    def interval(self) -> tuple[float, float]:
+        return self.mean - self.ci, self.mean + self.ci
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    """Everything needed to simulate a world, except for the seed."""
+
+    known_items: tuple[Item, ...]
+    agents: tuple[tuple[AgentFunc, str], ...]
+    steps: int
+    recipes: tuple[Recipe, ...] = ()
+    time_budget: Optional[float] = None
+    profile: bool = False
+    stop: tuple[StopCondition, ...] = ()
+    scenario: Optional[str] = None
+    # Further World fields as (name, value) pairs, see engine.make_world
+    settings: tuple[tuple[str, Any], ...] = ()
+
+
+# A run is a seed and the indices of the agents to simulate, None for all of them
+_Run = tuple[int, Optional[tuple[int, ...]]]
+
+_worker_config: Optional[RunConfig] = None
+
+
+def _init_worker(config: RunConfig) -> None:
+    global _worker_config
+    _worker_config = config
+
+
+def _run_in_worker(run: _Run) -> tuple[list[Amount], Optional[Profiler]]:
+    assert _worker_config is not None, "Worker was not initialized"
+    return _run_profiled(_worker_config, run)
+
+
+def _run_profiled(
+    config: RunConfig, run: _Run
+) -> tuple[list[Amount], Optional[Profiler]]:
+    profiler = Profiler() if config.profile else None
+    seed, agent_indices = run
+    return run_world(config, seed, profiler, agent_indices), profiler
+
+
+def run_world(
+    config: RunConfig,
+    seed: int,
+    profiler: Optional[Profiler] = None,
+    agent_indices: Optional[Sequence[int]] = None,
+) -> list[Amount]:
+    """
+    Simulate one seeded world and return the final balance of every agent.
+
+    agent_indices: Only simulate these agents of the config, in this order.
+    """
+    agents = config.agents
+    if agent_indices is not None:
+        agents = tuple(agents[i] for i in agent_indices)
+    # Every run starts with pristine agents, state from previous runs must not leak
+    agents = copy.deepcopy(agents)
+    market = None
+    known_items = config.known_items
+    if config.scenario is not None:
+        market = ScenarioMarket(path=config.scenario)
+        known_items += tuple(market.known_items)
+    world = engine.make_world(
+        known_items,
+        player_agents=agents,
+        agent_registry=Registry(),
+        seed=seed,
+        market=market,
+        recipes=config.recipes,
+        time_budget=config.time_budget,
+        settings=dict(config.settings),
+    )
+    world.profiler = profiler
+    try:
+        # Stop conditions keep state, every run gets fresh ones
+        world.simulate(config.steps, stop=copy.deepcopy(config.stop))
+    finally:
+        world.close()
+    return [cont.state.balance for cont in world.player_agent_containers]
+
+
+def run_seeds(
+    seeds: Iterable[int],
+    known_items: Iterable[Item],
+    agents: Sequence[tuple[AgentFunc, str]],
+    steps: int = 1000,
+    jobs: int = 1,
+    recipes: Iterable[Recipe] = (),
+    time_budget: Optional[float] = None,
+    profiler: Optional[Profiler] = None,
+    cache: Optional[ResultCache] = None,
+    stop: Iterable[StopCondition] = (),
+    scenario: Optional[str] = None,
+    settings: Optional[Mapping[str, Any]] = None,
+) -> list[list[Amount]]:
+    """
+    Simulate one world per seed and return the final balances of every run.
+
+    With jobs > 1, runs are spread over a pool of worker processes. Agents are sent to
+    every worker once, so they must be picklable. If a profiler is given, the profiles
+    of all simulated runs are merged into it.
+
+    With a cache, only agents whose results are not cached are simulated. Sandboxed
+    runs depend on timing and are never cached, and neither are runs with stop
+    conditions, which depend on all agents of the run, or runs on a scenario file,
+    which can change without the cache noticing.
+
+    With a scenario, every run offers the same ticks of that scenario file, and only
+    the agents are seeded differently. settings are further World fields, see
+    engine.make_world.
+    """
+    if any(hasattr(func, "add_to_world") for func, _ in agents):
+        # Their members would not line up with the results of the agents
+        raise ValueError("Batched agents cannot run in tournaments")
+    if scenario is not None and not is_binary(scenario):
+        # Convert CSV scenarios once, rather than in every run
+        with binary_scenario(scenario) as path:
+            return run_seeds(
+                seeds,
+                known_items,
+                agents,
+                steps=steps,
+                jobs=jobs,
+                recipes=recipes,
+                time_budget=time_budget,
+                profiler=profiler,
+                cache=cache,
+                stop=stop,
+                scenario=path,
+                settings=settings,
+            )
+    seeds = list(seeds)
+    config = RunConfig(
+        tuple(known_items),
+        tuple(agents),
+        steps,
+        tuple(recipes),
+        time_budget,
+        profile=profiler is not None,
+        stop=tuple(stop),
+        scenario=scenario,
+        settings=tuple((settings or {}).items()),
+    )
+
+    uncachable = time_budget is not None or config.stop or scenario is not None
+    if cache is None or uncachable:
+        keys: list[list[Optional[str]]] = [[None] * len(agents) for _ in seeds]
+        cached: dict[str, Amount] = {}
+    else:
+        keys = [
+            [
+                run_key(
+                    agent,
+                    name,
+                    seed,
+                    config.known_items,
+                    steps,
+                    config.recipes,
+                    dict(config.settings),
+                )
+                for agent, name in agents
+            ]
+            for seed in seeds
+        ]
+        cached = cache.get_many(k for row in keys for k in row if k is not None)
+
+    balances: list[list[Optional[Amount]]] = [
+        [cached.get(k) if k is not None else None for k in row] for row in keys
+    ]
+    runs: list[_Run] = []
+    for seed, row in zip(seeds, balances):
+        missing = tuple(i for i, balance in enumerate(row) if balance is None)
+        if missing:
+            runs.append((seed, None if len(missing) == len(row) else missing))
+    _logger.info("Simulating %d of %d runs, the rest is cached", len(runs), len(seeds))
+
+    if jobs <= 1 or len(runs) <= 1:
+        results = [_run_profiled(config, run) for run in runs]
+    else:
+        jobs = min(jobs, len(runs))
+        # Large chunks keep the pool busy without paying IPC for every single run
+        chunksize = max(1, len(runs) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(config,)
+        ) as executor:
+            results = list(executor.map(_run_in_worker, runs, chunksize=chunksize))
+
+    new_results = {}
+    run_indices = {seed: i for i, seed in enumerate(seeds)}
+    for (seed, agent_indices), (run_balances, _) in zip(runs, results):
+        i = run_indices[seed]
+        for agent, balance in zip(agent_indices or range(len(agents)), run_balances):
+            balances[i][agent] = balance
+            if keys[i][agent] is not None:
+                new_results[keys[i][agent]] = balance
+    if cache is not None and new_results:
+        cache.put_many(new_results)
+
+    if profiler is not None:
+        for _, run_profiler in results:
+            profiler.merge(run_profiler)  # type: ignore
+    return cast(list[list[Amount]], balances)
+
+
+def t_quantile(p: float, df: int) -> float:
+    """
+    Quantile p of Student's t distribution with df degrees of freedom.
+
+    Exact for df 1 and 2. Larger df use the Cornish-Fisher expansion around the
+    normal quantile (Abramowitz and Stegun 26.7.5), which is accurate to about 1%
+    from df = 3 and exact in the limit.
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = statistics.NormalDist().inv_cdf(p)
+    terms = (
+        (z**3 + z) / 4,
+        (5 * z**5 + 16 * z**3 + 3 * z) / 96,
+        (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384,
+        (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / 92160,
+    )
+    return z + sum(term / df**k for k, term in enumerate(terms, start=1))
+
+
+def aggregate(
+    names: Sequence[str],
+    balances: Sequence[Sequence[Optional[Amount]]],
+    confidence: float = 0.95,
+) -> list[AgentStats]:
+    """
+    Aggregate the final balances of several runs into per agent statistics.
+
+    Agents which sat out a run have None as its balance, see run_adaptive_tournament.
+    Only runs of all agents count for win rates.
+    """
+    wins = [0.0] * len(names)
+    complete = 0
+    for run in balances:
+        if None in run:
+            continue
+        complete += 1
+        best = max(run, default=0)
+        winners = [i for i, balance in enumerate(run) if balance == best]
+        for i in winners:
+            wins[i] += 1 / len(winners)
+
+    stats = []
+    for i, name in enumerate(names):
+        scores = [run[i] for run in balances if run[i] is not None]
+        stddev = statistics.stdev(scores) if len(scores) > 1 else 0.0  # type: ignore
+        ci = 0.0
+        if len(scores) > 1:
+            t = t_quantile((1 + confidence) / 2, len(scores) - 1)
+            ci = t * stddev / math.sqrt(len(scores))
+        stats.append(
+            AgentStats(
+                name=name,
+                mean=statistics.fmean(scores) if scores else 0.0,  # type: ignore
+                stddev=stddev,
+                win_rate=wins[i] / complete if complete else 0.0,
+                runs=len(scores),
+                ci=ci,
+                win_runs=complete,
+            )
+        )
+    return stats
+
+
+def unresolved(stats: Sequence[AgentStats]) -> list[int]:
+    """
+    Indices of the agents whose confidence interval overlaps that of a neighbour.
+
+    Once no neighbours in the ranking overlap, no two agents do, and the ranking is
+    significant.
+    """
+    ranked = sorted(range(len(stats)), key=lambda i: stats[i].mean, reverse=True)
+    overlapping = set()
+    for better, worse in zip(ranked, ranked[1:]):
+        if stats[better].interval[0] <= stats[worse].interval[1]:
+            overlapping.update((better, worse))
+    return sorted(overlapping)
+
+
+def run_tournament(
+    runs: int,
+    known_items: Iterable[Item],
+    registry: Registry = global_agent_registry,
+    steps: int = 1000,
+    jobs: Optional[int] = None,
+    seed: Optional[int] = None,
+    recipes: Iterable[Recipe] = (),
+    time_budget: Optional[float] = None,
+    profiler: Optional[Profiler] = None,
+    cache: Optional[ResultCache] = None,
+    stop: Iterable[StopCondition] = (),
+    scenario: Optional[str] = None,
+    confidence: float = 0.95,
+) -> list[AgentStats]:
+    """
+    Run a tournament of all agents in the registry.
+
+    runs: Number of worlds to simulate.
+    jobs: Number of worker processes. Defaults to the number of CPUs.
+    seed: Seed for the tournament. Every run gets its own seed derived from it, so the
+      same seed reproduces the same tournament.
+    time_budget: If set, agents run sandboxed with this many seconds per step.
+    profiler: If set, the profiles of all runs are merged into it.
+    cache: If set, results are taken from and stored in this cache.
+    stop: Conditions to end runs early, see smithg.engine.stopping.
+    scenario: If set, runs offer the ticks of this scenario file instead of random
+      offers, see smithg.engine.scenario.
+    confidence: Level of the confidence intervals of the results.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    rand = random.Random(seed)
+    seeds = [rand.getrandbits(64) for _ in range(runs)]
+
+    _logger.info("Running tournament with %d runs on %d jobs", runs, jobs)
+    balances = run_seeds(
+        seeds,
+        known_items,
+        registry.agents,
+        steps=steps,
+        jobs=jobs,
+        recipes=recipes,
+        time_budget=time_budget,
+        profiler=profiler,
+        cache=cache,
+        stop=stop,
+        scenario=scenario,
+    )
+    return aggregate([name for _, name in registry.agents], balances, confidence)
+
+
+def run_adaptive_tournament(
+    max_runs: int,
+    known_items: Iterable[Item],
+    registry: Registry = global_agent_registry,
+    steps: int = 1000,
+    jobs: Optional[int] = None,
+    seed: Optional[int] = None,
+    recipes: Iterable[Recipe] = (),
+    time_budget: Optional[float] = None,
+    profiler: Optional[Profiler] = None,
+    cache: Optional[ResultCache] = None,
+    scenario: Optional[str] = None,
+    confidence: float = 0.95,
+    min_runs: int = 5,
+) -> list[AgentStats]:
+    """
+    Run a tournament until the ranking of the agents is significant.
+
+    All agents play min_runs runs first. After that, only the agents whose
+    confidence interval overlaps that of a neighbour in the ranking play more runs,
+    one round of runs at a time, until no intervals overlap at the confidence level
+    or the agents played max_runs runs. Agents of a world do not influence each
+    other, so clearly ranked agents can sit out the runs of the others.
+
+    The intervals are checked after every round, which makes a wrong ranking somewhat
+    more likely than the confidence level alone suggests.
+
+    The other arguments are those of run_tournament. Stop conditions depend on all
+    agents of a run, and are therefore not supported.
+    """
+    if not 2 <= min_runs <= max_runs:
+        raise ValueError("Adaptive tournaments need 2 <= min_runs <= max_runs")
+    if scenario is not None and not is_binary(scenario):
+        # Convert CSV scenarios once for all rounds
+        with binary_scenario(scenario) as path:
+            return run_adaptive_tournament(
+                max_runs,
+                known_items,
+                registry,
+                steps=steps,
+                jobs=jobs,
+                seed=seed,
+                recipes=recipes,
+                time_budget=time_budget,
+                profiler=profiler,
+                cache=cache,
+                scenario=path,
+                confidence=confidence,
+                min_runs=min_runs,
+            )
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    agents = registry.agents
+    names = [name for _, name in agents]
+    rand = random.Random(seed)
+
+    balances: list[list[Optional[Amount]]] = []
+    stats = aggregate(names, balances, confidence)
+    active = list(range(len(agents)))
+    rounds = 0
+    while active:
+        # Rounds fill the worker pool, but do not run agents past max_runs
+        played = max(stats[i].runs for i in active)
+        count = min_runs if not balances else min(max(jobs, 2), max_runs - played)
+        seeds = [rand.getrandbits(64) for _ in range(count)]
+        round_balances = run_seeds(
+            seeds,
+            known_items,
+            [agents[i] for i in active],
+            steps=steps,
+            jobs=jobs,
+            recipes=recipes,
+            time_budget=time_budget,
+            profiler=profiler,
+            cache=cache,
+            scenario=scenario,
+        )
+        for run in round_balances:
+            row: list[Optional[Amount]] = [None] * len(agents)
+            for i, balance in zip(active, run):
+                row[i] = balance
+            balances.append(row)
+        rounds += 1
+
+        stats = aggregate(names, balances, confidence)
+        active = [i for i in unresolved(stats) if stats[i].runs < max_runs]
+    _logger.info(
+        "Adaptive tournament finished after %d rounds and %d runs",
+        rounds,
+        sum(s.runs for s in stats),
+    )
+    return stats
@@ -0,0 +1,35 @@
+from typing import Iterable, Optional, Sequence
+
+import smithg
+import smithg.engine
+from smithg.engine import engine
+
+
+def work_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    """Earns work_to_money every step."""
+    return [smithg.commands.Work(amount=1)]
+
+
+def busy_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    """Turns all of its command fuel into money every step."""
+    return [smithg.commands.Work(amount=env.command_fuel)]
+
+
+def idle_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    return []
+
+
+def make_world(
+    agents: Optional[Sequence[tuple[smithg.agents.AgentFunc, str]]] = None,
+    known_items: Iterable[str] = ("item",),
+    seed: Optional[int] = None,
+) -> engine.World:
+    """World of agents, by default a worker and an idler, without registered agents."""
+    if agents is None:
+        agents = [(work_agent, "worker"), (idle_agent, "idler")]
+    return engine.make_world(
+        known_items,
+        player_agents=agents,
+        agent_registry=smithg.agents.Registry(),
+        seed=seed,
+    )
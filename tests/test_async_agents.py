@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import smithg
+from smithg.engine import engine
+
+
+def test_coroutine_agents_run_concurrently_and_apply_in_order():
+    applied = []
+
+    def make_agent(name: str, delay: float):
+        async def agent(
+            env: smithg.Environment, events: smithg.EventList
+        ) -> smithg.CommandList:
+            await asyncio.sleep(delay)
+            applied.append(name)
+            return [smithg.commands.Work(amount=1)]
+
+        return agent
+
+    def sync_agent(
+        env: smithg.Environment, events: smithg.EventList
+    ) -> smithg.CommandList:
+        return [smithg.commands.Work(amount=2)]
+
+    registry = smithg.agents.Registry()
+    registry.register_agent(make_agent("slow", 0.2), "slow")
+    registry.register_agent(sync_agent, "sync")
+    registry.register_agent(make_agent("fast", 0.1), "fast")
+
+    world = engine.World(known_items=["item"])
+    world.add_agents_from_registry(registry)
+    start = time.monotonic()
+    try:
+        world.step(0)
+    finally:
+        world.close()
+
+    assert time.monotonic() - start < 0.29
+    assert applied == ["fast", "slow"]
+    assert [c.state.balance for c in world.player_agent_containers] == [110, 120, 110]
+
+
+def test_coroutine_agents_missing_the_deadline_time_out():
+    seen_events = []
+
+    async def hanging_agent(
+        env: smithg.Environment, events: smithg.EventList
+    ) -> smithg.CommandList:
+        seen_events.append(list(events))
+        if not events:
+            await asyncio.sleep(10)
+        return []
+
+    world = engine.World(known_items=["item"], step_deadline=0.05)
+    world.add_agent(hanging_agent)
+    try:
+        world.step(0)
+        world.step(1)
+    finally:
+        world.close()
+
+    assert seen_events == [[], [smithg.events.StepTimeout(0.05)]]
+
+
+def test_coroutine_agents_ignoring_cancellation_are_abandoned():
+    async def stubborn_agent(
+        env: smithg.Environment, events: smithg.EventList
+    ) -> smithg.CommandList:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await asyncio.sleep(3)
+        return []
+
+    world = engine.World(known_items=["item"], step_deadline=0.05)
+    world.add_agent(stubborn_agent)
+    start = time.monotonic()
+    try:
+        world.step(0)
+    finally:
+        world.close()
+
+    assert time.monotonic() - start < 1
+    assert world.player_agent_containers[0].events_queue == [
+        smithg.events.StepTimeout(0.05)
+    ]
@@ -0,0 +1,150 @@
+import pytest
+
+import smithg
+from smithg.engine import CANONICAL_ITEMS, CANONICAL_RECIPES, engine
+from smithg.engine.bus import CommandExecuted
+
+np = pytest.importorskip("numpy")
+batched = pytest.importorskip("smithg.engine.batched")
+compact = pytest.importorskip("smithg.engine.compact")
+
+
+class Thresholds(batched.BatchedAgent):
+    """Buys ore and sells above a price which differs per member, and smelts ore."""
+
+    def act(self, env):
+        n = len(env.balances)
+        threshold = np.linspace(1000, 9000, n).astype(int)
+        fuel = env.command_fuel.copy()
+        cost = env.trade_cost
+        cmds = batched.BatchCommands(
+            sell=np.zeros_like(env.inventories),
+            sell_price=np.zeros_like(env.inventories),
+            buy=np.zeros_like(env.inventories),
+            buy_price=np.zeros_like(env.inventories),
+        )
+
+        held = env.inventories * (env.buy_amounts > 0)
+        item = held.argmax(axis=1)
+        selling = (held.max(axis=1) > 0) & (fuel >= cost)
+        rows = np.flatnonzero(selling)
+        cmds.sell[rows, item[rows]] = env.inventories[rows, item[rows]]
+        cmds.sell_price[rows, item[rows]] = threshold[rows]
+        fuel -= cost * selling
+
+        ore = env.known_items.ids["iron_ore"]
+        buying = fuel >= cost
+        cmds.buy[buying, ore] = 2
+        cmds.buy_price[buying, ore] = threshold[buying]
+        fuel -= cost * buying
+
+        # Smelt the ore which was there before buying and was not sold
+        stock = env.inventories[:, ore] - cmds.sell[:, ore]
+        cmds.forge = np.zeros((n, len(env.recipes)), dtype=int)
+        cmds.forge[:, 0] = np.minimum(stock // 2, fuel // 20)
+        fuel -= 20 * cmds.forge[:, 0]
+        cmds.work = fuel // 2
+        return cmds
+
+
+def make_world(world_cls=engine.World, batch_size=50, **settings):
+    return engine.make_world(
+        CANONICAL_ITEMS,
+        player_agents=[(Thresholds(batch_size), "thresholds")],
+        agent_registry=smithg.agents.Registry(),
+        seed=5,
+        world_cls=world_cls,
+        recipes=CANONICAL_RECIPES,
+        settings=settings,
+    )
+
+
+def states(world):
+    return [
+        (
+            cont.state.balance,
+            cont.state.command_fuel,
+            {item: amount for item, amount in cont.state.items.items() if amount},
+        )
+        for cont in world.player_agent_containers
+    ]
+
+
+def test_members_are_agents_of_the_world():
+    world = make_world(batch_size=3)
+    names = [cont.agent_name for cont in world.player_agent_containers]
+    assert names == ["thresholds[0]", "thresholds[1]", "thresholds[2]"]
+
+    world.simulate(30)
+    results = states(world)
+    assert len({balance for balance, _, _ in results}) > 1
+    batch = world.player_agent_containers[0].batch
+    assert batch.balances(world).tolist() == [balance for balance, _, _ in results]
+
+
+@pytest.mark.parametrize("trade_cost", [50, 20])
+def test_vectorized_commands_match_decoded_commands(trade_cost):
+    vectorized = make_world(trade_cost=trade_cost)
+    decoded = make_world(trade_cost=trade_cost)
+    executed = []
+    decoded.subscribe(CommandExecuted, lambda evt: executed.append(evt.command))
+
+    vectorized.simulate(100)
+    decoded.simulate(100)
+
+    assert states(vectorized) == states(decoded)
+    kinds = {type(cmd) for cmd in executed}
+    assert kinds == {
+        smithg.commands.Work,
+        smithg.commands.BuyItem,
+        smithg.commands.SellItem,
+        smithg.commands.Forge,
+    }
+
+
+def test_compact_world_matches_world():
+    plain = make_world()
+    compacted = make_world(compact.CompactWorld)
+    plain.simulate(100)
+    compacted.simulate(100)
+    assert states(compacted) == states(plain)
+
+
+def test_batches_survive_checkpoints(tmp_path):
+    world = make_world(compact.CompactWorld)
+    world.simulate(10)
+    world.checkpoint(tmp_path / "world.ckpt")
+    restored = engine.World.restore(tmp_path / "world.ckpt")
+    world.simulate(20)
+    restored.simulate(20)
+    assert states(restored) == states(world)
+
+
+def test_invalid_batched_commands_fail():
+    class Overworked(batched.BatchedAgent):
+        def act(self, env):
+            return batched.BatchCommands(work=env.command_fuel + np.arange(2))
+
+    world = engine.World(known_items=["a"])
+    world.add_agent(Overworked(2), "overworked")
+    with pytest.raises(engine.InvalidAgentState, match=r"overworked\[1\] ran out"):
+        world.simulate(1)
+
+    class Misshaped(batched.BatchedAgent):
+        def act(self, env):
+            return batched.BatchCommands(work=np.zeros(3, dtype=int))
+
+    world = engine.World(known_items=["a"])
+    world.add_agent(Misshaped(2), "misshaped")
+    with pytest.raises(engine.InvalidAgentState, match="shape"):
+        world.simulate(1)
+
+    class Giveaway(batched.BatchedAgent):
+        def act(self, env):
+            buy = np.ones_like(env.inventories)
+            return batched.BatchCommands(buy=buy, buy_price=-buy)
+
+    world = engine.World(known_items=["a"])
+    world.add_agent(Giveaway(2), "giveaway")
+    with pytest.raises(engine.InvalidAgentState, match="positive price"):
+        world.simulate(1)
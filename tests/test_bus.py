@@ -0,0 +1,102 @@
+import logging
+import random
+
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import bus
+from smithg.engine.engine import InvalidAgentState, World
+from smithg.engine.market import RandomMarket
+from smithg.engine.profiler import Profiler
+
+
+def trader(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    cmds: smithg.CommandList = [smithg.commands.Work(amount=1)]
+    for offer in env.sell_offers:
+        cmds.append(smithg.commands.BuyItem(offer.item, 1, offer.price))
+    return cmds
+
+
+def make_world() -> World:
+    market = RandomMarket(rand=random.Random(1), known_items=["item"])
+    world = World(known_items=["item"], market=market, command_fuel_increase=1000)
+    world.add_agent(trader)
+    return world
+
+
+@pytest.mark.parametrize("profiled", [False, True])
+def test_observers_see_engine_events(profiled):
+    world = make_world()
+    if profiled:
+        world.profiler = Profiler()
+    seen: dict[type, list] = {}
+    for event_type in (bus.TickStarted, bus.AgentCalled, bus.CommandExecuted):
+        world.subscribe(event_type, seen.setdefault(event_type, []).append)
+    fills: list[bus.TradeFilled] = []
+    world.subscribe(bus.TradeFilled, fills.append)
+
+    world.simulate(20)
+
+    assert [e.step for e in seen[bus.TickStarted]] == list(range(1, 21))
+    assert len(seen[bus.AgentCalled]) == 20
+    assert seen[bus.AgentCalled][0].agent is world.player_agent_containers[0]
+    executed = [type(e.command) for e in seen[bus.CommandExecuted]]
+    assert executed.count(smithg.commands.Work) == 20
+    assert fills and all(f.buy and f.item == "item" and f.maker is None for f in fills)
+    assert world.player_agent_containers[0].state.items["item"] == sum(
+        f.amount for f in fills
+    )
+
+
+def test_invalid_commands_are_reported_before_raising():
+    def cheater(env, events):
+        return [smithg.commands.Work(amount=10_000)]
+
+    world = World(known_items=["item"])
+    world.add_agent(cheater)
+    failures: list[bus.AgentFailed] = []
+    world.subscribe(bus.AgentFailed, failures.append)
+    with pytest.raises(InvalidAgentState):
+        world.simulate(1)
+    assert [f.agent.agent_name for f in failures] == ["cheater"]
+    assert "ran out of fuel" in failures[0].reason
+
+
+def test_unsubscribing_the_last_observer_removes_the_bus():
+    world = make_world()
+    assert world.bus is None
+    calls: list[bus.TickStarted] = []
+    world.subscribe(bus.TickStarted, calls.append)
+    world.simulate(1)
+    world.unsubscribe(bus.TickStarted, calls.append)
+    assert world.bus is None
+    world.simulate(1)
+    assert len(calls) == 1
+
+
+def test_events_are_only_created_for_observed_types(monkeypatch):
+    created = []
+    monkeypatch.setattr(bus.TradeFilled, "__init__", lambda *a: created.append(a))
+    event_bus = bus.EventBus()
+    event_bus.subscribe(bus.TickStarted, lambda event: None)
+    event_bus.emit(bus.TradeFilled, None, "item", 1, 1, True, None)
+    assert created == [] and not event_bus.listens(bus.TradeFilled)
+
+
+def test_trades_are_logged_at_info_level(caplog):
+    with caplog.at_level(logging.INFO, logger="smithg.engine.engine"):
+        world = make_world()
+        world.simulate(5)
+    assert any(r.getMessage().startswith("Agent bought") for r in caplog.records)
+
+    with caplog.at_level(logging.WARNING, logger="smithg.engine.engine"):
+        assert make_world().bus is None
+
+
+def test_restored_worlds_keep_logging(caplog, tmp_path):
+    make_world().checkpoint(str(tmp_path / "world.ckpt"))
+    with caplog.at_level(logging.INFO, logger="smithg.engine.engine"):
+        world = World.restore(str(tmp_path / "world.ckpt"))
+        world.simulate(5)
+    assert any(r.getMessage().startswith("Agent bought") for r in caplog.records)
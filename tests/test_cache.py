@@ -0,0 +1,61 @@
+import random
+
+import smithg
+import smithg.engine
+from smithg.agents.examples.random_agent import RandomAgent
+from smithg.engine import tournament
+from smithg.engine.cache import ResultCache
+from smithg.engine.profiler import Profiler
+
+from conftest import work_agent
+
+
+def test_cache_evicts_least_recently_used_results(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=3 * (1 + 4))
+    cache.put_many({"a": 1000, "b": 2000, "c": 3000})
+    assert cache.get("a") == 1000
+    cache.put("d", 4000)
+
+    assert cache.get("b") is None
+    assert cache.get_many(["a", "c", "d"]) == {"a": 1000, "c": 3000, "d": 4000}
+    assert cache.size() <= cache.max_bytes
+    cache.close()
+
+
+def test_tournament_only_simulates_agents_without_cached_results(tmp_path):
+    cache = ResultCache(tmp_path)
+    agents = [(RandomAgent(rand=random.Random()), "random"), (work_agent, "worker")]
+    run = dict(
+        seeds=[1, 2, 3],
+        known_items=smithg.engine.CANONICAL_ITEMS,
+        steps=50,
+        recipes=smithg.engine.CANONICAL_RECIPES,
+    )
+    uncached = tournament.run_seeds(agents=agents, **run)
+    assert tournament.run_seeds(agents=agents, cache=cache, **run) == uncached
+
+    profiler = Profiler()
+    cached = tournament.run_seeds(agents=agents, cache=cache, profiler=profiler, **run)
+    assert cached == uncached
+    assert profiler.phases == {}
+
+    newcomer = (work_agent, "newcomer")
+    profiler = Profiler()
+    balances = tournament.run_seeds(
+        agents=[*agents, newcomer], cache=cache, profiler=profiler, **run
+    )
+    assert balances == [[*row, row[1]] for row in uncached]
+    assert set(profiler.agents) == {"newcomer"}
+    cache.close()
+
+
+def test_cache_keys_depend_on_world_settings(tmp_path):
+    cache = ResultCache(tmp_path)
+    run = dict(
+        seeds=[1], known_items=["item"], agents=[(work_agent, "worker")], steps=5
+    )
+
+    assert tournament.run_seeds(cache=cache, **run) == [[150]]
+    rich = tournament.run_seeds(cache=cache, settings={"balance_init": 1000}, **run)
+    assert rich == [[1050]]
+    cache.close()
@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field
+import random
+
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.agents.examples.random_agent import RandomAgent
+from smithg.engine import engine
+from smithg.engine.orderbook import OrderBookMarket
+
+from conftest import idle_agent
+
+
+@dataclass
+class LookupAgent(smithg.Agent):
+    table: list[int] = field(default_factory=lambda: list(range(1000)))
+
+    def process(self, env: smithg.Environment) -> None:
+        pass
+
+
+def make_world(world_cls: type[engine.World] = engine.World) -> engine.World:
+    return engine.make_world(
+        smithg.engine.CANONICAL_ITEMS,
+        player_agents=[
+            (RandomAgent(rand=random.Random(1)), "random"),
+            (RandomAgent(rand=random.Random(2)), "other"),
+        ],
+        agent_registry=smithg.agents.Registry(),
+        seed=3,
+        world_cls=world_cls,
+        recipes=smithg.engine.CANONICAL_RECIPES,
+    )
+
+
+def states(world: engine.World) -> list[tuple]:
+    return [
+        (
+            c.state.balance,
+            c.state.command_fuel,
+            {k: v for k, v in c.state.items.items() if v},
+            list(c.events_queue),
+        )
+        for c in world.player_agent_containers
+    ]
+
+
+def test_restored_world_continues_like_the_original(tmp_path):
+    path = str(tmp_path / "world.ckpt")
+    world = make_world()
+    world.simulate(20, checkpoint=path, checkpoint_every=10)
+    world.simulate(30)
+    world.close()
+
+    restored = engine.World.restore(path)
+    assert restored.step_count == 20
+    restored.simulate(30)
+    assert states(restored) == states(world)
+    assert restored.market.trades == world.market.trades
+
+
+def test_later_checkpoints_only_append_changes(tmp_path):
+    path = str(tmp_path / "world.ckpt")
+    world = make_world()
+    for i in range(10):
+        world.add_agent(LookupAgent(), f"lookup_{i}")
+    full = world.checkpoint(path)
+    world.step(0)
+    delta = world.checkpoint(path)
+    world.close()
+
+    # The lookup agents did not change and were not written again
+    assert 0 < delta < full / 2
+    assert engine.World.restore(path).step_count == 1
+
+
+def test_torn_checkpoint_falls_back_to_the_last_complete_one(tmp_path):
+    path = tmp_path / "world.ckpt"
+    world = make_world()
+    world.checkpoint(str(path))
+    world.simulate(5)
+    world.checkpoint(str(path))
+    world.close()
+
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    assert engine.World.restore(str(path)).step_count == 0
+
+
+def test_order_book_owners_survive_a_restore(tmp_path):
+    path = str(tmp_path / "book.ckpt")
+    world = engine.World(known_items=["item"], market=OrderBookMarket())
+    world.add_agent(idle_agent, "seller")
+    seller = world.player_agent_containers[0]
+    seller.state.items["item"] = 10
+    engine.execute_command(seller, world, smithg.commands.SellItem("item", 10, 20))
+    world.checkpoint(path)
+    world.close()
+
+    restored = engine.World.restore(path)
+    seller = restored.player_agent_containers[0]
+    engine.execute_command(seller, restored, smithg.commands.CancelOrders("item"))
+    assert seller.state.items["item"] == 10
+
+
+def test_compact_world_keeps_shared_storage(tmp_path):
+    pytest.importorskip("numpy")
+    from smithg.engine.compact import CompactWorld
+
+    path = str(tmp_path / "compact.ckpt")
+    world = make_world(CompactWorld)
+    world.simulate(10, checkpoint=path, checkpoint_every=5)
+    world.close()
+
+    restored = engine.World.restore(path)
+    assert states(restored) == states(world)
+    restored.replenish_agents()
+    arrays = restored.arrays  # type: ignore
+    assert restored.player_agent_containers[0].state.balance == arrays.balances[0]
@@ -0,0 +1,50 @@
+import pytest
+
+import smithg
+from smithg.engine import engine
+
+compact = pytest.importorskip("smithg.engine.compact")
+
+
+def test_compact_world_matches_world():
+    def trader(
+        env: smithg.Environment, events: smithg.EventList
+    ) -> smithg.CommandList:
+        if env.command_fuel < 60:
+            return []
+        return [smithg.commands.BuyItem("b", 2, 10000), smithg.commands.Work(10)]
+
+    worlds = []
+    for world_cls in (engine.World, compact.CompactWorld):
+        world = engine.make_world(
+            ["a", "b"],
+            player_agents=[(trader, f"trader_{i}") for i in range(100)],
+            agent_registry=smithg.agents.Registry(),
+            seed=3,
+            world_cls=world_cls,
+        )
+        world.simulate(20)
+        worlds.append(world)
+
+    plain, compacted = worlds
+    assert compacted.arrays.size == 100
+    for expected, cont in zip(
+        plain.player_agent_containers, compacted.player_agent_containers
+    ):
+        assert cont.state == expected.state
+
+
+def test_compact_inventory_views_are_copy_on_write():
+    world = compact.CompactWorld(known_items=["a", "b"])
+    for i in range(100):
+        world.add_agent(lambda env, events: [], f"agent_{i}")
+    items = world.player_agent_containers[70].state.items
+
+    items["a"] = 3
+    view = items.view()
+    items["a"] += 1
+    view["b"] = 1
+
+    assert dict(items) == {"a": 4}
+    assert dict(view) == {"a": 3, "b": 1}
+    assert world.arrays.inventories[70].tolist() == [4, 0]
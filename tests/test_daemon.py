@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import smithg
+from smithg import cli, daemon
+
+AGENT = """
+import smithg
+
+@smithg.register_agent_func("{name}")
+def agent(env, events):
+    return [smithg.commands.Work(amount={amount})]
+"""
+
+
+@pytest.fixture
+def agents_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(smithg.agents.global_agent_registry, "agents", [])
+    (tmp_path / "hot_agents").mkdir()
+    return tmp_path / "hot_agents"
+
+
+def test_watcher_reloads_only_changed_modules(agents_dir):
+    (agents_dir / "first.py").write_text(AGENT.format(name="first", amount=1))
+    (agents_dir / "second.py").write_text(AGENT.format(name="second", amount=1))
+    watcher = daemon.AgentWatcher("hot_agents")
+    registry = smithg.agents.global_agent_registry
+
+    assert watcher.refresh() == ["hot_agents.first", "hot_agents.second"]
+    assert [name for _, name in registry.agents] == ["first", "second"]
+    assert watcher.refresh() == []
+
+    (agents_dir / "first.py").write_text(AGENT.format(name="first_v2", amount=10))
+    assert watcher.refresh() == ["hot_agents.first"]
+    # The reloaded agent keeps its place
+    assert [name for _, name in registry.agents] == ["first_v2", "second"]
+
+    (agents_dir / "second.py").unlink()
+    watcher.refresh()
+    assert [name for _, name in registry.agents] == ["first_v2"]
+
+
+def test_server_runs_jobs_with_reloaded_agents(agents_dir):
+    (agents_dir / "worker.py").write_text(AGENT.format(name="worker", amount=1))
+    watcher = daemon.AgentWatcher("hot_agents")
+    watcher.refresh()
+    server = daemon.SimulationServer("smithg.sock", watcher, cli.serve_job)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        job = {"argv": ["--seed", "1"], "cwd": str(agents_dir)}
+        messages = list(daemon.submit("smithg.sock", job))
+        assert [m["type"] for m in messages] == ["result", "done"]
+        [(name, first_score)] = [m["result"] for m in messages[:-1]]
+        assert name == "worker"
+
+        (agents_dir / "worker.py").write_text(AGENT.format(name="worker", amount=10))
+        messages = list(daemon.submit("smithg.sock", job))
+        assert messages[0] == {"type": "reloaded", "modules": ["hot_agents.worker"]}
+        assert messages[1]["result"][1] > first_score
+
+        messages = list(daemon.submit("smithg.sock", {"argv": ["--runs", "x"]}))
+        assert messages[-1]["type"] == "error"
+        assert "invalid int value" in messages[-1]["message"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+STATEFUL_AGENT = """
+import smithg
+
+@smithg.register_agent_class
+class Hoarder(smithg.Agent):
+    def __init__(self):
+        self.steps = 0
+
+    def __call__(self, env, events):
+        self.steps += 1
+        if self.steps > 1:
+            return []
+        return [smithg.commands.Work(amount=env.command_fuel)]
+"""
+
+
+def test_server_jobs_start_from_fresh_agents(agents_dir, tmp_path):
+    (agents_dir / "hoarder.py").write_text(STATEFUL_AGENT)
+    watcher = daemon.AgentWatcher("hot_agents")
+    watcher.refresh()
+    server = daemon.SimulationServer("smithg.sock", watcher, cli.serve_job)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client_dir = tmp_path / "client"
+    client_dir.mkdir()
+    try:
+        argv = ["--connect", "smithg.sock", "--seed", "1", "--record", "run.log"]
+        job = {"argv": argv, "cwd": str(client_dir)}
+        first = list(daemon.submit("smithg.sock", job))
+        second = list(daemon.submit("smithg.sock", job))
+        assert first[0]["result"][0] == "Hoarder"
+        assert first == second
+        assert (client_dir / "run.log").exists()
+        assert not (tmp_path / "run.log").exists()
+
+        job = {"argv": ["--connect", "smithg.sock", "-d", "other"], "cwd": "."}
+        messages = list(daemon.submit("smithg.sock", job))
+        assert "agents of the server" in messages[-1]["message"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,21 @@
+import pickle
+
+import smithg
+
+
+def test_item_catalog_interns_items_to_dense_ids():
+    catalog = smithg.ItemCatalog(["iron_ore", "iron_ingot", "iron_ore"])
+
+    assert len(catalog) == 2
+    assert catalog.add("iron_sword") == 2
+    assert catalog.index("iron_ingot") == 1
+    assert catalog[2] == "iron_sword"
+    assert "iron_ore" in catalog
+    assert "gold_ore" not in catalog
+    assert catalog.frozen() == frozenset({"iron_ore", "iron_ingot", "iron_sword"})
+    assert pickle.loads(pickle.dumps(catalog)) == catalog
+
+
+def test_commands_and_events_are_slotted():
+    assert not hasattr(smithg.commands.BuyItem("item", 1, 1), "__dict__")
+    assert not hasattr(smithg.events.SellReceipt("item", 1, 1), "__dict__")
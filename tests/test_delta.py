@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+import random
+
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.agents import DeltaAgent
+from smithg.agents.examples.random_agent import RandomAgent
+from smithg.engine.compact import CompactWorld
+from smithg.engine.market import RandomMarket
+
+
+@dataclass
+class CheckedAgent(DeltaAgent, RandomAgent):
+    """Trades randomly and checks its delta view against the full environment."""
+
+    received: list[type] = field(default_factory=list)
+
+    def run(self, env, events):
+        self.received.append([type(evt) for evt in events])
+        return super().run(env, events)
+
+    def process(self, env: smithg.Environment) -> None:
+        assert self.view.known_items == env.known_items
+        assert self.view.buy_offers == env.buy_offers
+        assert self.view.sell_offers == env.sell_offers
+        assert self.view.inventory == {i: n for i, n in env.inventory.items() if n}
+        super().process(env)
+
+
+@pytest.mark.parametrize("world_cls", [smithg.engine.engine.World, CompactWorld])
+def test_delta_view_follows_the_environment(world_cls):
+    items = list(smithg.engine.CANONICAL_ITEMS)
+    market = RandomMarket(rand=random.Random(1), known_items=items)
+    world = world_cls(known_items=items, market=market, command_fuel_increase=100)
+    agents = [CheckedAgent(rand=random.Random(i)) for i in range(3)]
+    for i, agent in enumerate(agents):
+        world.add_agent(agent, f"agent_{i}")
+
+    world.simulate(200)
+
+    for agent in agents:
+        assert agent.received[0][0] is smithg.events.MarketSnapshot
+        later = [t for types in agent.received[1:] for t in types]
+        assert smithg.events.MarketSnapshot not in later
+    assert smithg.events.OffersChanged in later
+    assert smithg.events.InventoryChanged in later
+
+
+def test_agents_resync_after_missed_steps():
+    agent = CheckedAgent(rand=random.Random(0))
+    world = smithg.engine.engine.World(known_items=["item"])
+    world.add_agent(agent, "agent")
+    world.simulate(2)
+    first, second = agent.received
+    assert first[0] is smithg.events.MarketSnapshot and second == []
+
+    world.player_agent_containers[0].events_queue.append(smithg.events.StepTimeout(1))
+    world.simulate(1)
+    assert agent.received[-1][0] is smithg.events.MarketSnapshot
+
+    world.step_count += 1
+    world.simulate(1)
+    assert agent.received[-1][0] is smithg.events.MarketSnapshot
+
+
+def test_other_agents_get_no_delta_events():
+    seen = []
+
+    def agent(env, events):
+        seen.extend(events)
+        return []
+
+    world = smithg.engine.engine.World(known_items=["item"])
+    world.add_agent(agent)
+    world.simulate(3)
+    assert seen == []
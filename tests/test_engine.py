@@ -1,7 +1,11 @@
+from dataclasses import dataclass
 import collections
 
+import pytest
+
 import smithg
 import smithg.engine
+from smithg.engine import engine
 
 
 def test_engine_should_create_correct_environment():
@@ -39,3 +43,89 @@ def test_engine_should_create_correct_environment():
     world.step(0)
 
     assert len(agent_calls) == 1, "World has stepped, but agent was not called"
+
+
+def test_engine_should_share_market_view_and_copy_inventory_on_write():
+    envs: list[smithg.Environment] = []
+
+    def test_agent(
+        env: smithg.Environment, events: list[smithg.events.Event]
+    ) -> list[smithg.commands.Command]:
+        envs.append(env)
+        env.inventory["item"] = 5
+        return []
+
+    world = smithg.engine.engine.World(known_items=["item"])
+    world.add_agent(test_agent, "first")
+    world.add_agent(test_agent, "second")
+    world.player_agent_containers[1].state.items["item"] = 1
+
+    world.step(0)
+
+    assert envs[0].buy_offers is envs[1].buy_offers
+    assert envs[0].known_items is envs[1].known_items
+    assert world.player_agent_containers[0].state.items["item"] == 0
+    assert world.player_agent_containers[1].state.items["item"] == 1
+
+    # Engine side writes must not leak into a view handed out earlier
+    inventory = world.player_agent_containers[1].state.items
+    view = inventory.view()
+    inventory["item"] += 2
+    assert view["item"] == 1
+    assert inventory.view()["item"] == 3
+
+    writes = [
+        lambda: inventory.setdefault("other", 4),
+        lambda: inventory.popitem(),
+        lambda: inventory.__ior__({"item": 9}),
+    ]
+    for write in writes:
+        view = inventory.view()
+        before = dict(view)
+        write()
+        assert dict(view) == before
+        assert dict(inventory.view()) == dict(inventory)
+
+
+def test_commands_are_dispatched_by_exact_type():
+    @dataclass(slots=True)
+    class Donate(smithg.commands.Command):
+        amount: int
+
+        @property
+        def cost(self) -> int:
+            return 1
+
+    class Overtime(smithg.commands.Work):
+        pass
+
+    world = engine.World(known_items=["item"])
+    world.add_agent(lambda env, events: [], "agent")
+    cont = world.player_agent_containers[0]
+
+    with pytest.raises(engine.InvalidAgentState, match="no handler"):
+        engine.execute_commands(cont, world, [Donate(5)])
+    with pytest.raises(engine.InvalidAgentState, match="no handler"):
+        engine.execute_commands(cont, world, [Overtime(1)])
+
+    @engine.command_handler(Donate)
+    def execute_donate(cont, world, cmd):
+        cont.state.balance -= cmd.amount
+
+    try:
+        engine.execute_commands(cont, world, [Donate(5), smithg.commands.Work(2)])
+    finally:
+        del engine.COMMAND_HANDLERS[Donate]
+    assert cont.state.balance == 100 - 5 + 2 * 10
+    assert cont.state.command_fuel == 100 - 3
+
+
+def test_command_lists_over_the_fuel_limit_execute_nothing():
+    world = engine.World(known_items=["item"])
+    world.add_agent(lambda env, events: [], "agent")
+    cont = world.player_agent_containers[0]
+    work = smithg.commands.Work
+
+    with pytest.raises(engine.InvalidAgentState, match="out of fuel"):
+        engine.execute_commands(cont, world, [work(60), work(50)])
+    assert (cont.state.balance, cont.state.command_fuel) == (100, 100)
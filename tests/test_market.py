@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from smithg.engine import market
+
+
+def test_random_market_items_have_their_own_distribution():
+    items = [f"item_{i}" for i in range(10)]
+    random_market = market.RandomMarket(rand=random.Random(0), known_items=items)
+
+    mean_prices = [
+        sum(price() for _ in range(500)) / 500
+        for price, _ in random_market.item_distributions.values()
+    ]
+
+    assert max(mean_prices) - min(mean_prices) > 1000
+
+
+def test_vectorized_market_is_reproducible_and_independent_of_block_size():
+    numpy_market = pytest.importorskip("smithg.engine.numpy_market")
+    items = [f"item_{i}" for i in range(50)]
+
+    def offers(block_size: int) -> list:
+        m = numpy_market.VectorizedRandomMarket(
+            known_items=items, seed=42, block_size=block_size
+        )
+        result = []
+        for _ in range(10):
+            m.tick()
+            result.append((m.trades.buy_offer_set(), m.trades.sell_offer_set()))
+        return result
+
+    assert offers(3) == offers(1000)
+
+    other = numpy_market.VectorizedRandomMarket(known_items=items, seed=1)
+    other.tick()
+    assert offers(3)[0] != (other.trades.buy_offer_set(), other.trades.sell_offer_set())
+
+
+def test_vectorized_market_offers_match_lookups():
+    numpy_market = pytest.importorskip("smithg.engine.numpy_market")
+    m = numpy_market.VectorizedRandomMarket(known_items=["a", "b", "c"], seed=0)
+    m.tick()
+
+    for offer in m.trades.buy_offer_set():
+        assert m.trades.find_buy(offer.item) == offer
+        assert m.trades.find_sell(offer.item) is None
+    for offer in m.trades.sell_offer_set():
+        assert m.trades.find_sell(offer.item) == offer
+        assert 1 <= offer.price <= 10000
+    assert m.trades.find_buy("unknown") is None
@@ -0,0 +1,50 @@
+import csv
+import io
+import json
+import random
+
+import smithg
+import smithg.engine
+from smithg.agents.examples.random_agent import RandomAgent
+from smithg.engine.metrics import FIELDS, write_metrics
+
+from conftest import make_world, work_agent
+
+
+def random_world() -> smithg.engine.engine.World:
+    agents = [(RandomAgent(rand=random.Random()), "random"), (work_agent, "w")]
+    return make_world(agents, smithg.engine.CANONICAL_ITEMS, seed=1)
+
+
+def test_iter_steps_simulates_lazily_like_simulate():
+    world = random_world()
+    snapshots = world.iter_steps(50)
+    assert world.step_count == 0
+    first = next(snapshots)
+    assert (first.step, world.step_count) == (1, 1)
+    *_, last = snapshots
+
+    expected = random_world().simulate(50)
+    assert last.step == 50
+    assert list(last.balances) == [cont.state.balance for cont in expected]
+    assert list(last.command_fuel) == [cont.state.command_fuel for cont in expected]
+    assert list(last.item_totals) == [sum(c.state.items.values()) for c in expected]
+
+
+def test_metrics_are_written_per_agent_and_step():
+    ndjson, csv_file = io.StringIO(), io.StringIO()
+    write_metrics(ndjson, ["random", "w"], random_world().iter_steps(20))
+    write_metrics(csv_file, ["random", "w"], random_world().iter_steps(20), "csv")
+
+    rows = [json.loads(line) for line in ndjson.getvalue().splitlines()]
+    assert len(rows) == 40
+    assert list(rows[-1]) == list(FIELDS)
+    assert rows[-1]["step"] == 20 and rows[-1]["agent_name"] == "w"
+    assert rows[-1]["balance"] == 100 + 20 * 10
+
+    csv_file.seek(0)
+    csv_rows = [
+        {k: int(v) if v.isdigit() else v for k, v in row.items()}
+        for row in csv.DictReader(csv_file)
+    ]
+    assert csv_rows == rows
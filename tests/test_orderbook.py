@@ -0,0 +1,97 @@
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import engine
+from smithg.engine.market import Fill
+from smithg.engine.orderbook import OrderBookMarket
+
+
+def test_orders_match_by_price_then_time_with_partial_fills():
+    market = OrderBookMarket()
+    market.add_order("item", 5, 110, is_buy=False)
+    first = object()
+    second = object()
+    market.sell(first, "item", 5, 100)
+    market.sell(second, "item", 5, 100)
+
+    result = market.buy(None, "item", 12, 120)
+
+    assert result.fills == (
+        Fill("item", 5, 100, first),
+        Fill("item", 5, 100, second),
+        Fill("item", 2, 110, None),
+    )
+    assert result.resting == 0
+    assert market.trades.find_sell("item") == smithg.SellOffer("item", 3, 110)
+
+
+def test_unfilled_orders_rest_and_show_up_as_top_of_book():
+    market = OrderBookMarket()
+    result = market.buy(None, "item", 10, 90)
+    market.buy(None, "item", 4, 95)
+
+    assert result.fills == ()
+    assert result.resting == 10
+    assert market.trades.find_buy("item") == smithg.BuyOffer("item", 4, 95)
+    assert market.trades.find_sell("item") is None
+
+
+def test_engine_settles_resting_orders_and_cancellations():
+    world = engine.World(known_items=["item"], market=OrderBookMarket())
+    world.add_agent(lambda env, events: [], "seller")
+    world.add_agent(lambda env, events: [], "buyer")
+    seller, buyer = world.player_agent_containers
+    seller.state.items["item"] = 10
+
+    engine.execute_command(seller, world, smithg.commands.SellItem("item", 10, 20))
+    assert seller.state.items["item"] == 0
+    assert seller.events_queue == [smithg.events.SellOrderPlaced("item", 10, 20)]
+
+    engine.execute_command(buyer, world, smithg.commands.BuyItem("item", 4, 25))
+    assert buyer.state.items["item"] == 4
+    assert buyer.state.balance == 100 - 4 * 20
+    assert seller.state.balance == 100 + 4 * 20
+    assert seller.events_queue[-1] == smithg.events.SellReceipt("item", 4, 20)
+
+    engine.execute_command(seller, world, smithg.commands.CancelOrders("item"))
+    assert seller.state.items["item"] == 6
+    assert seller.events_queue[-1] == smithg.events.SellOrderCancelled("item", 6, 20)
+    assert world.market.trades.find_sell("item") is None
+
+
+@pytest.mark.parametrize(
+    "cmd",
+    [
+        smithg.commands.BuyItem("item", 10, -1000),
+        smithg.commands.BuyItem("item", -5, 10),
+        smithg.commands.SellItem("item", -5, 10),
+    ],
+)
+def test_orders_must_be_positive(cmd):
+    world = engine.World(known_items=["item"], market=OrderBookMarket())
+    world.add_agent(lambda env, events: [], "agent")
+    (cont,) = world.player_agent_containers
+
+    with pytest.raises(engine.InvalidAgentState, match="Agent tried to"):
+        engine.execute_command(cont, world, cmd)
+    assert cont.state.balance == 100
+    assert cont.state.items["item"] == 0
+    assert world.market.trades.find_buy("item") is None
+    assert world.market.trades.find_sell("item") is None
+
+    with pytest.raises(ValueError, match="not positive"):
+        world.market.add_order("item", -5, 10, is_buy=False)
+    with pytest.raises(ValueError, match="not positive"):
+        world.market.buy(None, "item", 10, 0)
+
+
+def test_many_resting_orders_per_item():
+    market = OrderBookMarket()
+    for i in range(20000):
+        market.sell(i, "item", 1, 1000 + i % 500)
+
+    result = market.buy(None, "item", 100, 1000)
+
+    assert sum(fill.amount for fill in result.fills) == 40
+    assert [fill.maker for fill in result.fills[:2]] == [0, 500]
@@ -0,0 +1,65 @@
+import json
+
+import smithg
+from smithg.engine import engine, tournament
+from smithg.engine.orderbook import OrderBookMarket
+from smithg.engine.profiler import Profiler
+
+from conftest import make_world
+
+
+def two_command_agent(
+    env: smithg.Environment, events: smithg.EventList
+) -> smithg.CommandList:
+    return [smithg.commands.Work(amount=1), smithg.commands.Work(amount=2)]
+
+
+def test_profiler_records_phases_agents_and_commands():
+    world = make_world([(two_command_agent, "worker")], seed=1)
+    world.profiler = Profiler()
+    world.simulate(5)
+
+    profiler = world.profiler
+    assert profiler.phases["step"].calls == 5
+    phases = {"tick", "replenish", "market_view", "agents", "step"}
+    assert set(profiler.phases) == phases
+    profile = profiler.agents["worker"]
+    assert profile.agent.calls == 5
+    assert profile.commands == 10
+    assert profile.fuel_spent == 5 * (1 + 2) * smithg.commands.Work(amount=1).cost
+    assert profiler.commands["Work"].calls == 10
+    # Profiling does not change the simulation
+    assert world.player_agent_containers[0].state.balance == 100 + 5 * 30
+
+    report = json.loads(profiler.to_json())
+    assert report["agents"]["worker"]["commands"] == 10
+    assert "worker" in profiler.format_table()
+
+
+def test_tournament_merges_profiles_of_all_runs():
+    profiler = Profiler()
+    agents = [(two_command_agent, "worker")]
+    tournament.run_seeds([1, 2, 3], ["item"], agents, 4, jobs=1, profiler=profiler)
+    assert profiler.phases["step"].calls == 12
+    assert profiler.agents["worker"].commands == 24
+
+
+def test_trade_volume_counts_fills_of_resting_orders():
+    def seller(env: smithg.Environment, events: smithg.EventList):
+        if env.inventory["item"]:
+            return [smithg.commands.SellItem("item", env.inventory["item"], 20)]
+        return []
+
+    def buyer(env: smithg.Environment, events: smithg.EventList):
+        return [smithg.commands.BuyItem("item", 3, 25)]
+
+    world = engine.World(known_items=["item"], market=OrderBookMarket())
+    world.add_agent(seller, "seller")
+    world.add_agent(buyer, "buyer")
+    world.player_agent_containers[0].state.items["item"] = 10
+    world.profiler = Profiler()
+    world.simulate(2)
+
+    # Both sides of the two fills of 3 items at 20
+    assert world.profiler.agents["buyer"].trade_volume == 2 * 3 * 20
+    assert world.profiler.agents["seller"].trade_volume == 2 * 3 * 20
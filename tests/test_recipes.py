@@ -0,0 +1,56 @@
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import engine
+from smithg.engine.recipes import RecipeBook, RecipeError
+
+
+def test_recipe_book_orders_items_and_computes_production_costs():
+    book = RecipeBook(
+        smithg.engine.CANONICAL_RECIPES,
+        reversed(smithg.engine.CANONICAL_ITEMS),
+        base_costs={"iron_ore": 100},
+        fuel_price=10,
+    )
+
+    order = book.item_order
+    assert order.index("iron_ore") < order.index("iron_ingot")
+    assert order.index("iron_ingot") < order.index("iron_sword")
+    # 2 ore + 20 fuel at 10 each
+    assert book.production_costs["iron_ingot"] == 400
+    assert book.production_costs["iron_sword"] == 3 * 400 + 200
+    assert book.production_costs["iron_sheets"] == (400 + 200) // 2
+
+
+def test_recipe_book_rejects_invalid_recipes():
+    cycle = [
+        smithg.Recipe("a_to_b", {"a": 1}, {"b": 1}),
+        smithg.Recipe("b_to_a", {"b": 1}, {"a": 1}),
+    ]
+    with pytest.raises(RecipeError, match="cycle"):
+        RecipeBook(cycle, ["a", "b"])
+    with pytest.raises(RecipeError, match="unknown item"):
+        RecipeBook(cycle, ["a"])
+    with pytest.raises(RecipeError, match="defined twice"):
+        RecipeBook([cycle[0], cycle[0]], ["a", "b"])
+
+
+def test_engine_forges_recipes():
+    world = engine.World(
+        known_items=smithg.engine.CANONICAL_ITEMS,
+        recipes=smithg.engine.CANONICAL_RECIPES,
+    )
+    world.add_agent(lambda env, events: [], "smith")
+    smith = world.player_agent_containers[0]
+    smith.state.items["iron_ore"] = 5
+
+    engine.execute_command(smith, world, smithg.commands.Forge("smelt_iron", 2))
+
+    assert smith.state.items["iron_ore"] == 1
+    assert smith.state.items["iron_ingot"] == 2
+    assert smith.state.command_fuel == 60
+    assert smith.events_queue == [smithg.events.ForgeReceipt("smelt_iron", 2)]
+
+    with pytest.raises(engine.InvalidAgentState):
+        engine.execute_command(smith, world, smithg.commands.Forge("forge_sword"))
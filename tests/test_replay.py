@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+import copy
+import random
+
+import smithg
+import smithg.engine
+from smithg.agents.examples.random_agent import RandomAgent
+from smithg.engine import engine
+from smithg.engine.orderbook import OrderBookMarket
+from smithg.engine.replay import Recorder, ReplayLog, UnknownCommand
+
+
+def forging_agent(
+    env: smithg.Environment, events: smithg.EventList
+) -> smithg.CommandList:
+    if env.inventory["iron_ore"] >= 2:
+        return [smithg.commands.Forge("smelt_iron")]
+    return [smithg.commands.Work(amount=1)]
+
+
+def nonzero(items) -> dict:
+    return {item: amount for item, amount in items.items() if amount}
+
+
+def assert_same_states(states, expected):
+    assert len(states) == len(expected)
+    for state, other in zip(states, expected):
+        assert state.balance == other.balance
+        assert state.command_fuel == other.command_fuel
+        assert nonzero(state.items) == nonzero(other.items)
+
+
+def test_replay_reconstructs_states_without_running_agents(tmp_path):
+    path = tmp_path / "run.smgr"
+    world = engine.make_world(
+        smithg.engine.CANONICAL_ITEMS,
+        player_agents=[
+            (RandomAgent(rand=random.Random(1)), "random"),
+            (forging_agent, "forger"),
+        ],
+        agent_registry=smithg.agents.Registry(),
+        seed=3,
+        recipes=smithg.engine.CANONICAL_RECIPES,
+        settings={"trade_cost": 30},
+    )
+    world.player_agent_containers[1].state.items["iron_ore"] = 7
+    world.recorder = Recorder(path)
+    world.simulate(10)
+    middle = [copy.deepcopy(c.state) for c in world.player_agent_containers]
+    world.simulate(40)
+    world.close()
+
+    with ReplayLog(path) as log:
+        assert len(log) == 50
+        assert log.agent_names == ["random", "forger"]
+        final_states = [c.state for c in world.player_agent_containers]
+        assert_same_states(log.final_states(), final_states)
+
+        for step, states in enumerate(log.replay()):
+            if step == 9:
+                assert_same_states(states, middle)
+                break
+
+        record = log[0]
+        assert len(record.offers) == len(smithg.engine.CANONICAL_ITEMS)
+        assert record.commands[1] == (1, smithg.commands.Forge("smelt_iron"))
+        assert (1, smithg.events.ForgeReceipt("smelt_iron", 1), False) in record.events
+        del record
+
+
+def test_replay_settles_resting_orders_of_counterparties(tmp_path):
+    def seller(env: smithg.Environment, events: smithg.EventList):
+        if env.inventory["item"]:
+            return [smithg.commands.SellItem("item", env.inventory["item"], 20)]
+        return [smithg.commands.CancelOrders("item")]
+
+    def buyer(env: smithg.Environment, events: smithg.EventList):
+        return [smithg.commands.BuyItem("item", 3, 25)]
+
+    path = tmp_path / "book.smgr"
+    world = engine.World(
+        known_items=["item"], market=OrderBookMarket(), command_fuel_increase=100
+    )
+    world.add_agent(seller, "seller")
+    world.add_agent(buyer, "buyer")
+    world.player_agent_containers[0].state.items["item"] = 10
+    world.recorder = Recorder(path)
+    world.simulate(5)
+    world.close()
+
+    with ReplayLog(path) as log:
+        final_states = [c.state for c in world.player_agent_containers]
+        assert_same_states(log.final_states(), final_states)
+        makers = [evt for _, evt, maker in log[0].events if maker]
+        assert makers == [smithg.events.SellReceipt("item", 3, 20)]
+        del makers
+
+
+def test_commands_of_custom_handlers_are_recorded_with_their_fuel(tmp_path):
+    @dataclass(slots=True)
+    class Donate(smithg.commands.Command):
+        amount: int
+
+        @property
+        def cost(self) -> int:
+            return 7
+
+    @engine.command_handler(Donate)
+    def execute_donate(cont, world, cmd):
+        cont.state.balance -= cmd.amount
+
+    def donor(env: smithg.Environment, events: smithg.EventList):
+        return [Donate(5), smithg.commands.Work(amount=1)]
+
+    path = tmp_path / "donate.smgr"
+    world = engine.World(known_items=["item"])
+    world.add_agent(donor, "donor")
+    world.recorder = Recorder(path)
+    try:
+        world.simulate(3)
+    finally:
+        del engine.COMMAND_HANDLERS[Donate]
+    world.close()
+
+    with ReplayLog(path) as log:
+        assert log[0].commands == [
+            (0, UnknownCommand(7)),
+            (0, smithg.commands.Work(amount=1)),
+        ]
+        (state,) = log.final_states()
+        assert state.command_fuel == world.player_agent_containers[0].state.command_fuel
@@ -0,0 +1,117 @@
+import os
+import time
+
+import smithg
+from smithg.engine import engine
+from smithg.engine.sandbox import SandboxedAgent
+
+
+class CountingAgent(smithg.Agent):
+    calls = 0
+
+    def process(self, env: smithg.Environment) -> None:
+        self.calls += 1
+        self.queue_command(smithg.commands.Work(amount=self.calls))
+
+
+def sleepy_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    if env.balance < 1000:
+        time.sleep(1)
+    return []
+
+
+def failing_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    if not events:
+        raise ValueError("boom")
+    return [smithg.commands.Work(amount=1)]
+
+
+def dying_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    if not events:
+        os._exit(1)
+    return [smithg.commands.Work(amount=1)]
+
+
+def test_sandboxed_agents_keep_state_across_steps():
+    world = engine.World(known_items=["item"], time_budget=5)
+    world.add_agent(CountingAgent(), "counter")
+    try:
+        world.simulate(3)
+    finally:
+        world.close()
+
+    # Worked 1, 2 and 3 fuel in the three steps
+    assert world.player_agent_containers[0].state.balance == 100 + 10 * 6
+
+
+def test_slow_agents_time_out():
+    agent = SandboxedAgent(sleepy_agent, time_budget=0.05)
+    env = smithg.Environment(
+        known_items=frozenset(),
+        buy_offers=frozenset(),
+        sell_offers=frozenset(),
+        balance=0,
+        command_fuel=0,
+        inventory=smithg.agents.InventoryView({}),
+    )
+    try:
+        start = time.monotonic()
+        assert agent(env, []) == []
+        assert agent(env, []) == []
+        assert time.monotonic() - start < 0.5
+        assert agent._pending_events == [
+            smithg.events.StepTimeout(0.05),
+            smithg.events.StepTimeout(0.05),
+        ]
+    finally:
+        agent.close()
+
+
+def test_failing_and_dying_agents_get_failure_events():
+    world = engine.World(known_items=["item"], time_budget=5)
+    world.add_agent(failing_agent, "failing")
+    world.add_agent(dying_agent, "dying")
+    try:
+        world.step(0)
+        world.step(1)
+    finally:
+        world.close()
+
+    failing, dying = world.player_agent_containers
+    assert failing.state.balance == 100 + 10
+    assert dying.state.balance == 100 + 10
+
+
+class Payload:
+    """Creates a directory when it is unpickled."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __reduce__(self):
+        return os.mkdir, (self.path,)
+
+
+class HostileAgent:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, env: smithg.Environment, events: smithg.EventList):
+        if not events:
+            return [Payload(self.path)]
+        return [smithg.commands.Work(amount=1)]
+
+
+def test_replies_cannot_run_code_in_the_engine(tmp_path):
+    path = tmp_path / "pwned"
+    world = engine.World(known_items=["item"], time_budget=5)
+    world.add_agent(HostileAgent(str(path)), "hostile")
+    try:
+        world.step(0)
+        world.step(1)
+    finally:
+        world.close()
+
+    assert not path.exists()
+    # The worker was restarted and the agent told why
+    assert world.player_agent_containers[0].state.balance == 100 + 10
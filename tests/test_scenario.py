@@ -0,0 +1,126 @@
+import pickle
+
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import engine, scenario, tournament
+
+
+def trader(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    cmds: smithg.CommandList = []
+    for offer in sorted(env.sell_offers):
+        cmds.append(smithg.commands.BuyItem(offer.item, 1, offer.price))
+    for offer in sorted(env.buy_offers):
+        if env.inventory[offer.item]:
+            cmds.append(smithg.commands.SellItem(offer.item, 1, offer.price))
+    fuel = env.command_fuel
+    affordable = []
+    for cmd in cmds:
+        if cmd.cost <= fuel:
+            fuel -= cmd.cost
+            affordable.append(cmd)
+    return affordable
+
+
+def write_csv(path, rows):
+    path.write_text("tick,item,price,amount\n" + "".join(f"{r}\n" for r in rows))
+
+
+def test_generated_scenario_replays_the_random_market(tmp_path):
+    path = tmp_path / "scenario.smgs"
+    items = smithg.engine.CANONICAL_ITEMS
+    with open(path, "wb") as f:
+        scenario.generate(f, items, ticks=50, seed=7)
+
+    random_world = engine.make_world(items, [(trader, "trader")], engine.Registry(), 7)
+    scenario_world = engine.make_world(
+        items,
+        [(trader, "trader")],
+        engine.Registry(),
+        seed=7,
+        market=scenario.ScenarioMarket(path=path),
+    )
+    random_world.simulate(50)
+    scenario_world.simulate(50)
+    assert (
+        random_world.player_agent_containers[0].state
+        == scenario_world.player_agent_containers[0].state
+    )
+    with pytest.raises(scenario.ScenarioError, match="ends after 50 ticks"):
+        scenario_world.step(51)
+
+
+def test_csv_scenarios_are_converted(tmp_path):
+    csv_path = tmp_path / "scenario.csv"
+    write_csv(csv_path, ["0,ore,10,-5", "0,ingot,30,2", "2,ore,12,3"])
+    market = scenario.ScenarioMarket(path=csv_path, loop=True)
+    assert list(market.known_items) == ["ore", "ingot"]
+    assert len(market.scenario) == 3
+
+    offers = []
+    for _ in range(4):
+        market.tick()
+        offers.append((market.trades.buy_offer_set(), market.trades.sell_offer_set()))
+    assert offers[0] == (
+        {smithg.BuyOffer("ingot", 2, 30)},
+        {smithg.SellOffer("ore", 5, 10)},
+    )
+    assert offers[1] == (frozenset(), frozenset())
+    assert offers[2] == ({smithg.BuyOffer("ore", 3, 12)}, frozenset())
+    assert offers[3] == offers[0]
+
+    binary = tmp_path / "scenario.smgs"
+    scenario.main(["convert", str(csv_path), str(binary)])
+    with scenario.Scenario(binary) as converted:
+        assert [list(column) for column in converted[0]] == [[10, 30], [-5, 2]]
+
+
+def test_invalid_csv_is_rejected(tmp_path):
+    csv_path = tmp_path / "scenario.csv"
+    write_csv(csv_path, ["1,ore,10,-5", "0,ore,10,-5"])
+    with pytest.raises(scenario.ScenarioError, match="ordered by tick"):
+        scenario.Scenario(csv_path)
+    csv_path.write_text("item,price\nore,1\n")
+    with pytest.raises(scenario.ScenarioError, match="not a scenario"):
+        scenario.Scenario(csv_path)
+
+
+def test_market_position_survives_pickling(tmp_path):
+    path = tmp_path / "scenario.smgs"
+    scenario.main(["generate", str(path), "--ticks", "10", "--seed", "1"])
+    market = scenario.ScenarioMarket(path=path)
+    for _ in range(3):
+        market.tick()
+
+    restored = pickle.loads(pickle.dumps(market))
+    market.tick()
+    restored.tick()
+    assert restored.position == 4
+    assert restored.trades == market.trades
+
+
+def test_tournaments_run_on_scenarios(tmp_path, monkeypatch):
+    path = tmp_path / "scenario.csv"
+    write_csv(path, ["0,gem,10,-1", "5,gem,10,-1", "9,gem,0,0"])
+    conversions = []
+    convert_csv = scenario.convert_csv
+    monkeypatch.setattr(
+        scenario, "convert_csv", lambda *a: conversions.append(a) or convert_csv(*a)
+    )
+    balances = tournament.run_seeds(
+        [1, 2, 3], ["item"], [(trader, "trader")], steps=10, scenario=str(path)
+    )
+    assert balances == [[100 - 2 * 10]] * 3
+    assert len(conversions) == 1
+
+
+def test_closing_the_world_closes_the_scenario(tmp_path):
+    path = tmp_path / "scenario.smgs"
+    scenario.main(["generate", str(path), "--ticks", "10", "--seed", "1"])
+    market = scenario.ScenarioMarket(path=path)
+    items = market.known_items
+    world = engine.make_world(items, [(trader, "trader")], engine.Registry(), 1, market)
+    world.simulate(5)
+    world.close()
+    assert market.scenario._mmap.closed
@@ -0,0 +1,109 @@
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import sharding
+from smithg.engine.engine import InvalidAgentState, World
+
+from conftest import work_agent
+
+
+def exporter(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    """Buys whatever is cheapest and exports it to the region with the best price."""
+    for evt in events:
+        if isinstance(evt, smithg.events.RegionPrices):
+            for item, amount in env.inventory.items():
+                others = [r for r in range(len(evt.prices)) if r != evt.region]
+                if amount and others and env.command_fuel >= 50:
+                    best = max(others, key=lambda r: evt.prices[r].get(item, 0))
+                    return [smithg.commands.Export(item, amount, best)]
+    if env.sell_offers and env.command_fuel >= 50:
+        offer = min(env.sell_offers, key=lambda o: o.price)
+        return [smithg.commands.BuyItem(offer.item, 1, offer.price)]
+    return []
+
+
+def failing_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    raise RuntimeError("broken agent")
+
+
+def received(cont, event_type):
+    return [evt for evt in cont.events_queue if isinstance(evt, event_type)]
+
+
+def make_config(**kwargs) -> sharding.ShardConfig:
+    defaults = dict(known_items=smithg.engine.CANONICAL_ITEMS, regions=2, seed=1)
+    return sharding.ShardConfig(**{**defaults, **kwargs})
+
+
+def test_sharded_results_match_the_regions():
+    config = make_config(steps=30, sync_every=7)
+    agents = [(work_agent, f"worker_{i}") for i in range(4)] + [(exporter, "exporter")]
+
+    balances = sharding.run_sharded(config, agents)
+
+    regions = [
+        sharding.make_region(config, region, agents[region::2]) for region in range(2)
+    ]
+    for done in range(0, 30, 7):
+        for world in regions:
+            world.simulate(min(7, 30 - done))
+        prices = [world.average_prices() for world in regions]
+        for world in regions:
+            world.settle(prices)
+    expected = [0] * len(agents)
+    for region, world in enumerate(regions):
+        expected[region::2] = [c.state.balance for c in world.player_agent_containers]
+    assert balances == expected
+    assert balances[:4] == [100 + 30 * 10] * 4
+
+
+def test_regions_can_sandbox_their_agents():
+    config = make_config(steps=5, sync_every=2, time_budget=5.0)
+    agents = [(work_agent, f"worker_{i}") for i in range(2)]
+    assert sharding.run_sharded(config, agents) == [100 + 5 * 10] * 2
+
+
+def test_exports_are_sold_in_the_target_region():
+    config = make_config(transport_cost=3)
+    home, away = (sharding.make_region(config, r, []) for r in range(2))
+    home.add_agent(exporter)
+    cont = home.player_agent_containers[0]
+
+    home.simulate(1)
+    away.simulate(1)
+    (bought,) = received(cont, smithg.events.BuyReceipt)
+    prices = [home.average_prices(), away.average_prices()]
+    home.settle(prices)
+    home.simulate(1)
+    away.simulate(1)
+    assert sum(cont.state.items.values()) == 0
+    assert len(home.exports) == 1
+
+    away_prices = away.average_prices()
+    home.settle([home.average_prices(), away_prices])
+    (receipt,) = received(cont, smithg.events.SellReceipt)
+    assert receipt == smithg.events.SellReceipt(
+        bought.item, 1, away_prices[bought.item] - config.transport_cost
+    )
+    assert isinstance(cont.events_queue[-1], smithg.events.RegionPrices)
+
+
+def test_exports_need_a_valid_region():
+    def export_home(env, events):
+        return [smithg.commands.Export("iron_ore", 1, 0)]
+
+    world = sharding.make_region(make_config(), 0, [(export_home, "agent")])
+    world.player_agent_containers[0].state.items["iron_ore"] = 1
+    with pytest.raises(InvalidAgentState, match="invalid region"):
+        world.simulate(1)
+
+    world = World(known_items=["iron_ore"])
+    world.add_agent(export_home)
+    with pytest.raises(InvalidAgentState, match="outside of a sharded world"):
+        world.simulate(1)
+
+
+def test_region_failures_are_raised():
+    with pytest.raises(sharding.ShardError, match="broken agent"):
+        sharding.run_sharded(make_config(steps=5), [(failing_agent, "failing")])
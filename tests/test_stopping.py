@@ -0,0 +1,49 @@
+import smithg
+import smithg.engine
+from smithg.engine import stopping, tournament
+
+from conftest import idle_agent, make_world, work_agent
+
+
+def test_simulation_stops_once_ranking_is_stable():
+    world = make_world()
+    world.simulate(1000, stop=[stopping.RankStable(10)])
+    # The first step sets the ranking, which then holds for 10 steps
+    assert world.step_count == 11
+
+
+def test_simulation_stops_once_balances_converged():
+    world = make_world()
+    world.simulate(1000, stop=[stopping.BalancesConverged(5, tolerance=0.1)])
+    # The worker earns 10 per step, which is below 10% of its balance from 110 on
+    assert world.step_count == 6
+
+    world = make_world()
+    world.simulate(1000, stop=[stopping.BalancesConverged(5, tolerance=0.0001)])
+    assert world.step_count == 1000
+
+
+def test_every_condition_sees_every_step():
+    seen = []
+
+    def callback(world: smithg.engine.engine.World) -> bool:
+        seen.append(world.step_count)
+        return world.step_count == 3
+
+    world = make_world()
+    world.simulate(1000, stop=[lambda world: True, callback])
+    assert world.step_count == 1 and seen == [1]
+
+    world = make_world()
+    world.simulate(1000, stop=[callback, stopping.WallTime(60)])
+    assert world.step_count == 3
+
+
+def test_tournament_runs_get_fresh_conditions():
+    balances = tournament.run_seeds(
+        [1, 2],
+        ["item"],
+        [(work_agent, "worker"), (idle_agent, "idler")],
+        stop=[stopping.RankStable(10)],
+    )
+    assert balances == [[100 + 11 * 10, 100]] * 2
@@ -0,0 +1,70 @@
+import pytest
+
+import smithg
+from smithg.engine import engine, sweep
+
+from conftest import busy_agent
+
+
+def trade_agent(env: smithg.Environment, events: smithg.EventList) -> smithg.CommandList:
+    if env.command_fuel < env.trade_cost:
+        return []
+    return [smithg.commands.BuyItem("item", 1, 1)]
+
+
+AGENTS = [(busy_agent, "busy_agent"), (trade_agent, "trade_agent")]
+
+
+def test_rungs_grow_by_eta_up_to_all_steps():
+    assert sweep.rungs(27, 1000, eta=3, min_steps=10) == [37, 111, 333, 1000]
+    assert sweep.rungs(27, 1000, eta=3) == [111, 333, 1000]
+    assert sweep.rungs(27, 1000, eta=3, min_steps=200) == [333, 1000]
+    assert sweep.rungs(1, 1000) == [1000]
+
+
+def test_spaces():
+    configs = sweep.grid({"balance_init": [0, 100], "trade_cost": range(10, 31, 10)})
+    assert len(configs) == 6
+    assert configs[0] == {"balance_init": 0, "trade_cost": 10}
+
+    samples = sweep.sample({"balance_init": range(1000)}, 10, seed=1)
+    assert len({s["balance_init"] for s in samples}) == 10
+    assert samples == sweep.sample({"balance_init": range(1000)}, 10, seed=1)
+    assert len(sweep.sample({"balance_init": [1, 2]}, 10)) == 2
+
+    with pytest.raises(ValueError, match="Cannot sweep foo"):
+        sweep.grid({"foo": [1]})
+
+
+def test_sweep_halves_configurations():
+    # The work agent earns work_to_money per fuel, so the spread grows with it
+    configs = sweep.grid({"work_to_money": range(1, 10)})
+
+    results = sweep.run_sweep(
+        configs, ["item"], AGENTS, steps=90, runs=2, seed=1, eta=3, min_steps=10
+    )
+
+    assert [r.steps for r in results] == [90] + [30] * 2 + [10] * 6
+    assert results[0].settings == {"work_to_money": 9}
+    best = 100 + 9 * (100 + 25 * 90)
+    assert results[0].score == sweep.score_spread([[best, 100]] * 2)
+    assert sorted(r.settings["work_to_money"] for r in results[3:]) == list(range(1, 7))
+
+
+def test_trade_cost_is_a_world_setting():
+    world = engine.World(known_items=["item"], trade_cost=30)
+    world.add_agent(trade_agent)
+    world.simulate(3)
+    # Fuel is replenished before every step, and every step trades once
+    assert world.player_agent_containers[0].state.command_fuel == 100 + 3 * 25 - 3 * 30
+
+    config = sweep.RunConfig(("item",), tuple(AGENTS), steps=4)
+    balances = sweep.run_trial(config, {"trade_cost": 1000}, seed=1, steps=4)
+    assert balances[0] == 100 + 4 * 25 * 10 + 100 * 10
+    parallel = sweep.run_sweep(
+        [{"trade_cost": 1000}], ["item"], AGENTS, steps=4, runs=2, jobs=2, seed=1
+    )
+    serial = sweep.run_sweep(
+        [{"trade_cost": 1000}], ["item"], AGENTS, steps=4, runs=2, jobs=1, seed=1
+    )
+    assert parallel == serial
@@ -0,0 +1,76 @@
+import pytest
+
+import smithg
+import smithg.engine
+from smithg.engine import tournament
+
+from conftest import busy_agent, idle_agent
+
+
+def test_tournament_aggregates_runs():
+    registry = smithg.agents.Registry()
+    registry.register_agent(busy_agent)
+    registry.register_agent(idle_agent)
+
+    stats = tournament.run_tournament(
+        4, ["item"], registry=registry, steps=10, jobs=1, seed=0
+    )
+
+    assert [s.name for s in stats] == ["busy_agent", "idle_agent"]
+    assert stats[0] == tournament.AgentStats(
+        name="busy_agent", mean=3600.0, stddev=0.0, win_rate=1.0, runs=4, win_runs=4
+    )
+    assert stats[1].mean == 100.0
+    assert stats[1].win_rate == 0.0
+
+
+def test_tournament_is_reproducible_across_processes():
+    registry = smithg.agents.Registry()
+    registry.register_agent(busy_agent)
+    registry.register_agent(idle_agent)
+
+    seeds = [1, 2, 3]
+    agents = registry.agents
+    serial = tournament.run_seeds(seeds, ["item"], agents, steps=5, jobs=1)
+    parallel = tournament.run_seeds(seeds, ["item"], agents, steps=5, jobs=2)
+
+    assert serial == parallel
+
+
+def test_aggregate_splits_ties():
+    stats = tournament.aggregate(["a", "b"], [[5, 5], [3, 1]])
+
+    assert [s.win_rate for s in stats] == [0.75, 0.25]
+    assert stats[0].mean == 4.0
+
+
+def test_aggregate_reports_confidence_intervals():
+    stats = tournament.aggregate(["a", "b"], [[10, 1], [14, None], [12, 3]], 0.9)
+
+    assert [s.runs for s in stats] == [3, 2]
+    assert [s.win_rate for s in stats] == [1.0, 0.0]
+    assert [s.win_runs for s in stats] == [2, 2]
+    assert stats[0].ci == pytest.approx(2.920 * 2 / 3**0.5, rel=1e-3)
+    assert stats[0].interval == (12 - stats[0].ci, 12 + stats[0].ci)
+    assert tournament.t_quantile(0.975, 1) == pytest.approx(12.706, abs=1e-3)
+    assert tournament.t_quantile(0.975, 2) == pytest.approx(4.303, abs=1e-3)
+    assert tournament.t_quantile(0.975, 4) == pytest.approx(2.776, abs=1e-3)
+
+
+def test_adaptive_tournament_only_reruns_close_agents():
+    def twin_agent(env, events):
+        return busy_agent(env, events)
+
+    registry = smithg.agents.Registry()
+    registry.register_agent(busy_agent)
+    registry.register_agent(twin_agent)
+    registry.register_agent(idle_agent)
+
+    stats = tournament.run_adaptive_tournament(
+        12, ["item"], registry=registry, steps=5, jobs=1, seed=0, min_runs=3
+    )
+
+    # The twins tie and never separate, the idle agent is clearly last
+    assert [s.runs for s in stats] == [12, 12, 3]
+    assert stats[2].mean == 100.0
+    assert tournament.unresolved(stats) == [0, 1]